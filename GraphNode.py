@@ -1,7 +1,7 @@
 from __future__ import annotations
 from dataclasses import dataclass, field
 from typing import TypedDict
-from heuristics import euclidean_distance, manhattan_distance
+from heuristics import distance
 import math
 
 
@@ -38,21 +38,25 @@ class Graph:
         weight: int,
         landmarks: list[str] | None = None,
         obstacles: list[str] | None = None,
+        middle: str | None = None,
     ) -> None:
-        """add uni-directional weighted edge between graph vertexes"""
+        """
+        add uni-directional weighted edge between graph vertexes. shortcuts
+        pass the label of the contracted node they bypass as middle
+        """
         if landmarks is None:
             landmarks = []
         if obstacles is None:
             obstacles = []
-        u.add_neighbour(name, v, weight, landmarks, obstacles)
+        u.add_neighbour(name, v, weight, landmarks, obstacles, middle)
 
     def remove_node(self, node: Node):
-        outgoing_references = self.get_outgoing_neighbours_with_edges(node)
-        incoming_references = self.get_incoming_neighbours_with_edges(node)
-        for edge in outgoing_references.values():
+        """detach node from all of its in and out edges, then drop it"""
+        for edge in list(node.neighbours):
             node.remove_incident_edge(edge)
-        for src, edge in incoming_references.items():
-            self.nodes[src].remove_incident_edge(edge)
+        for src, edges in list(node.incoming.items()):
+            for edge in list(edges):
+                self.nodes[src].remove_incident_edge(edge)
         self.nodes.pop(node.label)
 
     def remove_edge(self, v: Node, u: Node) -> None:
@@ -66,15 +70,18 @@ class Graph:
         return edges
 
     def get_incoming_neighbours_with_edges(self, node: Node):
-        incoming = {}
-        for n in self.nodes.values():
-            out = self.get_outgoing_neighbours_with_edges(n)
-            if node.label in out.keys():
-                incoming[n.label] = out[node.label]
-        return incoming
+        """map of source label -> cheapest edge for every edge pointing at node"""
+        return {
+            src: min(edges, key=lambda e: e["weight"])
+            for src, edges in node.incoming.items()
+        }
 
     def get_outgoing_neighbours_with_edges(self, node: Node):
-        return {e["endpoint"].label: e for e in node.get_out_edges()}
+        """map of endpoint label -> cheapest edge for every edge leaving node"""
+        return {
+            dest: min(edges, key=lambda e: e["weight"])
+            for dest, edges in node.outgoing.items()
+        }
 
     def reset_nodes(self):
         for node in self.nodes.values():
@@ -107,13 +114,28 @@ class Node:
     neighbours: list = field(default_factory=list)
     status: str = "closed"
     estD: float = math.inf  # for dijkstra's
+    # adjacency indexes kept in sync with neighbours: endpoint label -> edges
+    # leaving this node, and source label -> edges arriving at this node.
+    # excluded from comparison so node equality does not walk the graph
+    outgoing: dict[str, list[NodeEdge]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+    incoming: dict[str, list[NodeEdge]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
 
     def get_pos(self) -> tuple[int, int]:
         """return cartesian coordinates (x, y) of node"""
         return self.x, self.y
 
     def add_neighbour(
-        self, name: str, endpoint: Node, weight: int, landmarks=None, obstacles=None
+        self,
+        name: str,
+        endpoint: Node,
+        weight: int,
+        landmarks=None,
+        obstacles=None,
+        middle: str | None = None,
     ) -> None:
         if not landmarks:
             landmarks = []
@@ -126,20 +148,26 @@ class Node:
             "endpoint": endpoint,
             "landmarks": landmarks,
             "obstacles": obstacles,
+            "middle": middle,
         }
         self.neighbours.append(edge)
+        self.outgoing.setdefault(endpoint.label, []).append(edge)
+        endpoint.incoming.setdefault(self.label, []).append(edge)
 
     def remove_neighbour(self, endpoint: Node) -> None:
-        for edge in [e for e in self.neighbours if e["endpoint"] == endpoint]:
-            self.neighbours.remove(edge)
-        # edge_match = (e for e in self.neighbours if e["endpoint"] == endpoint)
-        # self.neighbours.remove(next(edge_match))
+        for edge in list(self.outgoing.get(endpoint.label, [])):
+            self.remove_incident_edge(edge)
 
     def remove_incident_edge(self, edge: NodeEdge):
-        # matches = [e for e in self.neighbours if e == edge]
-        # if len(matches) > 1:
-        #     print("multiple matches found when removing edge")
-        self.neighbours.remove(edge)
+        """remove an out-edge of this node (matched by identity)"""
+        endpoint = edge["endpoint"]
+        _remove_identical(self.neighbours, edge)
+        _remove_indexed(self.outgoing, endpoint.label, edge)
+        _remove_indexed(endpoint.incoming, self.label, edge)
+
+    def get_edges_to(self, endpoint: Node) -> list[NodeEdge]:
+        """all (possibly parallel) out-edges from this node to endpoint"""
+        return list(self.outgoing.get(endpoint.label, []))
 
     def get_neighbours(self) -> list[Node]:
         """get list of valid neighbours"""
@@ -154,11 +182,11 @@ class Node:
     def calc_h(self, goal: Node, h_type: str = "manhattan") -> float:
         """
         calculates the 'h-metric' or distance measure from node position
-        to the defined goal node in the graph
+        to the defined goal node in the graph. h_type is "manhattan",
+        "euclidean" (both in coordinate units) or "haversine" (km, for
+        latitude/longitude nodes)
         """
-        if h_type == "euclidean":
-            return euclidean_distance((self.x, self.y), (goal.x, goal.y))
-        return manhattan_distance((self.x, self.y), (goal.x, goal.y))
+        return distance((self.x, self.y), (goal.x, goal.y), h_type)
 
     def __repr__(self) -> str:
         return f"<{self.label} {self.x} {self.y}>"
@@ -170,3 +198,21 @@ class NodeEdge(TypedDict):
     endpoint: Node
     landmarks: list[str]
     obstacles: list[str]
+    # shortcuts only store the node they bypass (None for original edges);
+    # their landmarks/obstacles are recovered by unpacking
+    middle: str | None
+
+
+def _remove_identical(edges: list[NodeEdge], edge: NodeEdge) -> None:
+    for i, e in enumerate(edges):
+        if e is edge:
+            del edges[i]
+            return
+    raise ValueError("edge is not incident to node")
+
+
+def _remove_indexed(index: dict[str, list[NodeEdge]], key: str, edge: NodeEdge):
+    edges = index[key]
+    _remove_identical(edges, edge)
+    if not edges:
+        del index[key]
@@ -0,0 +1,165 @@
+# ALT: A*, landmarks and the triangle inequality
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, replace
+from GraphNode import Graph
+from compactGraph import CompactGraph, build_csr, dijkstra, edge_sources
+import math
+import random
+
+
+def reverse_graph(cg: CompactGraph) -> CompactGraph:
+    """cg with every edge turned around, for searches towards a node"""
+    sources = edge_sources(cg)
+    edges = [
+        (cg.targets[e], sources[e], cg.weights[e], e) for e in range(cg.num_edges())
+    ]
+    offsets, targets, weights, edge_ids = build_csr(
+        cg.num_nodes(), edges, cg.weights.typecode
+    )
+    return replace(
+        cg,
+        offsets=offsets,
+        targets=targets,
+        weights=weights,
+        edge_names=array("q", (cg.edge_names[e] for e in edge_ids)),
+        edge_landmarks=array("q", (cg.edge_landmarks[e] for e in edge_ids)),
+        edge_obstacles=array("q", (cg.edge_obstacles[e] for e in edge_ids)),
+        edge_middle=array("q", (cg.edge_middle[e] for e in edge_ids)),
+    )
+
+
+@dataclass
+class ALTIndex:
+    """
+    exact distances from and to k landmark nodes. for any landmark L the
+    triangle inequality gives two lower bounds on d(v, t):
+        d(v, t) >= d(L, t) - d(L, v)    (from_landmark)
+        d(v, t) >= d(v, L) - d(t, L)    (to_landmark)
+    and the largest of them over all landmarks is an admissible, consistent
+    heuristic in the units of the edge weights [Goldberg & Harrelson, 2005].
+    """
+
+    labels: list[str]
+    index: dict[str, int]
+    landmarks: list[int]
+    # from_landmark[i][v] = d(landmarks[i], v)
+    # to_landmark[i][v] = d(v, landmarks[i])
+    from_landmark: list[array]
+    to_landmark: list[array]
+
+    @classmethod
+    def build(
+        cls,
+        G: Graph,
+        k: int = 8,
+        strategy: str = "avoid",
+        seed: int | None = 0,
+    ) -> ALTIndex:
+        """
+        pick k landmarks with the "farthest" or "avoid" strategy and store
+        the 2k distance arrays, one dijkstra's each. G is only read.
+        """
+        cg = CompactGraph.from_graph(G)
+        alt = cls(cg.labels, cg.index, [], [], [])
+        if cg.num_nodes() == 0:
+            return alt
+        rcg = reverse_graph(cg)
+        rnd = random.Random(seed)
+        k = min(k, cg.num_nodes())
+        if strategy == "farthest":
+            select = alt._farthest
+        elif strategy == "avoid":
+            select = alt._avoid
+        else:
+            raise ValueError(f"unknown landmark strategy {strategy!r}")
+
+        while len(alt.landmarks) < k:
+            landmark = select(cg, rnd)
+            if landmark in alt.landmarks:
+                break  # every remaining candidate is already covered
+            alt.add_landmark(cg, rcg, landmark)
+        return alt
+
+    def add_landmark(self, cg: CompactGraph, rcg: CompactGraph, u: int) -> None:
+        self.landmarks.append(u)
+        self.from_landmark.append(dijkstra(cg, u)[0])
+        self.to_landmark.append(dijkstra(rcg, u)[0])
+
+    def node_id(self, label: str) -> int:
+        return self.index[label]
+
+    def bound(self, v: int, t: int) -> float:
+        """lower bound on d(v, t) (0 if no landmark gives a finite one)"""
+        best = 0
+        for d_from, d_to in zip(self.from_landmark, self.to_landmark):
+            lt, lv = d_from[t], d_from[v]
+            if lt != math.inf and lv != math.inf and lt - lv > best:
+                best = lt - lv
+            vl, tl = d_to[v], d_to[t]
+            if vl != math.inf and tl != math.inf and vl - tl > best:
+                best = vl - tl
+        return best
+
+    def _farthest(self, cg: CompactGraph, rnd: random.Random) -> int:
+        """
+        the node farthest (there and back) from all landmarks so far, nodes
+        no landmark reaches first. starts from the node farthest from a
+        random one.
+        """
+        if not self.landmarks:
+            dist = dijkstra(cg, rnd.randrange(cg.num_nodes()))[0]
+            return max(
+                range(cg.num_nodes()),
+                key=lambda v: dist[v] if dist[v] != math.inf else -1,
+            )
+
+        def spread(v: int) -> float:
+            return min(
+                d_from[v] + d_to[v]
+                for d_from, d_to in zip(self.from_landmark, self.to_landmark)
+            )
+
+        return max(range(cg.num_nodes()), key=spread)
+
+    def _avoid(self, cg: CompactGraph, rnd: random.Random) -> int:
+        """
+        avoid strategy [Goldberg & Werneck, 2005]: grow a shortest path tree
+        from a random root r and weigh every node v by how badly the current
+        landmarks bound d(r, v). subtrees that already contain a landmark
+        weigh nothing; walking down from r into the heaviest subtree ends at
+        a leaf, the next landmark.
+        """
+        n = cg.num_nodes()
+        r = rnd.randrange(n)
+        dist, parent_edge = dijkstra(cg, r)
+        sources = edge_sources(cg)
+        children: list[list[int]] = [[] for _ in range(n)]
+        reached = [v for v in range(n) if dist[v] != math.inf]
+        for v in reached:
+            if parent_edge[v] != -1:
+                children[sources[parent_edge[v]]].append(v)
+
+        size = [0.0] * n
+        has_landmark = [False] * n
+        for v in self.landmarks:
+            has_landmark[v] = True
+        for v in sorted(reached, key=lambda v: dist[v], reverse=True):
+            for c in children[v]:
+                has_landmark[v] = has_landmark[v] or has_landmark[c]
+            if has_landmark[v]:
+                size[v] = 0.0
+            else:
+                size[v] = dist[v] - self.bound(r, v)
+                size[v] += sum(size[c] for c in children[v])
+
+        v = r
+        while children[v]:
+            heaviest = max(children[v], key=size.__getitem__)
+            if size[heaviest] == 0:
+                break
+            v = heaviest
+        if v == r and self.landmarks:
+            # everything below r is already covered
+            return self._farthest(cg, rnd)
+        return v
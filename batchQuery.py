@@ -0,0 +1,229 @@
+# batch CH queries answered by a process pool over one shared index
+from __future__ import annotations
+from GraphNode import Graph
+from chQuery import CHIndex, ch_query, ch_shortest_path
+from chStorage import attach_ch_index, load_ch_index, share_ch_index
+from multiprocessing.shared_memory import SharedMemory
+from heuristics import admissible_scale
+from queryContext import QueryContext
+from search import aSTAR
+from typing import Iterable, Iterator
+import itertools
+import math
+import multiprocessing
+
+# (source, target) pairs sent to a worker per task
+CHUNK_SIZE = 256
+
+# name of the index when BatchRouter is given a single one
+DEFAULT_INDEX = "default"
+
+# read-only state of a query worker process, set once by _init_worker from
+# the names of the shared indices, so no task ever carries a hierarchy
+_worker_indices: dict[str, tuple[CHIndex, QueryContext]] = {}
+_worker_memory: list[SharedMemory] = []
+_worker_stall = True
+_worker_graph: Graph | None = None
+_worker_graph_context: QueryContext | None = None
+_worker_heuristic = "haversine"
+_worker_h_scale = 1.0
+
+
+def _init_worker(
+    sources: dict[str, tuple[str, bool]],
+    stall: bool,
+    G: Graph | None,
+    heuristic: str,
+    h_scale: float,
+) -> None:
+    global _worker_stall, _worker_graph, _worker_graph_context
+    global _worker_heuristic, _worker_h_scale
+    for name, (source, shared) in sources.items():
+        if shared:
+            index, memory = attach_ch_index(source)
+            _worker_memory.append(memory)
+        else:
+            index = load_ch_index(source)
+        _worker_indices[name] = (index, index.new_context())
+    _worker_stall = stall
+    if G is not None:
+        _worker_graph = G
+        _worker_graph_context = QueryContext.for_graph(G)
+    _worker_heuristic = heuristic
+    _worker_h_scale = h_scale
+
+
+def _distances_in_worker(task: tuple[str, list[tuple[str, str]]]) -> list[float]:
+    name, pairs = task
+    index, context = _worker_indices[name]
+    known = index.graph.index
+    distances = []
+    for s, t in pairs:
+        if s in known and t in known:
+            d, _ = ch_query(index, known[s], known[t], _worker_stall, context)
+            distances.append(d)
+        else:
+            distances.append(math.inf)
+    return distances
+
+
+def _paths_in_worker(task: tuple[str, list[tuple[str, str]]]) -> list:
+    name, pairs = task
+    index, context = _worker_indices[name]
+    known = index.graph.index
+    return [
+        ch_shortest_path(index, s, t, _worker_stall, context)
+        if s in known and t in known
+        else None
+        for s, t in pairs
+    ]
+
+
+def _astar_in_worker(task: tuple[None, list[tuple[str, str]]]) -> list:
+    _, pairs = task
+    G = _worker_graph
+    return [
+        aSTAR(
+            G,
+            G.nodes[s],
+            G.nodes[t],
+            _worker_heuristic,
+            _worker_graph_context,
+            h_scale=_worker_h_scale,
+        )
+        if s in G.nodes and t in G.nodes
+        else None
+        for s, t in pairs
+    ]
+
+
+def _chunks(pairs: Iterable[tuple[str, str]], size: int):
+    pairs = iter(pairs)
+    while True:
+        chunk = list(itertools.islice(pairs, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class BatchRouter:
+    """
+    answers many (source label, target label) CH queries on a pool of worker
+    processes. each index is published once: a CHIndex is copied into a
+    shared memory block (share_ch_index), and the path of an index file
+    written by write_ch_index is memory-mapped by every worker as is. either
+    way workers receive only a name, attach to the arrays without copying
+    or unpickling them and keep one QueryContext per index.
+
+    index is one index, or several by name (e.g. one customization per
+    profile) to be picked per call. with graph set, astar_paths answers
+    pairs with aSTAR on it as well; graph is inherited by forked workers,
+    and pickled once per worker otherwise.
+
+    pairs are sent in chunks of chunk_size and results come back in input
+    order while later chunks are still being answered. a pair with an
+    unknown label gets the same result as an unreachable one, so one bad
+    pair never aborts the rest of the stream. the pool can be shared by
+    several threads. use as a context manager, or call close(), to stop the
+    pool and free the shared blocks.
+    """
+
+    def __init__(
+        self,
+        index: CHIndex | str | dict[str, CHIndex | str],
+        workers: int | None = None,
+        chunk_size: int = CHUNK_SIZE,
+        stall: bool = True,
+        graph: Graph | None = None,
+        heuristic: str = "haversine",
+    ) -> None:
+        self.chunk_size = chunk_size
+        indices = index if isinstance(index, dict) else {DEFAULT_INDEX: index}
+        self.memory: list[SharedMemory] = []
+        sources = {}
+        try:
+            for name, source in indices.items():
+                if isinstance(source, CHIndex):
+                    memory = share_ch_index(source)
+                    self.memory.append(memory)
+                    sources[name] = (memory.name, True)
+                else:
+                    sources[name] = (source, False)
+            h_scale = 1.0 if graph is None else admissible_scale(graph, heuristic)
+            methods = multiprocessing.get_all_start_methods()
+            mp = multiprocessing.get_context("fork" if "fork" in methods else None)
+            self.pool = mp.Pool(
+                workers,
+                _init_worker,
+                (sources, stall, graph, heuristic, h_scale),
+            )
+        except BaseException:
+            self._free_memory()
+            raise
+        self.names = list(sources)
+        self.has_graph = graph is not None
+
+    def distances(
+        self, pairs: Iterable[tuple[str, str]], name: str = DEFAULT_INDEX
+    ) -> Iterator[float]:
+        """
+        shortest distance of every pair on index name, inf where target is
+        unreachable or either label is not a node of the index
+        """
+        return self._stream(_distances_in_worker, name, pairs)
+
+    def paths(
+        self, pairs: Iterable[tuple[str, str]], name: str = DEFAULT_INDEX
+    ) -> Iterator[dict | None]:
+        """
+        unpacked path dict (as from ch_shortest_path) of every pair on index
+        name, None where target is unreachable or either label is not a node
+        """
+        return self._stream(_paths_in_worker, name, pairs)
+
+    def astar_paths(self, pairs: Iterable[tuple[str, str]]) -> Iterator[dict | None]:
+        """path dict (as from aSTAR) of every pair on graph, or None"""
+        if not self.has_graph:
+            raise ValueError("BatchRouter was built without a graph")
+        return self._stream(_astar_in_worker, None, pairs)
+
+    def _stream(self, func, name, pairs):
+        if func is not _astar_in_worker and name not in self.names:
+            raise KeyError(name)
+        tasks = ((name, chunk) for chunk in _chunks(pairs, self.chunk_size))
+        for results in self.pool.imap(func, tasks):
+            yield from results
+
+    def _free_memory(self) -> None:
+        for memory in self.memory:
+            memory.close()
+            memory.unlink()
+        self.memory = []
+
+    def close(self) -> None:
+        self.pool.terminate()
+        self.pool.join()
+        self._free_memory()
+
+    def __enter__(self) -> BatchRouter:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def batch_query(
+    index: CHIndex | str,
+    pairs: Iterable[tuple[str, str]],
+    paths: bool = False,
+    workers: int | None = None,
+) -> list:
+    """
+    answer every (source, target) pair on a throwaway BatchRouter: distances,
+    or path dicts with paths set. keep a BatchRouter open instead when
+    batches arrive one after another, starting the pool is the costly part.
+    """
+    with BatchRouter(index, workers) as router:
+        if paths:
+            return list(router.paths(pairs))
+        return list(router.distances(pairs))
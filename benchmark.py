@@ -0,0 +1,417 @@
+# reproducible benchmarks of aSTAR, dijkstra's and the CH query
+from __future__ import annotations
+from GraphNode import Graph, Node
+from chQuery import CHIndex, ch_query
+from compactGraph import CompactGraph, compare_queues, dijkstra
+from contractionHierarchy import build_g_prime
+from heuristics import admissible_scale, haversine_distance
+from priorityQueues import HeapQueue
+from queryContext import QueryContext
+from search import aSTAR_helper
+from searchStats import Stats, percentiles
+from dataclasses import asdict
+import argparse
+import json
+import math
+import platform
+import random
+import time
+import tracemalloc
+
+# synthetic graphs are laid out in lat/lon around the hand-made suburb, so
+# the haversine heuristic and admissible_scale apply to them unchanged
+ORIGIN = (-38.15, 145.15)
+SPACING_M = 100.0  # mean distance between neighbouring nodes
+DEGREES_PER_M = 1 / 111_320  # latitude degrees per metre
+
+DEFAULT_SIZES = (1_000, 10_000)
+# contraction is pure python: above this size CH is skipped unless asked for
+CH_MAX_NODES = 10_000
+# full dijkstra's per priority queue backend with --queues
+QUEUE_SOURCES = 10
+
+
+def _length_m(a: Node, b: Node) -> float:
+    return haversine_distance(a.get_pos(), b.get_pos()) * 1000
+
+
+def grid_graph(n: int, seed: int = 0) -> Graph:
+    """
+    square grid of about n nodes SPACING_M apart. every street gets a random
+    detour factor of 1 to 1.5 over its straight length, so the weights (in
+    metres) are not all equal and shortest paths are unique-ish.
+    """
+    rnd = random.Random(seed)
+    side = max(2, math.isqrt(n))
+    step = SPACING_M * DEGREES_PER_M
+    nodes = {
+        f"{i},{j}": Node(f"{i},{j}", ORIGIN[0] + i * step, ORIGIN[1] + j * step)
+        for i in range(side)
+        for j in range(side)
+    }
+    G = Graph(nodes)
+    for i in range(side):
+        for j in range(side):
+            u = nodes[f"{i},{j}"]
+            streets = ((f"{i + 1},{j}", f"row {j}"), (f"{i},{j + 1}", f"col {i}"))
+            for label, name in streets:
+                v = nodes.get(label)
+                if v is not None:
+                    weight = round(_length_m(u, v) * rnd.uniform(1.0, 1.5))
+                    G.add_edge(u, v, name, weight)
+    return G
+
+
+def random_geometric_graph(n: int, seed: int = 0, k: int = 3) -> Graph:
+    """
+    road-like graph: n uniformly placed nodes, each joined to its k nearest
+    neighbours (average degree a little above 2k, like a street network).
+    node density is constant, so the area grows with n. neighbours are
+    looked up in a bucket grid of about k nodes per cell.
+    """
+    rnd = random.Random(seed)
+    width = math.sqrt(n) * SPACING_M * DEGREES_PER_M
+    cell = width * math.sqrt(k / n)
+    nodes = {}
+    buckets: dict[tuple[int, int], list[Node]] = {}
+    for i in range(n):
+        node = Node(
+            str(i), ORIGIN[0] + rnd.random() * width, ORIGIN[1] + rnd.random() * width
+        )
+        nodes[node.label] = node
+        buckets.setdefault((int(node.x / cell), int(node.y / cell)), []).append(node)
+
+    G = Graph(nodes)
+    joined = set()
+    for u in nodes.values():
+        cx, cy = int(u.x / cell), int(u.y / cell)
+        candidates = [
+            v
+            for dx in (-1, 0, 1)
+            for dy in (-1, 0, 1)
+            for v in buckets.get((cx + dx, cy + dy), ())
+            if v is not u
+        ]
+        candidates.sort(key=lambda v: (v.x - u.x) ** 2 + (v.y - u.y) ** 2)
+        for v in candidates[:k]:
+            key = (u.label, v.label) if u.label < v.label else (v.label, u.label)
+            if key in joined:
+                continue
+            joined.add(key)
+            weight = max(1, round(_length_m(u, v) * rnd.uniform(1.0, 1.3)))
+            G.add_edge(u, v, f"road {len(joined)}", weight)
+    return G
+
+
+GENERATORS = {
+    "grid": grid_graph,
+    "rgg": random_geometric_graph,
+}
+
+
+def _summary(latencies_ns: list[int], settled: list[int]) -> dict:
+    return {
+        "latency_us": percentiles([t / 1000 for t in latencies_ns]),
+        "settled": percentiles(settled),
+    }
+
+
+def bench_astar(G: Graph, pairs, heuristic: str) -> tuple[dict, list[float]]:
+    context = QueryContext.for_graph(G)
+    scale = admissible_scale(G, heuristic)
+    latencies, settled, dists = [], [], []
+    for s, t in pairs:
+        queue = HeapQueue()
+        start = time.perf_counter_ns()
+        end_id = aSTAR_helper(
+            G.nodes[s], G.nodes[t], heuristic, context, h_scale=scale, queue=queue
+        )
+        latencies.append(time.perf_counter_ns() - start)
+        settled.append(queue.stats.pops)
+        dists.append(math.inf if end_id is None else context.forward.get(end_id))
+    return _summary(latencies, settled), dists
+
+
+def bench_dijkstra(cg: CompactGraph, pairs) -> tuple[dict, list[float]]:
+    latencies, settled, dists = [], [], []
+    for s, t in pairs:
+        queue = HeapQueue()
+        u, v = cg.index[s], cg.index[t]
+        start = time.perf_counter_ns()
+        dist, _ = dijkstra(cg, u, v, queue)
+        latencies.append(time.perf_counter_ns() - start)
+        settled.append(queue.stats.pops)
+        dists.append(dist[v])
+    return _summary(latencies, settled), dists
+
+
+def bench_ch(index: CHIndex, pairs) -> tuple[dict, list[float]]:
+    """
+    distance queries only (no path unpacking). settled counts both search
+    directions, stalled nodes included.
+    """
+    context = index.new_context()
+    stats = Stats()
+    latencies, settled, dists = [], [], []
+    for s, t in pairs:
+        u, v = index.node_id(s), index.node_id(t)
+        before = stats.counters["settled"]
+        start = time.perf_counter_ns()
+        best, _ = ch_query(index, u, v, context=context, stats=stats)
+        latencies.append(time.perf_counter_ns() - start)
+        settled.append(stats.counters["settled"] - before)
+        dists.append(best)
+    return _summary(latencies, settled), dists
+
+
+def bench_queues(cg: CompactGraph, sources: list[int]) -> dict:
+    """
+    compactGraph.compare_queues: seconds and summed QueueStats of one full
+    dijkstra's per source with every priority queue backend
+    """
+    return {
+        name: {"seconds": seconds, **asdict(stats)}
+        for name, (stats, seconds) in compare_queues(cg, sources).items()
+    }
+
+
+def preprocess_ch(G: Graph, trace_memory: bool) -> tuple[CHIndex, dict]:
+    """
+    build_g_prime and the query index of G. shortcut validation is skipped,
+    the distance check of run_case already covers it.
+    """
+    stats = Stats()
+    if trace_memory:
+        tracemalloc.start()
+    G_prime, order = build_g_prime(G, stats=stats, sample_rate=0)
+    with stats.phase("index"):
+        index = CHIndex.from_overlay(G_prime, order)
+    peak = None
+    if trace_memory:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return index, {
+        "seconds": sum(p.seconds for p in stats.phases),
+        "peak_bytes": peak,
+        "shortcuts": stats.counters["shortcuts_added"],
+        "overlay_edges": index.graph.num_edges(),
+        "phases": {p.name: p.seconds for p in stats.phases},
+        "counters": dict(stats.counters),
+    }
+
+
+def _mismatches(expected: list[float], got: list[float]) -> int:
+    return sum(
+        1
+        for a, b in zip(expected, got)
+        if not (a == b or (math.isfinite(a) and abs(a - b) <= 1e-9 * max(1, a)))
+    )
+
+
+def run_case(
+    kind: str,
+    n: int,
+    queries: int = 1000,
+    seed: int = 0,
+    heuristic: str = "haversine",
+    with_ch: bool = True,
+    trace_memory: bool = True,
+    queues: bool = False,
+) -> dict:
+    """
+    benchmark one generated graph. every random choice (graph and query
+    pairs) derives from seed, so two runs with the same arguments measure
+    the same work. dijkstra's is the reference for the distances of the
+    other two; any difference is counted as a mismatch.
+    with queues the priority queue backends are compared as well, on full
+    dijkstra's from the first QUEUE_SOURCES query sources.
+    """
+    G = GENERATORS[kind](n, seed)
+    cg = CompactGraph.from_graph(G)
+    labels = cg.labels
+    rnd = random.Random(seed + 1)
+    pairs = [
+        (labels[rnd.randrange(len(labels))], labels[rnd.randrange(len(labels))])
+        for _ in range(queries)
+    ]
+
+    result = {
+        "graph": kind,
+        "size": n,
+        "nodes": cg.num_nodes(),
+        "edges": cg.num_edges(),
+        "seed": seed,
+        "queries": queries,
+        "unreachable": 0,
+        "algorithms": {},
+    }
+    summary, reference = bench_dijkstra(cg, pairs)
+    result["unreachable"] = sum(1 for d in reference if d == math.inf)
+    result["algorithms"]["dijkstra"] = summary
+
+    summary, dists = bench_astar(G, pairs, heuristic)
+    summary["heuristic"] = heuristic
+    summary["mismatches"] = _mismatches(reference, dists)
+    result["algorithms"]["astar"] = summary
+
+    if with_ch:
+        index, result["preprocessing"] = preprocess_ch(G, trace_memory)
+        summary, dists = bench_ch(index, pairs)
+        summary["mismatches"] = _mismatches(reference, dists)
+        result["algorithms"]["ch"] = summary
+
+    if queues:
+        sources = [cg.index[s] for s, _ in pairs[:QUEUE_SOURCES]]
+        result["queues"] = bench_queues(cg, sources)
+    return result
+
+
+def run_suite(
+    sizes=DEFAULT_SIZES,
+    kinds=tuple(GENERATORS),
+    queries: int = 1000,
+    seed: int = 0,
+    heuristic: str = "haversine",
+    ch_max_nodes: int | None = CH_MAX_NODES,
+    trace_memory: bool = True,
+    queues: bool = False,
+) -> dict:
+    """
+    run_case for every graph kind and size. units are fixed: seconds for
+    preprocessing, microseconds for query latency, bytes for memory.
+    with trace_memory the preprocessing time includes tracemalloc overhead.
+    """
+    results = []
+    for kind in kinds:
+        for n in sizes:
+            with_ch = ch_max_nodes is None or n <= ch_max_nodes
+            results.append(
+                run_case(
+                    kind, n, queries, seed, heuristic, with_ch, trace_memory, queues
+                )
+            )
+    return {
+        "config": {
+            "sizes": list(sizes),
+            "graphs": list(kinds),
+            "queries": queries,
+            "seed": seed,
+            "heuristic": heuristic,
+            "ch_max_nodes": ch_max_nodes,
+            "trace_memory": trace_memory,
+            "queues": queues,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "implementation": platform.python_implementation(),
+            "machine": platform.machine(),
+        },
+        "results": results,
+    }
+
+
+def compare(old: dict, new: dict) -> list[str]:
+    """
+    lines of new / old ratios of the p50 and p99 latencies and the CH
+    preprocessing time, for every case present in both runs
+    """
+    lines = []
+    before = {(r["graph"], r["size"]): r for r in old["results"]}
+    for r in new["results"]:
+        prev = before.get((r["graph"], r["size"]))
+        if prev is None:
+            continue
+        case = f"{r['graph']:>4} {r['size']:>8}"
+        for name, summary in r["algorithms"].items():
+            if name not in prev["algorithms"]:
+                continue
+            latency = summary["latency_us"]
+            prev_latency = prev["algorithms"][name]["latency_us"]
+            ratios = "  ".join(
+                f"{p} x{latency[p] / prev_latency[p]:.2f}"
+                for p in ("p50", "p99")
+                if prev_latency.get(p)
+            )
+            lines.append(f"{case} {name:>8}  {ratios}")
+        if "preprocessing" in r and "preprocessing" in prev:
+            ratio = r["preprocessing"]["seconds"] / prev["preprocessing"]["seconds"]
+            lines.append(f"{case} {'preproc':>8}  x{ratio:.2f}")
+    return lines
+
+
+def _print_case(r: dict) -> None:
+    print(
+        f"{r['graph']} n={r['nodes']} m={r['edges']} "
+        + f"({r['unreachable']} of {r['queries']} pairs unreachable)"
+    )
+    if "preprocessing" in r:
+        p = r["preprocessing"]
+        peak = ""
+        if p["peak_bytes"] is not None:
+            peak = f", peak {p['peak_bytes'] / 2**20:.1f}MiB"
+        print(
+            f"\tCH preprocessing {p['seconds']:.2f}s, "
+            + f"{p['shortcuts']} shortcuts{peak}"
+        )
+    for name, s in r["algorithms"].items():
+        latency = s["latency_us"]
+        settled = s["settled"]
+        mismatches = s.get("mismatches", 0)
+        print(
+            f"\t{name:>8}: p50 {latency['p50']:9.1f}us  p99 {latency['p99']:9.1f}us  "
+            + f"settled {settled['mean']:9.1f}"
+            + (f"  MISMATCHES {mismatches}" if mismatches else "")
+        )
+    for name, q in r.get("queues", {}).items():
+        print(
+            f"\tqueue {name:>7}: {q['seconds']:.3f}s  inserts {q['inserts']}  "
+            + f"updates {q['updates']}  pops {q['pops']}  "
+            + f"stale {q['stale_pops']}  max size {q['max_size']}"
+        )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="benchmark aSTAR, dijkstra's and CH on synthetic graphs"
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES))
+    parser.add_argument(
+        "--graphs", nargs="+", choices=list(GENERATORS), default=list(GENERATORS)
+    )
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--heuristic", default="haversine")
+    parser.add_argument("--ch-max-nodes", type=int, default=CH_MAX_NODES)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    parser.add_argument("--out", help="write the results as JSON")
+    parser.add_argument("--compare", help="JSON of an earlier run to compare against")
+    parser.add_argument(
+        "--queues", action="store_true", help="also compare the priority queues"
+    )
+    args = parser.parse_args(argv)
+
+    report = run_suite(
+        args.sizes,
+        args.graphs,
+        args.queries,
+        args.seed,
+        args.heuristic,
+        args.ch_max_nodes,
+        not args.no_memory,
+        args.queues,
+    )
+    for r in report["results"]:
+        _print_case(r)
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            old = json.load(f)
+        print("\ncompared to", args.compare)
+        for line in compare(old, report):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
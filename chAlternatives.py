@@ -0,0 +1,146 @@
+# alternative routes over the contraction hierarchy via single via-nodes
+from __future__ import annotations
+from chQuery import CHIndex, ch_query, upward_search
+from compactGraph import edge_path_info
+from queryContext import QueryContext, default_context
+import math
+
+# admissibility parameters of [Abraham et al., 2013]:
+STRETCH = 0.25  # epsilon: at most (1 + STRETCH) times the shortest distance
+SHARING = 0.8  # gamma: at most this share of d(s, t) on routes found so far
+LOCAL_OPTIMALITY = 0.25  # alpha: subpaths up to alpha * d(s, t) are shortest
+
+
+def _search_tree(context: QueryContext, settled: list, forward: bool) -> dict:
+    """node id -> parent edge id of an upward search, copied out of context"""
+    space = context.forward if forward else context.backward
+    return {u: space.edges[u] for u, _ in settled if space.parent_of(u) != -1}
+
+
+def _via_edges(
+    index: CHIndex, forward: dict, backward: dict, via: int
+) -> tuple[list[int], list[int]]:
+    """overlay edges s -> via and via -> t along the two upward search trees"""
+    up = []
+    curr = via
+    while curr in forward:
+        e = forward[curr]
+        up.append(e)
+        curr = index.sources[e]
+    up.reverse()
+    down = []
+    curr = via
+    while curr in backward:
+        e = backward[curr]
+        down.append(e)
+        curr = index.graph.targets[e]
+    return up, down
+
+
+def _local_optimal(
+    index: CHIndex,
+    weights: list[float],
+    nodes: list[int],
+    via: int,
+    window: float,
+    context: QueryContext,
+) -> bool:
+    """
+    T-test: take the points u before and w after position via that are at
+    least window away from it (or the path ends), and check that the path
+    u -> w is a shortest one
+    """
+    lo = via
+    covered = 0
+    while lo > 0 and covered < window:
+        lo -= 1
+        covered += weights[lo]
+    hi = via
+    covered = 0
+    while hi < len(weights) and covered < window:
+        covered += weights[hi]
+        hi += 1
+    length = sum(weights[lo:hi])
+    dist, _ = ch_query(index, nodes[lo], nodes[hi], context=context)
+    return math.isclose(dist, length) or dist >= length
+
+
+def alternative_routes(
+    index: CHIndex,
+    src: str,
+    target: str,
+    k: int = 2,
+    stretch: float = STRETCH,
+    sharing: float = SHARING,
+    local_optimality: float = LOCAL_OPTIMALITY,
+    context: QueryContext | None = None,
+) -> list[dict]:
+    """
+    the shortest route from src to target followed by up to k alternatives,
+    each a path dict (as from ch_shortest_path) of unpacked original edges
+    with its "via" node label and "stretch" (length / shortest length)
+    added. empty if target is unreachable.
+
+    via-node alternatives [Abraham et al., 2013]: one complete upward search
+    from src and one from target; every node v settled by both is a
+    candidate, and s -> v -> t along the two search trees is its route.
+    candidates are tried by increasing length and a route is accepted if it
+        - is at most (1 + stretch) times the shortest distance,
+        - shares at most sharing * d(s, t) with the routes accepted so far,
+        - has no repeated nodes and is locally optimal: its subpath of
+          local_optimality * d(s, t) around v is a shortest path.
+    costs the two upward searches plus one CH query per tested candidate.
+    the search trees are copied out of context, which is then reused for
+    those queries, so no per-call workspace is allocated when one is passed.
+    """
+    if context is None:
+        context = default_context(index, index.new_context)
+    cg = index.graph
+    s = index.node_id(src)
+    t = index.node_id(target)
+
+    settled = upward_search(index, s, True, context)
+    forward = dict(settled)
+    forward_tree = _search_tree(context, settled, True)
+    settled = upward_search(index, t, False, context)
+    backward = dict(settled)
+    backward_tree = _search_tree(context, settled, False)
+    candidates = sorted(
+        (d + backward[v], v) for v, d in forward.items() if v in backward
+    )
+    if not candidates:
+        return []
+    best = candidates[0][0]
+    if best == 0:
+        return [dict(edge_path_info(cg, s, []), via=src, stretch=1.0)]
+
+    routes = []
+    used_edges: set[int] = set()
+    used_nodes: set[int] = set()
+    for length, v in candidates:
+        if len(routes) > k or length > (1 + stretch) * best:
+            break
+        # via nodes on an accepted route mostly lead back onto it
+        if v in used_nodes:
+            continue
+        up, down = _via_edges(index, forward_tree, backward_tree, v)
+        up = index.unpack(up)
+        edges = up + index.unpack(down)
+        nodes = [s] + [cg.targets[e] for e in edges]
+        if routes:
+            if len(set(nodes)) != len(nodes):
+                continue
+            shared = sum(cg.weights[e] for e in edges if e in used_edges)
+            if shared > sharing * best:
+                continue
+            weights = [cg.weights[e] for e in edges]
+            window = local_optimality * best
+            if not _local_optimal(index, weights, nodes, len(up), window, context):
+                continue
+        route = edge_path_info(cg, s, edges)
+        route["via"] = cg.labels[v]
+        route["stretch"] = length / best
+        routes.append(route)
+        used_edges.update(edges)
+        used_nodes.update(nodes)
+    return routes
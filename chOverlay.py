@@ -0,0 +1,69 @@
+# the overlay graph G' as a shortcut layer over an unmodified base graph
+from __future__ import annotations
+from dataclasses import dataclass, field
+from GraphNode import Graph, Node, NodeEdge
+
+
+@dataclass
+class Overlay:
+    """
+    G' (the original edges plus every shortcut) without copying G: base is
+    the input graph, which is only read, and shortcuts holds the shortcut
+    edges by source label. shortcut endpoints are nodes of base, so ids and
+    labels are shared with it.
+
+    CHIndex.from_overlay reads an Overlay directly. code that walks or edits
+    G' as a Graph (update_edge_weights, query_graph) needs to_graph().
+    """
+
+    base: Graph
+    shortcuts: dict[str, list[NodeEdge]] = field(default_factory=dict)
+
+    @property
+    def nodes(self) -> dict[str, Node]:
+        return self.base.nodes
+
+    def add_dir_edge(
+        self,
+        u: Node,
+        v: Node,
+        name: str,
+        weight: int,
+        landmarks: list[str] | None = None,
+        obstacles: list[str] | None = None,
+        middle: str | None = None,
+    ) -> None:
+        """same as Graph.add_dir_edge, but into the shortcut layer"""
+        edge: NodeEdge = {
+            "name": name,
+            "weight": weight,
+            "endpoint": v,
+            "landmarks": landmarks or [],
+            "obstacles": obstacles or [],
+            "middle": middle,
+        }
+        self.shortcuts.setdefault(u.label, []).append(edge)
+
+    def num_shortcuts(self) -> int:
+        return sum(len(edges) for edges in self.shortcuts.values())
+
+    def out_edges(self, node: Node) -> list[NodeEdge]:
+        """edges of node in G': its own edges, then its shortcuts"""
+        return node.neighbours + self.shortcuts.get(node.label, [])
+
+    def to_graph(self) -> Graph:
+        """G' as a standalone Graph: new nodes, edge metadata lists copied"""
+        nodes = {label: Node(label, n.x, n.y) for label, n in self.base.nodes.items()}
+        G_prime = Graph(nodes)
+        for label, node in self.base.nodes.items():
+            for edge in self.out_edges(node):
+                G_prime.add_dir_edge(
+                    nodes[label],
+                    nodes[edge["endpoint"].label],
+                    edge["name"],
+                    edge["weight"],
+                    list(edge["landmarks"]),
+                    list(edge["obstacles"]),
+                    edge.get("middle"),
+                )
+        return G_prime
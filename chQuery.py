@@ -0,0 +1,400 @@
+# bidirectional contraction hierarchies query engine
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from GraphNode import Graph
+from chOverlay import Overlay
+from compactGraph import CompactGraph, build_csr, edge_sources, edge_path_info
+from queryContext import QueryContext, SearchSpace, default_context
+from searchStats import Stats
+import functools
+import heapq
+import math
+import time
+
+
+@dataclass
+class CHIndex:
+    """
+    query-side view of an overlay graph G' (original edges plus shortcuts).
+
+    rank[u] is the position of u in the contraction order. edges of G' are
+    split once at build time into:
+        - up:   u -> v with rank[v] > rank[u], stored at u (forward search)
+        - down: u -> v with rank[u] > rank[v], stored reversed at v so the
+                backward search from t can also walk upwards in rank
+    both adjacency lists keep the id of the underlying edge in `graph`, which
+    is used to rebuild the path once the searches meet.
+
+    a shortcut edge e only records the two edges of `graph` it replaces,
+    shortcut_first[e] and shortcut_second[e] (-1 for original edges).
+    """
+
+    graph: CompactGraph
+    rank: array
+    up_offsets: array
+    up_targets: array
+    up_weights: array
+    up_edges: array
+    down_offsets: array
+    down_targets: array
+    down_weights: array
+    down_edges: array
+    sources: array
+    shortcut_first: array
+    shortcut_second: array
+    unpacker: ShortcutUnpacker | None = field(
+        default=None, init=False, repr=False, compare=False
+    )
+
+    @classmethod
+    def from_overlay(
+        cls, G_prime: Graph | Overlay, contraction_order: list[str]
+    ) -> CHIndex:
+        if isinstance(G_prime, Overlay):
+            cg = CompactGraph.from_graph(G_prime.base, G_prime.shortcuts)
+        else:
+            cg = CompactGraph.from_graph(G_prime)
+        n = cg.num_nodes()
+        rank = array("q", [0]) * n
+        for r, label in enumerate(contraction_order):
+            rank[cg.index[label]] = r
+
+        sources = edge_sources(cg)
+        up = []
+        down = []
+        for e in range(cg.num_edges()):
+            u, v = sources[e], cg.targets[e]
+            if rank[v] > rank[u]:
+                up.append((u, v, cg.weights[e], e))
+            elif rank[u] > rank[v]:
+                down.append((v, u, cg.weights[e], e))
+
+        typecode = cg.weights.typecode
+        up_csr = build_csr(n, up, typecode)
+        down_csr = build_csr(n, down, typecode)
+        first, second = shortcut_children(cg, sources)
+        return cls(cg, rank, *up_csr, *down_csr, sources, first, second)
+
+    def node_id(self, label: str) -> int:
+        return self.graph.index[label]
+
+    def new_context(self) -> QueryContext:
+        """workspace for one querying thread, sharing this index's id mapping"""
+        return QueryContext(self.graph.labels, self.graph.index)
+
+    def unpack(self, edges: list[int]) -> list[int]:
+        """expand overlay edge ids into the original edges they stand for"""
+        if self.unpacker is None:
+            self.unpacker = ShortcutUnpacker(self)
+        return self.unpacker.unpack(edges)
+
+
+def shortcut_children(cg: CompactGraph, sources: array) -> tuple[array, array]:
+    """
+    for every shortcut u -> w bypassing m, find the edges u -> m and m -> w
+    it replaced, preferring the pair whose weights add up to the shortcut's
+    (G' keeps shortcuts that were superseded later in the contraction).
+    """
+    first = array("q", [-1]) * cg.num_edges()
+    second = array("q", [-1]) * cg.num_edges()
+    for e in range(cg.num_edges()):
+        m = cg.edge_middle[e]
+        if m == -1:
+            continue
+        u, w = sources[e], cg.targets[e]
+        candidates = [
+            (cg.weights[e1] + cg.weights[e2], e1, e2)
+            for e1 in cg.out_edges(u)
+            if cg.targets[e1] == m
+            for e2 in cg.out_edges(m)
+            if cg.targets[e2] == w
+        ]
+        exact = [c for c in candidates if c[0] == cg.weights[e]]
+        _, first[e], second[e] = min(exact or candidates)
+    return first, second
+
+
+class ShortcutUnpacker:
+    """
+    expands shortcut edges of a CHIndex into original edge ids on demand.
+    the expansion of each overlay edge is kept in an LRU cache of cache_size
+    entries (0 disables caching), so popular shortcuts are only unpacked once.
+    """
+
+    def __init__(self, index: CHIndex, cache_size: int = 4096) -> None:
+        self.index = index
+        if cache_size:
+            self.expand = functools.lru_cache(maxsize=cache_size)(self._expand)
+        else:
+            self.expand = self._expand
+
+    def _expand(self, e: int) -> tuple[int, ...]:
+        first = self.index.shortcut_first
+        second = self.index.shortcut_second
+        unpacked = []
+        stack = [e]
+        while stack:
+            e = stack.pop()
+            if first[e] == -1:
+                unpacked.append(e)
+            else:
+                stack.append(second[e])
+                stack.append(first[e])
+        return tuple(unpacked)
+
+    def unpack(self, edges: list[int]) -> list[int]:
+        unpacked = []
+        for e in edges:
+            unpacked.extend(self.expand(e))
+        return unpacked
+
+
+def _search_step(
+    frontier: list,
+    space: SearchSpace,
+    other: SearchSpace,
+    offsets: array,
+    targets: array,
+    weights: array,
+    edges: array,
+    stall_offsets: array,
+    stall_targets: array,
+    stall_weights: array,
+    stall: bool,
+):
+    """
+    settle one node of a single upward search. returns the settled node id
+    (or -1 if only a stale entry was popped) and the meeting cost through it.
+    """
+    d, u = heapq.heappop(frontier)
+    if d > space.dist[u]:
+        return -1, math.inf
+
+    meet_cost = d + other.get(u)
+
+    # stall-on-demand: if a higher-ranked node already reached by this search
+    # has a cheaper edge into u, then d is not the true distance of u and no
+    # shortest path can continue upwards from here
+    if stall:
+        for i in range(stall_offsets[u], stall_offsets[u + 1]):
+            if space.get(stall_targets[i]) + stall_weights[i] < d:
+                return u, meet_cost
+
+    for i in range(offsets[u], offsets[u + 1]):
+        v = targets[i]
+        nd = d + weights[i]
+        if nd < space.get(v):
+            space.set(v, nd, u, edges[i])
+            heapq.heappush(frontier, (nd, v))
+    return u, meet_cost
+
+
+def ch_query(
+    index: CHIndex,
+    s: int,
+    t: int,
+    stall: bool = True,
+    context: QueryContext | None = None,
+    stats: Stats | None = None,
+):
+    """
+    bidirectional upward dijkstra's on G'_U (from s) and reversed G'_D (from t).
+    the two searches alternate and stop as soon as neither frontier minimum
+    can improve on the best meeting distance found so far.
+    labels are kept in context.forward / context.backward, so the index is
+    read-only and can be shared between concurrent queries.
+    returns (distance, meeting node id); the meeting node is -1 if t is
+    unreachable from s. settled (including stalled) nodes and heap
+    operations of both directions are added to stats.
+    [Geisberger et al., 2012]
+    """
+    if context is None:
+        context = default_context(index, index.new_context)
+    forward_space = context.forward
+    backward_space = context.backward
+    forward_space.reset()
+    backward_space.reset()
+
+    forward_space.set(s, 0)
+    backward_space.set(t, 0)
+    frontier_f = [(0, s)]
+    frontier_b = [(0, t)]
+    best = 0 if s == t else math.inf
+    meet = s if s == t else -1
+
+    forward = True
+    pops = 0
+    settled = 0
+    while frontier_f or frontier_b:
+        top_f = frontier_f[0][0] if frontier_f else math.inf
+        top_b = frontier_b[0][0] if frontier_b else math.inf
+        if top_f >= best and top_b >= best:
+            break
+        # alternate, unless one side can no longer contribute
+        if forward and top_f >= best:
+            forward = False
+        elif not forward and top_b >= best:
+            forward = True
+
+        if forward:
+            u, cost = _search_step(
+                frontier_f,
+                forward_space,
+                backward_space,
+                index.up_offsets,
+                index.up_targets,
+                index.up_weights,
+                index.up_edges,
+                index.down_offsets,
+                index.down_targets,
+                index.down_weights,
+                stall,
+            )
+        else:
+            u, cost = _search_step(
+                frontier_b,
+                backward_space,
+                forward_space,
+                index.down_offsets,
+                index.down_targets,
+                index.down_weights,
+                index.down_edges,
+                index.up_offsets,
+                index.up_targets,
+                index.up_weights,
+                stall,
+            )
+        pops += 1
+        if u != -1:
+            settled += 1
+        if cost < best:
+            best = cost
+            meet = u
+        forward = not forward
+
+    if stats is not None:
+        # every entry pushed was either popped or is still in a frontier
+        pushes = pops + len(frontier_f) + len(frontier_b)
+        stats.add("settled", settled)
+        stats.add("relaxed", pushes - 2)
+        stats.add("pushes", pushes)
+        stats.add("pops", pops)
+    return best, meet
+
+
+def upward_search(
+    index: CHIndex,
+    source: int,
+    forward: bool = True,
+    context: QueryContext | None = None,
+    stall: bool = True,
+) -> list[tuple[int, float]]:
+    """
+    complete (unbounded) upward dijkstra's from source: over G'_U when
+    forward, otherwise over reversed G'_D into context.backward. returns the
+    (node id, distance) pairs settled and not stalled, in settle order; the
+    parents of those nodes are left in the context.
+    """
+    if context is None:
+        context = default_context(index, index.new_context)
+    if forward:
+        space = context.forward
+        offsets, targets, weights, edges = (
+            index.up_offsets,
+            index.up_targets,
+            index.up_weights,
+            index.up_edges,
+        )
+        stall_offsets, stall_targets, stall_weights = (
+            index.down_offsets,
+            index.down_targets,
+            index.down_weights,
+        )
+    else:
+        space = context.backward
+        offsets, targets, weights, edges = (
+            index.down_offsets,
+            index.down_targets,
+            index.down_weights,
+            index.down_edges,
+        )
+        stall_offsets, stall_targets, stall_weights = (
+            index.up_offsets,
+            index.up_targets,
+            index.up_weights,
+        )
+
+    space.reset()
+    space.set(source, 0)
+    frontier = [(0, source)]
+    settled = []
+    while frontier:
+        d, u = heapq.heappop(frontier)
+        if d > space.dist[u]:
+            continue
+        if stall and any(
+            space.get(stall_targets[i]) + stall_weights[i] < d
+            for i in range(stall_offsets[u], stall_offsets[u + 1])
+        ):
+            continue
+        settled.append((u, d))
+        for i in range(offsets[u], offsets[u + 1]):
+            v = targets[i]
+            nd = d + weights[i]
+            if nd < space.get(v):
+                space.set(v, nd, u, edges[i])
+                heapq.heappush(frontier, (nd, v))
+    return settled
+
+
+def get_ch_path_edges(index: CHIndex, context: QueryContext, meet: int) -> list[int]:
+    """overlay edge ids of the s -> meet -> t path found by ch_query"""
+    edges = []
+    curr = meet
+    forward_space = context.forward
+    while forward_space.parent_of(curr) != -1:
+        edges.append(forward_space.edges[curr])
+        curr = forward_space.parent[curr]
+    edges.reverse()
+
+    curr = meet
+    backward_space = context.backward
+    while backward_space.parent_of(curr) != -1:
+        edges.append(backward_space.edges[curr])
+        curr = backward_space.parent[curr]
+    return edges
+
+
+def ch_shortest_path(
+    index: CHIndex,
+    src: str,
+    target: str,
+    stall: bool = True,
+    context: QueryContext | None = None,
+    unpack: bool = True,
+):
+    """
+    query the hierarchy by node label. returns the same path dict as
+    search.aSTAR, or None if target cannot be reached from src. shortcuts are
+    unpacked so the path (and its landmarks/obstacles) is made of original
+    edges, pass unpack=False to get the overlay edges instead.
+    """
+    if context is None:
+        context = default_context(index, index.new_context)
+    s = index.node_id(src)
+    t = index.node_id(target)
+
+    start_time = time.perf_counter_ns()
+    best, meet = ch_query(index, s, t, stall, context)
+    end_time = time.perf_counter_ns()
+
+    if meet == -1:
+        return None
+
+    edges = get_ch_path_edges(index, context, meet)
+    if unpack:
+        edges = index.unpack(edges)
+    path_info = edge_path_info(index.graph, s, edges)
+    path_info["time"] = (end_time - start_time) / 1_000_000  # ms
+    return path_info
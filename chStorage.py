@@ -0,0 +1,178 @@
+# persistent, memory-mapped contraction hierarchy index files
+from __future__ import annotations
+from array import array
+from chQuery import CHIndex
+from compactGraph import CompactGraph, StringTable
+from multiprocessing.shared_memory import SharedMemory
+import json
+import mmap
+import struct
+import sys
+
+# file layout (all integers in the byte order recorded in the header):
+#
+#     header      MAGIC, format version, byte order flag, number of sections
+#     directory   one entry per section: name, array typecode, offset, count
+#     sections    raw array bytes, each starting on an 8 byte boundary
+#
+# numeric sections are mapped straight into memoryviews on load, so a query
+# worker can answer queries without unpickling or copying the hierarchy. only
+# the string tables (node labels, street names, landmark/obstacle tuples) are
+# stored as a json blob and decoded. share_ch_index puts the same layout in
+# a multiprocessing.shared_memory block instead of a file.
+
+MAGIC = b"CHINDEX\0"
+FORMAT_VERSION = 2
+HEADER = struct.Struct("<8sIII4x")
+DIRECTORY_ENTRY = struct.Struct("<16s8sQQ")
+ALIGNMENT = 8
+
+# sections holding CHIndex / CompactGraph arrays, in file order
+GRAPH_SECTIONS = (
+    "xs",
+    "ys",
+    "offsets",
+    "targets",
+    "weights",
+    "edge_names",
+    "edge_landmarks",
+    "edge_obstacles",
+    "edge_middle",
+)
+INDEX_SECTIONS = (
+    "rank",
+    "up_offsets",
+    "up_targets",
+    "up_weights",
+    "up_edges",
+    "down_offsets",
+    "down_targets",
+    "down_weights",
+    "down_edges",
+    "sources",
+    "shortcut_first",
+    "shortcut_second",
+)
+STRINGS_SECTION = "strings"
+
+
+def _byteorder_flag() -> int:
+    return 1 if sys.byteorder == "little" else 2
+
+
+def _layout(index: CHIndex) -> tuple[list, list, int]:
+    """sections of index, their directory entries and the total size in bytes"""
+    cg = index.graph
+    sections = [(name, getattr(cg, name)) for name in GRAPH_SECTIONS]
+    sections += [(name, getattr(index, name)) for name in INDEX_SECTIONS]
+    strings = {
+        "labels": cg.labels,
+        "names": cg.names.values,
+        "tags": [list(tag) for tag in cg.tags.values],
+    }
+    blob = array("B", json.dumps(strings).encode("utf-8"))
+    sections.append((STRINGS_SECTION, blob))
+
+    offset = HEADER.size + DIRECTORY_ENTRY.size * len(sections)
+    directory = []
+    for name, data in sections:
+        offset += -offset % ALIGNMENT
+        typecode = data.typecode if isinstance(data, array) else data.format
+        directory.append((name, typecode, offset, len(data)))
+        offset += len(data) * data.itemsize
+    return sections, directory, offset
+
+
+def _header(directory: list) -> bytes:
+    parts = [HEADER.pack(MAGIC, FORMAT_VERSION, _byteorder_flag(), len(directory))]
+    for name, typecode, start, count in directory:
+        parts.append(
+            DIRECTORY_ENTRY.pack(
+                name.encode("ascii"), typecode.encode("ascii"), start, count
+            )
+        )
+    return b"".join(parts)
+
+
+def write_ch_index(index: CHIndex, path: str) -> int:
+    """
+    serialise index (as built by CHIndex.from_overlay after build_g_prime)
+    to path. returns the number of bytes written.
+    """
+    sections, directory, _ = _layout(index)
+    with open(path, "wb") as f:
+        f.write(_header(directory))
+        for (_, data), (_, _, start, _) in zip(sections, directory):
+            f.write(b"\0" * (start - f.tell()))
+            f.write(memoryview(data).cast("B"))
+        return f.tell()
+
+
+def share_ch_index(index: CHIndex) -> SharedMemory:
+    """
+    copy index, in the write_ch_index layout, into a new shared memory block
+    that other processes can open with attach_ch_index. the caller owns the
+    block and has to close() and unlink() it once every reader is done.
+    """
+    sections, directory, size = _layout(index)
+    shm = SharedMemory(create=True, size=size)
+    header = _header(directory)
+    shm.buf[: len(header)] = header
+    for (_, data), (_, _, start, _) in zip(sections, directory):
+        raw = memoryview(data).cast("B")
+        shm.buf[start : start + len(raw)] = raw
+    return shm
+
+
+def load_ch_index(path: str) -> CHIndex:
+    """
+    memory-map an index written by write_ch_index. the arrays of the
+    returned CHIndex (and its CompactGraph) are read-only memoryviews over
+    the mapped file, which stays open for as long as any of them is alive.
+    """
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return _read_index(memoryview(mapped), path)
+
+
+def attach_ch_index(name: str) -> tuple[CHIndex, SharedMemory]:
+    """
+    open the shared memory block name made by share_ch_index. the arrays of
+    the CHIndex are memoryviews over the block, which is not copied; keep
+    the returned SharedMemory referenced for as long as the index is used.
+    """
+    shm = SharedMemory(name)
+    return _read_index(shm.buf, name), shm
+
+
+def _read_index(buffer: memoryview, source: str) -> CHIndex:
+    magic, version, byteorder, num_sections = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{source} is not a contraction hierarchy index")
+    if version != FORMAT_VERSION:
+        raise ValueError(
+            f"{source} has index format version {version}, expected {FORMAT_VERSION}"
+        )
+    if byteorder != _byteorder_flag():
+        raise ValueError(f"{source} was written on a machine of different byte order")
+
+    sections = {}
+    for i in range(num_sections):
+        raw_name, raw_typecode, start, count = DIRECTORY_ENTRY.unpack_from(
+            buffer, HEADER.size + i * DIRECTORY_ENTRY.size
+        )
+        name = raw_name.rstrip(b"\0").decode("ascii")
+        typecode = raw_typecode.rstrip(b"\0").decode("ascii")
+        itemsize = struct.calcsize(typecode)
+        sections[name] = buffer[start : start + count * itemsize].cast(typecode)
+
+    strings = json.loads(bytes(sections.pop(STRINGS_SECTION)).decode("utf-8"))
+    labels = strings["labels"]
+    cg = CompactGraph(
+        labels,
+        {label: i for i, label in enumerate(labels)},
+        *(sections[name] for name in GRAPH_SECTIONS),
+        StringTable(strings["names"]),
+        StringTable([tuple(tag) for tag in strings["tags"]]),
+    )
+    return CHIndex(cg, *(sections[name] for name in INDEX_SECTIONS))
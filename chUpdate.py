@@ -0,0 +1,312 @@
+# incremental edge weight updates of a contracted overlay graph G'
+from __future__ import annotations
+from dataclasses import dataclass
+from GraphNode import Graph, Node, NodeEdge
+from chOverlay import Overlay
+from contractionHierarchy import ContractionGraph, WitnessLimits, witness_search
+import heapq
+import math
+
+
+@dataclass
+class UpdateReport:
+    """what update_edge_weights had to do for one batch of changes"""
+
+    changed_edges: int = 0
+    recontracted: int = 0
+    shortcuts_added: int = 0
+    shortcuts_reweighted: int = 0
+    shortcuts_removed: int = 0
+
+    @property
+    def shortcuts_touched(self) -> int:
+        return self.shortcuts_added + self.shortcuts_reweighted + self.shortcuts_removed
+
+
+class _ContractedBefore:
+    """
+    `excluded` set for witness searches when re-contracting a node: every node
+    of rank <= floor was already gone from the graph at that point
+    """
+
+    def __init__(self, rank: list[int], floor: int) -> None:
+        self.rank = rank
+        self.floor = floor
+
+    def __contains__(self, v: int) -> bool:
+        return self.rank[v] <= self.floor
+
+
+class _RankQueue:
+    """node ids waiting to be processed, popped by increasing rank, once each"""
+
+    def __init__(self, rank: list[int]) -> None:
+        self.rank = rank
+        self.pending: set[int] = set()
+        self.heap: list[tuple[int, int]] = []
+
+    def push(self, v: int) -> None:
+        if v not in self.pending:
+            self.pending.add(v)
+            heapq.heappush(self.heap, (self.rank[v], v))
+
+    def pop(self) -> int:
+        _, v = heapq.heappop(self.heap)
+        self.pending.discard(v)
+        return v
+
+    def __bool__(self) -> bool:
+        return bool(self.heap)
+
+
+class _Updater:
+    def __init__(
+        self,
+        G_prime: Graph,
+        order: list[str],
+        limits: WitnessLimits | None,
+    ) -> None:
+        self.G = G_prime
+        self.limits = limits
+        # witness searches run on the lightest edge weights of G' by node id
+        self.H = ContractionGraph.from_graph(G_prime)
+        rank = {label: r for r, label in enumerate(order)}
+        self.rank = [rank[label] for label in self.H.labels]
+        self.by_rank = [self.H.index[label] for label in order]
+        self.context = self.H.new_context()
+        self.report = UpdateReport()
+        # nodes whose shortcuts are re-weighed, then nodes whose contraction
+        # is repeated with witness searches, each in rank order
+        self.reweighs = _RankQueue(self.rank)
+        self.rechecks = _RankQueue(self.rank)
+        self.rechecking = False
+        self.increased: list[tuple[int, int, float]] = []
+        # heaviest edge into and out of every node from and to higher-ranked
+        # nodes: the witness searches of its contraction stay within the sum
+        self.in_up = [-math.inf] * len(self.rank)
+        self.out_up = [-math.inf] * len(self.rank)
+        for v in range(len(self.rank)):
+            self.update_bounds(v)
+
+    def upward(self, v: int) -> tuple[dict[int, float], dict[int, float]]:
+        """lightest edges into and out of v from and to higher-ranked nodes"""
+        H, rank, r = self.H, self.rank, self.rank[v]
+        U = {k: weight for k, weight in H.inc[v].items() if rank[k] > r}
+        W = {k: weight for k, weight in H.out[v].items() if rank[k] > r}
+        return U, W
+
+    def update_bounds(self, v: int) -> None:
+        U, W = self.upward(v)
+        self.in_up[v] = max(U.values(), default=-math.inf)
+        self.out_up[v] = max(W.values(), default=-math.inf)
+
+    def sync(self, u: int, w: int) -> tuple[float, float]:
+        """
+        copy the lightest u -> w weight of G' into H after an edit, returning
+        the (old, new) weight
+        """
+        H = self.H
+        edges = self.G.nodes[H.labels[u]].outgoing[H.labels[w]]
+        old = H.out[u].get(w, math.inf)
+        new = min(e["weight"] for e in edges)
+        H.out[u][w] = H.inc[w][u] = new
+        return old, new
+
+    def edge_changed(self, u: int, w: int) -> None:
+        """
+        an edge u -> w was edited. if its lightest weight changed, the
+        lower-ranked endpoint, whose contraction used the edge directly,
+        re-weighs its shortcuts. a lighter edge can make a shortcut through
+        it necessary, so the endpoint is also rechecked; a heavier one can
+        break the witness paths of nodes contracted before both endpoints,
+        which mark_witnesses finds once every shortcut weight is up to date.
+        """
+        old, new = self.sync(u, w)
+        if old == new:
+            return
+        low = u if self.rank[u] < self.rank[w] else w
+        self.update_bounds(low)
+        if self.rechecking:
+            self.rechecks.push(low)
+        else:
+            self.reweighs.push(low)
+            if new < old:
+                self.rechecks.push(low)
+        if new > old:
+            self.increased.append((u, w, old))
+
+    def mark_witnesses(self) -> None:
+        """
+        recheck every node y whose witness searches may have run over one of
+        the edges that got more expensive. y was contracted before both ends
+        of the edge, and its searches never go further than in_up[y] +
+        out_up[y], so the heaviest such bound over the nodes ranked below the
+        edge limits the search for y.
+        """
+        if not self.increased:
+            return
+        bound = [-math.inf]
+        for v in self.by_rank:
+            bound.append(max(bound[-1], self.in_up[v] + self.out_up[v]))
+        for a, b, old in self.increased:
+            floor = min(self.rank[a], self.rank[b])
+            self.mark_witnesses_through(a, floor, old, bound[floor] - old)
+        self.increased.clear()
+
+    def mark_witnesses_through(
+        self, a: int, floor: int, old: float, radius: float
+    ) -> None:
+        """
+        mark the nodes y ranked below floor whose witness searches may have
+        used a -> b. a search from an in-neighbour u of y only reaches a -> b
+        if d(u, a) + old stays under its threshold w(u, y) + out_up[y], and
+        d(u, a) is bounded from below by a backward dijkstra's from a that
+        stops at radius. this never misses a node (but may mark a few that
+        did not need it).
+        """
+        H, rank = self.H, self.rank
+        dist = {a: 0.0}
+        frontier = [(0.0, a)]
+        while frontier:
+            d, x = heapq.heappop(frontier)
+            if d > dist[x]:
+                continue
+            below = min(floor, rank[x])
+            for y, x_y in H.out[x].items():
+                if rank[y] < below and d + old <= x_y + self.out_up[y]:
+                    self.rechecks.push(y)
+            for src, weight in H.inc[x].items():
+                nd = d + weight
+                if nd <= radius and nd < dist.get(src, math.inf):
+                    dist[src] = nd
+                    heapq.heappush(frontier, (nd, src))
+
+    def run(self) -> None:
+        """
+        re-weigh every shortcut bottom-up first, so the witness searches that
+        follow only see current weights. rechecks then only add shortcuts,
+        which can make edges lighter but never heavier, so each of them only
+        schedules nodes ranked above itself and one pass in rank order does.
+        """
+        while self.reweighs or self.rechecks:
+            self.rechecking = False
+            while self.reweighs:
+                self.recontract(self.reweighs.pop(), search=False)
+            self.mark_witnesses()
+            self.rechecking = True
+            while self.rechecks:
+                self.recontract(self.rechecks.pop(), search=True)
+
+    def recontract(self, v: int, search: bool) -> None:
+        """
+        repeat the contraction of v at its original rank: the graph it saw
+        then is G' restricted to higher-ranked nodes. shortcuts through v
+        that already exist are re-weighed; with search set, witness searches
+        decide which of the missing ones are added.
+        """
+        G, H = self.G, self.H
+        label = H.labels[v]
+        U, W = self.upward(v)
+        excluded = _ContractedBefore(self.rank, self.rank[v])
+        targets = set(W)
+        if search:
+            self.report.recontracted += 1
+
+        for k, u_v in U.items():
+            u = G.nodes[H.labels[k]]
+            cost_incl_v = {k2: u_v + v_w for k2, v_w in W.items() if k2 != k}
+            missing = []
+            for k2, short_cost in cost_incl_v.items():
+                existing = _shortcut_via(u, H.labels[k2], label)
+                if existing is None:
+                    missing.append(k2)
+                elif existing["weight"] != short_cost:
+                    existing["weight"] = short_cost
+                    self.report.shortcuts_reweighted += 1
+                    self.drop_superseded(k, k2)
+                    self.edge_changed(k, k2)
+            if not search or not missing:
+                continue
+
+            threshold = max(cost_incl_v.values())
+            witness_search(
+                H, k, targets, excluded, threshold, self.context, self.limits
+            )
+            for k2 in missing:
+                short_cost = cost_incl_v[k2]
+                if self.context.forward.get(k2) > short_cost:
+                    G.add_dir_edge(
+                        u, G.nodes[H.labels[k2]], "shortcut", short_cost, middle=label
+                    )
+                    self.report.shortcuts_added += 1
+                    self.drop_superseded(k, k2)
+                    self.edge_changed(k, k2)
+
+    def drop_superseded(self, u: int, w: int) -> None:
+        """
+        remove the shortcuts u -> w heavier than another u -> w edge: queries,
+        witness searches and unpacking only ever use the lightest one
+        """
+        node = self.G.nodes[self.H.labels[u]]
+        edges = node.outgoing[self.H.labels[w]]
+        lightest = min(e["weight"] for e in edges)
+        superseded = [
+            e for e in edges if e["middle"] is not None and e["weight"] > lightest
+        ]
+        for edge in superseded:
+            node.remove_incident_edge(edge)
+            self.report.shortcuts_removed += 1
+
+
+def _shortcut_via(u: Node, dest: str, middle: str) -> NodeEdge | None:
+    for edge in u.outgoing.get(dest, ()):
+        if edge["middle"] == middle:
+            return edge
+    return None
+
+
+def update_edge_weights(
+    G_prime: Graph,
+    order: list[str],
+    changes: list[tuple[str, str, float]],
+    limits: WitnessLimits | None = None,
+) -> UpdateReport:
+    """
+    apply a batch of (u, v, new_weight) changes to the original u -> v edges
+    of G' in place. G' is a Graph, so the Overlay returned by build_g_prime
+    (together with order) needs to_graph() first. undirected roads need a
+    change for both directions.
+
+    instead of rebuilding G', only the affected nodes are contracted again,
+    at their old rank and in rank order:
+        - the lower-ranked endpoint of every changed edge re-weighs the
+          shortcuts that depend on it. every shortcut re-weighed is itself a
+          changed edge, so this propagates up the hierarchy
+        - once all weights are current, nodes whose witness searches may have
+          run over an edge that got more expensive, and endpoints of edges
+          that got lighter, repeat their witness searches, which can add
+          shortcuts (and schedules the nodes above them in turn)
+    the contraction order is kept. shortcuts heavier than a parallel edge are
+    removed; one that is no longer needed but is the lightest u -> w edge is
+    kept, as it still has the weight of a real path and shortcuts above may
+    unpack through it.
+    rebuild the CHIndex with CHIndex.from_overlay afterwards.
+    """
+    if isinstance(G_prime, Overlay):
+        raise TypeError("update_edge_weights edits G' in place, pass to_graph()")
+    updater = _Updater(G_prime, order, limits)
+    index = updater.H.index
+    for src, dest, weight in changes:
+        u = G_prime.nodes[src]
+        edges = [e for e in u.outgoing.get(dest, ()) if e["middle"] is None]
+        if not edges:
+            raise ValueError(f"no edge {src} -> {dest} to update")
+        changed = [edge for edge in edges if edge["weight"] != weight]
+        if not changed:
+            continue
+        for edge in changed:
+            edge["weight"] = weight
+        updater.report.changed_edges += len(changed)
+        updater.edge_changed(index[src], index[dest])
+    updater.run()
+    return updater.report
@@ -0,0 +1,424 @@
+# compact array-backed (CSR) graph storage
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from GraphNode import Graph, Node, NodeEdge
+from priorityQueues import QUEUES, HeapQueue, QueueStats, RadixHeap
+from heuristics import DISTANCES
+from search import get_joined_path
+from searchStats import Stats
+import bisect
+import math
+import time
+
+
+class StringTable:
+    """
+    interns repeated values (street names, landmark/obstacle tuples) so that
+    every edge only stores a small integer index into a shared table
+    """
+
+    def __init__(self, values: list | None = None) -> None:
+        self.values: list = values if values is not None else []
+        # the reverse lookup is only needed while interning, so tables loaded
+        # from disk build it on first use
+        self._index: dict | None = None
+
+    @property
+    def index(self) -> dict:
+        if self._index is None:
+            self._index = {value: i for i, value in enumerate(self.values)}
+        return self._index
+
+    def intern(self, value) -> int:
+        idx = self.index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self.index[value] = idx
+            self.values.append(value)
+        return idx
+
+    def __getitem__(self, idx: int):
+        return self.values[idx]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+
+def weight_typecode(weights) -> str:
+    """integer weights (the common case) are stored as int64, anything else as double"""
+    return "q" if all(isinstance(w, int) for w in weights) else "d"
+
+
+def build_csr(
+    num_nodes: int, edges: list[tuple[int, int, float, int]], weight_type: str = "d"
+):
+    """
+    counting-sort a list of (src, dst, weight, edge_id) tuples into compressed
+    sparse row form. returns (offsets, targets, weights, edge_ids) where the
+    out-edges of node u live in the slice offsets[u]:offsets[u + 1]
+    """
+    offsets = array("q", [0]) * (num_nodes + 1)
+    for src, _, _, _ in edges:
+        offsets[src + 1] += 1
+    for u in range(num_nodes):
+        offsets[u + 1] += offsets[u]
+
+    targets = array("q", [0]) * len(edges)
+    weights = array(weight_type, [0]) * len(edges)
+    edge_ids = array("q", [0]) * len(edges)
+    cursor = array("q", offsets[:-1])
+    for src, dst, weight, edge_id in edges:
+        pos = cursor[src]
+        targets[pos] = dst
+        weights[pos] = weight
+        edge_ids[pos] = edge_id
+        cursor[src] += 1
+    return offsets, targets, weights, edge_ids
+
+
+def csr_permutation(num_nodes: int, sources: array) -> tuple[array, array]:
+    """
+    build_csr for edges kept column-wise: counting-sort the edge ids by
+    their source without building a tuple per edge. returns (offsets, order)
+    where order[offsets[u]:offsets[u + 1]] are the ids of the edges leaving u
+    """
+    offsets = array("q", [0]) * (num_nodes + 1)
+    for src in sources:
+        offsets[src + 1] += 1
+    for u in range(num_nodes):
+        offsets[u + 1] += offsets[u]
+
+    order = array("q", [0]) * len(sources)
+    cursor = array("q", offsets[:-1])
+    for e, src in enumerate(sources):
+        order[cursor[src]] = e
+        cursor[src] += 1
+    return offsets, order
+
+
+@dataclass
+class CompactGraph:
+    """
+    immutable graph with integer node ids. nodes are numbered in insertion
+    order of the source Graph, out-edges are stored as offset/target/weight
+    arrays and edge metadata is kept as indices into interned string tables.
+    """
+
+    labels: list[str]
+    index: dict[str, int]
+    xs: array
+    ys: array
+    offsets: array
+    targets: array
+    weights: array
+    edge_names: array
+    edge_landmarks: array
+    edge_obstacles: array
+    # node id bypassed by a shortcut edge, -1 for original edges
+    edge_middle: array
+    names: StringTable = field(default_factory=StringTable)
+    tags: StringTable = field(default_factory=StringTable)
+    source: Graph | None = None
+
+    @classmethod
+    def from_graph(
+        cls, G: Graph, shortcuts: dict[str, list[NodeEdge]] | None = None
+    ) -> CompactGraph:
+        """
+        G's edges, plus the edges of shortcuts (source label -> edges) after
+        each node's own, as kept by chOverlay.Overlay
+        """
+        labels = list(G.nodes.keys())
+        index = {label: i for i, label in enumerate(labels)}
+        xs = array("d", (float(G.nodes[k].x) for k in labels))
+        ys = array("d", (float(G.nodes[k].y) for k in labels))
+
+        names = StringTable()
+        tags = StringTable()
+        edges = []
+        meta = []
+        for u, label in enumerate(labels):
+            out = G.nodes[label].neighbours
+            if shortcuts and label in shortcuts:
+                out = out + shortcuts[label]
+            for edge in out:
+                v = index[edge["endpoint"].label]
+                edges.append((u, v, edge["weight"], len(meta)))
+                middle = edge.get("middle")
+                meta.append(
+                    (
+                        names.intern(edge["name"]),
+                        tags.intern(tuple(edge["landmarks"])),
+                        tags.intern(tuple(edge["obstacles"])),
+                        -1 if middle is None else index[middle],
+                    )
+                )
+
+        offsets, targets, weights, edge_ids = build_csr(
+            len(labels), edges, weight_typecode(e[2] for e in edges)
+        )
+        edge_names = array("q", (meta[e][0] for e in edge_ids))
+        edge_landmarks = array("q", (meta[e][1] for e in edge_ids))
+        edge_obstacles = array("q", (meta[e][2] for e in edge_ids))
+        edge_middle = array("q", (meta[e][3] for e in edge_ids))
+        return cls(
+            labels,
+            index,
+            xs,
+            ys,
+            offsets,
+            targets,
+            weights,
+            edge_names,
+            edge_landmarks,
+            edge_obstacles,
+            edge_middle,
+            names,
+            tags,
+            G,
+        )
+
+    def num_nodes(self) -> int:
+        return len(self.labels)
+
+    def num_edges(self) -> int:
+        return len(self.targets)
+
+    def out_edges(self, u: int) -> range:
+        """edge ids (positions in the target/weight arrays) leaving u"""
+        return range(self.offsets[u], self.offsets[u + 1])
+
+    def node(self, u: int) -> Node:
+        """map a node id back to the Node object of the source graph"""
+        if self.source is not None:
+            return self.source.nodes[self.labels[u]]
+        return Node(self.labels[u], self.xs[u], self.ys[u])
+
+    def edge_dict(self, e: int) -> NodeEdge:
+        """expand edge id e back into the NodeEdge dict used by Graph"""
+        return {
+            "name": self.names[self.edge_names[e]],
+            "weight": self.weights[e],
+            "endpoint": self.node(self.targets[e]),
+            "landmarks": list(self.tags[self.edge_landmarks[e]]),
+            "obstacles": list(self.tags[self.edge_obstacles[e]]),
+            "middle": self.middle_label(e),
+        }
+
+    def middle_label(self, e: int) -> str | None:
+        middle = self.edge_middle[e]
+        return None if middle == -1 else self.labels[middle]
+
+    def to_graph(self) -> Graph:
+        """rebuild a fresh, mutable Graph of Node objects (e.g. for contraction)"""
+        nodes = {
+            label: Node(label, self.xs[u], self.ys[u])
+            for u, label in enumerate(self.labels)
+        }
+        G = Graph(nodes)
+        for u, label in enumerate(self.labels):
+            for e in self.out_edges(u):
+                G.add_dir_edge(
+                    nodes[label],
+                    nodes[self.labels[self.targets[e]]],
+                    self.names[self.edge_names[e]],
+                    self.weights[e],
+                    list(self.tags[self.edge_landmarks[e]]),
+                    list(self.tags[self.edge_obstacles[e]]),
+                    self.middle_label(e),
+                )
+        return G
+
+
+def dijkstra(
+    cg: CompactGraph,
+    source: int,
+    target: int | None = None,
+    queue=None,
+    stats: Stats | None = None,
+):
+    """
+    dijkstra's over the CSR arrays. returns a (dist, parent_edge) pair of
+    arrays indexed by node id, parent_edge is -1 for unreached nodes and the
+    source. the search stops early once target is settled.
+    queue is an empty priorityQueues backend (HeapQueue by default), whose
+    stats can be read back afterwards and are added to stats.
+    """
+    n = cg.num_nodes()
+    dist = array("d", [math.inf]) * n
+    parent_edge = array("q", [-1]) * n
+    offsets, targets, weights = cg.offsets, cg.targets, cg.weights
+    if queue is None:
+        queue = HeapQueue()
+
+    dist[source] = 0.0
+    queue.push(source, 0)
+    while queue:
+        d, u = queue.pop()
+        if u == target:
+            break
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent_edge[v] = e
+                queue.push(v, nd)
+    if stats is not None:
+        stats.add_queue(queue.stats)
+    return dist, parent_edge
+
+
+def astar(
+    cg: CompactGraph,
+    source: int,
+    target: int,
+    heuristic: str = "manhattan",
+    h_scale: float = 1.0,
+    queue=None,
+    stats: Stats | None = None,
+):
+    """
+    A* over the CSR arrays, with a metric heuristic on the node coordinates
+    scaled by h_scale as in search.aSTAR (h(n) is computed the first time n
+    is reached). returns the same (dist, parent_edge) pair as dijkstra, with
+    dist final for the nodes settled before target.
+    """
+    if heuristic not in DISTANCES:
+        raise ValueError(f"unknown heuristic {heuristic!r}")
+    metric = DISTANCES[heuristic]
+    n = cg.num_nodes()
+    dist = array("d", [math.inf]) * n
+    parent_edge = array("q", [-1]) * n
+    offsets, targets, weights = cg.offsets, cg.targets, cg.weights
+    xs, ys = cg.xs, cg.ys
+    goal = (xs[target], ys[target])
+    estimates: dict[int, float] = {}
+    if queue is None:
+        queue = HeapQueue()
+
+    dist[source] = 0.0
+    queue.push(source, metric((xs[source], ys[source]), goal) * h_scale)
+    while queue:
+        _, u = queue.pop()
+        if u == target:
+            break
+        d = dist[u]
+        for e in range(offsets[u], offsets[u + 1]):
+            v = targets[e]
+            nd = d + weights[e]
+            if nd < dist[v]:
+                dist[v] = nd
+                parent_edge[v] = e
+                h = estimates.get(v)
+                if h is None:
+                    h = estimates[v] = metric((xs[v], ys[v]), goal) * h_scale
+                queue.push(v, nd + h)
+    if stats is not None:
+        stats.add_queue(queue.stats)
+    return dist, parent_edge
+
+
+def aSTAR(
+    cg: CompactGraph,
+    start: Node,
+    end: Node,
+    heuristic: str,
+    h_scale: float = 1.0,
+    queue=None,
+    stats: Stats | None = None,
+):
+    """
+    search.aSTAR for a CompactGraph: the same arguments (metric heuristics
+    only) and the same path dict, or None if end is unreachable
+    """
+    start_time = time.perf_counter_ns()
+    s, t = cg.index[start.label], cg.index[end.label]
+    dist, parent_edge = astar(cg, s, t, heuristic, h_scale, queue, stats)
+    end_time = time.perf_counter_ns()
+    if dist[t] == math.inf:
+        return None
+    path_info = get_path_info(cg, t, parent_edge)
+    path_info["time"] = (end_time - start_time) / 1_000_000  # ms
+    return path_info
+
+
+def compare_queues(
+    cg: CompactGraph, sources: list[int], queues: dict | None = None
+) -> dict[str, tuple[QueueStats, float]]:
+    """
+    benchmark the priority queue backends: one full dijkstra's per source
+    with each of them. returns name -> (summed QueueStats, seconds). the
+    radix heap is skipped for non-integer weights.
+    """
+    if queues is None:
+        queues = QUEUES
+    results = {}
+    for name, backend in queues.items():
+        if backend is RadixHeap and cg.weights.typecode != "q":
+            continue
+        stats = QueueStats()
+        start = time.perf_counter()
+        for source in sources:
+            queue = backend()
+            dijkstra(cg, source, queue=queue)
+            stats += queue.stats
+        results[name] = (stats, time.perf_counter() - start)
+    return results
+
+
+def edge_sources(cg: CompactGraph) -> array:
+    """source node id of every edge (the CSR arrays only store targets)"""
+    sources = array("q", [0]) * cg.num_edges()
+    for u in range(cg.num_nodes()):
+        for e in cg.out_edges(u):
+            sources[e] = u
+    return sources
+
+
+def get_path_info(
+    cg: CompactGraph, target: int, parent_edge: array, sources: array | None = None
+):
+    """
+    map a parent_edge array back to the same path dict returned by
+    search.get_path_info, using the labels and edge metadata of cg.
+    without sources (see edge_sources) the source of each edge is found by
+    bisecting the offsets
+    """
+    edges = []
+    curr = target
+    while parent_edge[curr] != -1:
+        e = parent_edge[curr]
+        edges.append(e)
+        if sources is None:
+            curr = bisect.bisect_right(cg.offsets, e) - 1
+        else:
+            curr = sources[e]
+    edges.reverse()
+    return edge_path_info(cg, curr, edges)
+
+
+def edge_path_info(cg: CompactGraph, start: int, edges: list[int]):
+    """path dict (as in search.get_path_info) for a walk of edge ids from start"""
+    node_path = [cg.labels[start]]
+    for e in edges:
+        node_path.append(cg.labels[cg.targets[e]])
+
+    edge_path = [cg.names[cg.edge_names[e]] for e in edges]
+    weights = [cg.weights[e] for e in edges]
+    obstacles = []
+    landmarks = []
+    for e in edges:
+        obstacles.extend(cg.tags[cg.edge_obstacles[e]])
+        landmarks.extend(cg.tags[cg.edge_landmarks[e]])
+    return {
+        "nodes": node_path,
+        "edges": edge_path,
+        "path": get_joined_path(node_path, edge_path),
+        "weights": weights,
+        "obstacles": obstacles,
+        "landmarks": landmarks,
+        "total_weight": sum(weights),
+        "time": 0,
+    }
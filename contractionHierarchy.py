@@ -1,11 +1,22 @@
 # Dijkstra's algorithm
-from GraphNode import Node, Graph
-from queue import PriorityQueue
+from __future__ import annotations
+from GraphNode import Node, Graph, NodeEdge
+from dataclasses import dataclass, field
+from typing import NamedTuple
+import heapq
 import itertools
+import multiprocessing
 import math
+import os
+import random
 from search import aSTAR
-
-import copy
+from queryContext import QueryContext, default_context
+from priorityQueues import HeapQueue, IndexedHeap
+from chQuery import CHIndex, ch_shortest_path
+from chOverlay import Overlay
+from compactGraph import CompactGraph
+from chStorage import write_ch_index
+from searchStats import Stats
 
 
 class clr:
@@ -28,70 +39,247 @@ def dijkstra(
     threshold=None,
     direction: str | None = None,
     contraction_order=None,
+    context: QueryContext | None = None,
+    queue=None,
+    stats: Stats | None = None,
 ) -> list[Node] | None:
     """
     Simple Dijkstra's algorithm: returns path using
-    node object's 'previous' attr.
+    the parents recorded in context.forward (nodes of G are not modified).
+    pass a context to read the distances back, e.g. context.forward.get(id).
+    threshold stops the search once every node within that distance is
+    settled; distances over it are left tentative in the context.
+    queue picks the priorityQueues backend (an empty HeapQueue by default),
+    its operation counts are added to stats.
 
     Source: [Russel, Norvig and Al. 2010, p. 91]
     """
-    for node in G.nodes.values():
-        node.estD = math.inf
-
-    start.estD = 0
-    frontier = PriorityQueue()
+    if context is None:
+        context = default_context(G, lambda: QueryContext.for_graph(G))
+    space = context.forward
+    space.reset()  # O(1), replaces the per-query estD sweep over G
+    index = context.index
+    excluded = {n.label for n in exclude} if exclude else set()
+    rank = None
+    if contraction_order and direction:
+        rank = {label: i for i, label in enumerate(contraction_order)}
+
+    s = index[start.label]
+    space.set(s, 0)
+    if queue is None:
+        queue = HeapQueue()
     reached = [start]
 
-    # counter is an iterator that we can use as a hacky solution for prio-queue
-    # comparison when node.estD already exists in the priority queue (since tuple-tuple
-    # comparison falls to next element when the first two (estD) are equal, and Node
-    # instances are not comparable.
-    counter = itertools.count()
+    # the queue holds node ids (comparable, unlike Node instances) and
+    # replaces outdated entries itself, so no tiebreak counter or stale check
+    queue.push(s, 0)
 
-    # use the counter to ensure comparison will work if a node with estD already
-    # exists in the queue
-    frontier.put((start.estD, next(counter), start))
+    try:
+        while queue:
+            dist, u = queue.pop()
+            if threshold is not None and dist > threshold:
+                break
+            node = G.nodes[context.labels[u]]
+            if end and node is end:
+                return node
+
+            for edge in node.get_out_edges():
+                nbor = edge["endpoint"]
+
+                if nbor.label in excluded:
+                    continue
 
-    while not frontier.empty():
-        dist, _, node = frontier.get()
-        if end and node == end:
-            return node
+                if rank and direction == "UP":
+                    if rank[start.label] > rank[nbor.label]:
+                        continue
 
-        for edge in node.get_out_edges():
-            nbor = edge["endpoint"]
+                if rank and direction == "DOWN":
+                    if rank[node.label] > rank[nbor.label]:
+                        continue
 
-            if exclude and nbor in exclude:
-                continue
+                v = index[nbor.label]
+                if dist + edge["weight"] < space.get(v):
+                    updated_dist = dist + edge["weight"]
+                    if not space.reached(v):
+                        reached.append(nbor)
+                    space.set(v, updated_dist, u, edge)
+                    queue.push(v, updated_dist)
 
-            if nbor in reached:
-                continue
+        # solution either not reached, or target unspecified
+        return reached
+    finally:
+        if stats is not None:
+            stats.add_queue(queue.stats)
 
-            if contraction_order and direction and direction == "UP":
-                if contraction_order.index(start.label) > contraction_order.index(
-                    nbor.label
-                ):
-                    continue
 
-            if contraction_order and direction and direction == "DOWN":
-                if contraction_order.index(node) > contraction_order.index(nbor):
-                    continue
+class Shortcut(NamedTuple):
+    """
+    shortcut src -> dest of the given weight that bypasses the contracted
+    node middle. no edge metadata is copied into it: landmarks and obstacles
+    are recovered from the original edges when a path is unpacked.
+    """
+
+    src: str
+    dest: str
+    weight: int
+    middle: str
+
 
-            if dist + edge["weight"] < nbor.estD:
-                updated_dist = dist + edge["weight"]
-                nbor.estD = updated_dist
-                nbor.parent = node
-                nbor.preceding_edge = edge
-                reached.append(nbor)
-                frontier.put((nbor.estD, next(counter), nbor))
+@dataclass
+class WitnessLimits:
+    """
+    optional bounds on each witness search. a search cut short by a limit
+    may miss a witness, which only adds a superfluous (but correct) shortcut.
+        - max_hops:    do not relax edges of nodes this many edges from u
+        - max_settled: stop after settling this many nodes
+    """
 
-                if threshold and updated_dist > threshold:
-                    return None
+    max_hops: int | None = None
+    max_settled: int | None = None
 
-    # solution either not reached, or target unspecified
-    return reached
 
+@dataclass
+class ContractionGraph:
+    """
+    the mutable graph that contraction consumes, keyed by node id (ids follow
+    the node order of G, as in QueryContext.for_graph). out[u] and inc[u] map
+    a neighbour id to the weight of the cheapest edge between the two, and
+    nothing else is kept: no Node objects, names, landmarks or obstacles.
+    parallel edges collapse into the lightest one and self-loops are dropped,
+    neither can be part of a shortest path. G itself is never modified.
+    """
 
-def contract(G: Graph, node: Node) -> list:
+    labels: list[str]
+    index: dict[str, int]
+    out: list[dict[int, float]]
+    inc: list[dict[int, float]]
+
+    @classmethod
+    def from_graph(cls, G: Graph) -> ContractionGraph:
+        labels = list(G.nodes.keys())
+        index = {label: i for i, label in enumerate(labels)}
+        out: list[dict[int, float]] = [{} for _ in labels]
+        inc: list[dict[int, float]] = [{} for _ in labels]
+        for u, label in enumerate(labels):
+            for edge in G.nodes[label].neighbours:
+                w = index[edge["endpoint"].label]
+                if w != u and edge["weight"] < out[u].get(w, math.inf):
+                    out[u][w] = inc[w][u] = edge["weight"]
+        return cls(labels, index, out, inc)
+
+    @classmethod
+    def from_compact(cls, cg: CompactGraph) -> ContractionGraph:
+        """the same graph as from_graph(cg.source), read from the CSR arrays"""
+        n = cg.num_nodes()
+        out: list[dict[int, float]] = [{} for _ in range(n)]
+        inc: list[dict[int, float]] = [{} for _ in range(n)]
+        targets, weights = cg.targets, cg.weights
+        for u in range(n):
+            for e in cg.out_edges(u):
+                w, weight = targets[e], weights[e]
+                if w != u and weight < out[u].get(w, math.inf):
+                    out[u][w] = inc[w][u] = weight
+        return cls(list(cg.labels), dict(cg.index), out, inc)
+
+    def new_context(self) -> QueryContext:
+        """workspace for witness searches, sharing this graph's id mapping"""
+        return QueryContext(self.labels, self.index)
+
+    def add_edge(self, u: int, w: int, weight: float) -> None:
+        """add u -> w, or lower its weight; a heavier edge changes nothing"""
+        if weight < self.out[u].get(w, math.inf):
+            self.out[u][w] = self.inc[w][u] = weight
+
+    def remove_node(self, v: int) -> None:
+        """detach v from all of its neighbours"""
+        for u in self.inc[v]:
+            del self.out[u][v]
+        for w in self.out[v]:
+            del self.inc[w][v]
+        self.out[v] = {}
+        self.inc[v] = {}
+
+    def neighbours(self, v: int) -> set[int]:
+        return self.out[v].keys() | self.inc[v].keys()
+
+
+def witness_search(
+    H: ContractionGraph,
+    source: int,
+    targets,
+    excluded,
+    threshold: float,
+    context: QueryContext,
+    limits: WitnessLimits | None = None,
+    stats: Stats | None = None,
+) -> None:
+    """
+    localised one-to-many dijkstra's over H from node id source that never
+    passes through the excluded ids (the node(s) being contracted). the
+    search ends once every target id is settled, the frontier exceeds
+    threshold, or one of the limits is hit. tentative distances are left in
+    context.forward, whose arrays are reused between calls (reset is O(1)).
+    """
+    space = context.forward
+    space.reset()
+    out = H.out
+    max_hops = limits.max_hops if limits else None
+    max_settled = limits.max_settled if limits else None
+    # the hottest loop of preprocessing: the labels are read and written
+    # through the arrays of space instead of its get/set methods
+    labels, parents, stamps, epoch = space.dist, space.parent, space.stamp, space.epoch
+
+    space.set(source, 0)
+    # (dist, hops, node id): ids compare, so no tiebreak counter is needed
+    frontier = [(0, 0, source)]
+    remaining = len(targets)
+    settled = 0
+    pops = 0
+    relaxed = 0
+
+    while frontier:
+        dist, hops, u = heapq.heappop(frontier)
+        pops += 1
+        if dist > labels[u]:
+            continue
+        if dist > threshold:
+            break
+        settled += 1
+        if u in targets:
+            remaining -= 1
+            if remaining == 0:
+                break
+        if max_settled is not None and settled >= max_settled:
+            break
+        if max_hops is not None and hops >= max_hops:
+            continue
+
+        for v, weight in out[u].items():
+            if v in excluded:
+                continue
+            nd = dist + weight
+            if stamps[v] != epoch or nd < labels[v]:
+                labels[v] = nd
+                parents[v] = u
+                stamps[v] = epoch
+                heapq.heappush(frontier, (nd, hops + 1, v))
+                relaxed += 1
+
+    if stats is not None:
+        stats.add("witness_searches")
+        stats.add("settled", settled)
+        stats.add("relaxed", relaxed)
+        stats.add("pushes", relaxed + 1)
+        stats.add("pops", pops)
+
+
+def contract(
+    H: ContractionGraph,
+    v: int,
+    context: QueryContext | None = None,
+    limits: WitnessLimits | None = None,
+    stats: Stats | None = None,
+) -> list[Shortcut]:
     """
     critical component of CH and the step where we
     determine the 'shortcuts' to be added to the overlay
@@ -102,105 +290,235 @@ def contract(G: Graph, node: Node) -> list:
         - W (set of nodes with incoming edges from v)
 
     Finding 'shortcuts' is as simple as conducting a localised
-    single-source shortest path (Dijkstra's) on all u in U (subgraph of G)
+    single-source shortest path (witness_search) on all u in U (subgraph of G)
     excluding v. if no path u ->...-> w is found with
     dist(u,w) < dist(u, v) + dist(v, w) then we can create an
     artificial shortcut edge u -> w with weight dist(u, v) + dist(v, w).
     """
-
-    U = G.get_incoming_neighbours_with_edges(node)
-    # print(f"node {node.label} incoming neighbours = {U.keys()}")
-    W = G.get_outgoing_neighbours_with_edges(node)
-    # print(f"node {node.label} outgoing neighbours = {W.keys()}")
-    # print(f"Graph before contraction: {G}")
+    found = find_shortcuts(H, v, context, limits, stats=stats)
+    for u, w, weight in found:
+        H.add_edge(u, w, weight)
+    H.remove_node(v)
+
+    if stats is not None:
+        stats.add("shortcuts_added", len(found))
+        if stats.verbose:
+            print(
+                f"\t\tcontracted Node {H.labels[v]}:"
+                + f" added {clr.CY}{len(found)}{clr.END} shortcuts"
+            )
+    return as_shortcuts(H, v, found)
+
+
+def find_shortcuts(
+    H: ContractionGraph,
+    v: int,
+    context: QueryContext | None = None,
+    limits: WitnessLimits | None = None,
+    excluded=None,
+    stats: Stats | None = None,
+) -> list[tuple[int, int, float]]:
+    """
+    the read-only half of contract: witness searches for every u in U,
+    returning the (u, w, weight) id triples of the shortcuts needed to
+    remove v without modifying H. excluded can name further ids that are
+    removed in the same batch, so that no witness path relies on them.
+    """
+    if context is None:
+        context = default_context(H, H.new_context)
+    if excluded is None:
+        excluded = {v}
+    space = context.forward
+    W = H.out[v]
+    if not W:
+        return []
+    farthest = max(W.values())
 
     shortcuts = []
+    for u, u_v in H.inc[v].items():
+        # the threshold is the maximum cost of any path u -> v -> w
+        witness_search(H, u, W, excluded, u_v + farthest, context, limits, stats)
+        for w, v_w in W.items():
+            if w != u and space.get(w) > u_v + v_w:
+                shortcuts.append((u, w, u_v + v_w))
+    return shortcuts
 
-    for k, u_v in U.items():
-        u = G.nodes[k]
-        cost_incl_v = {}
 
-        for k2, v_w in W.items():
-            w = G.nodes[k2]
-            cost_incl_v[(u.label, w.label)] = u_v["weight"] + v_w["weight"]
-        if not cost_incl_v:
-            continue
-        threshold = max(cost_incl_v.values())
-
-        # print("U is: ", u)
-        dijkstra(G, u, exclude=[node], threshold=threshold)
-        for k3, v_w in W.items():
-            w = G.nodes[k3]
-            short_cost = cost_incl_v[(u.label, w.label)]
-
-            if w.estD > short_cost:
-                lmarks = u_v["landmarks"] + v_w["landmarks"]
-                obst = u_v["obstacles"] + v_w["obstacles"]
-                nbors = u.neighbours
-                # these lines delete duplicate shortcuts, as we may find a better one
-                for nbor in nbors:
-                    if nbor["endpoint"] == w and nbor["weight"] >= short_cost:
-                        # print("removing duplicate")
-                        u.remove_incident_edge(nbor)
-                for nbor in w.neighbours:
-                    if nbor["endpoint"] == u and nbor["weight"] >= short_cost:
-                        w.remove_incident_edge(nbor)
-                u.add_neighbour("shortcut", w, short_cost, lmarks, obst)
-                # w.add_neighbour("", u, short_cost, lmarks, obst)
-                shortcuts.append(
-                    (u.label, w.label, "shortcut", short_cost, lmarks, obst)
-                )
+def as_shortcuts(
+    H: ContractionGraph, v: int, found: list[tuple[int, int, float]]
+) -> list[Shortcut]:
+    """the id triples of find_shortcuts for node v as labelled Shortcuts"""
+    labels = H.labels
+    return [Shortcut(labels[u], labels[w], weight, labels[v]) for u, w, weight in found]
 
-    print(
-        f"\t\tcontracted Node {node.label}:"
-        + f" added {clr.CY}{len(shortcuts)}{clr.END} shortcuts"
+
+def simulate_contraction(
+    H: ContractionGraph,
+    v: int,
+    context: QueryContext | None = None,
+    limits: WitnessLimits | None = None,
+    stats: Stats | None = None,
+) -> int:
+    """
+    edge difference of contracting v: the shortcuts it would need minus the
+    edges it would take away. H is not modified.
+    """
+    found = find_shortcuts(H, v, context, limits, stats=stats)
+    edge_diff = len(found) - len(H.inc[v]) - len(H.out[v])
+
+    if stats is not None:
+        stats.add("simulations")
+        if stats.verbose:
+            labels = "[" + ", ".join(H.labels[u] for u in H.neighbours(v)) + "]"
+            print(
+                f"\t\t{clr.BLD}{clr.H}SIM_CONTRACT* node: "
+                + f"{clr.GR}{H.labels[v]:2}{clr.END}"
+                + f" on subg {labels:8}->"
+                + f" simulating {clr.WR}{len(found):2}{clr.END} shortcuts"
+            )
+    return edge_diff
+
+
+# state of a preprocessing worker process, set once by _init_worker so the
+# graph is never pickled per task. batched contraction keeps one pool for
+# every round, and each worker brings its graph up to date from the rounds
+# sent along with its tasks (_run_synced)
+_worker_graph: ContractionGraph | None = None
+_worker_context: QueryContext | None = None
+_worker_limits: WitnessLimits | None = None
+_worker_rounds = 0
+
+
+def _init_worker(H: ContractionGraph, limits: WitnessLimits | None) -> None:
+    global _worker_graph, _worker_context, _worker_limits, _worker_rounds
+    _worker_graph = H
+    _worker_context = H.new_context()
+    _worker_limits = limits
+    _worker_rounds = 0
+
+
+def _simulate_in_worker(v: int) -> int:
+    return simulate_contraction(_worker_graph, v, _worker_context, _worker_limits)
+
+
+def _find_shortcuts_in_worker(task: tuple[int, frozenset[int]]) -> list:
+    v, excluded = task
+    return find_shortcuts(
+        _worker_graph, v, _worker_context, _worker_limits, excluded
     )
-    G.remove_node(node)
 
-    return shortcuts
 
+def _run_synced(task: tuple[int, list, object, list]) -> tuple[int, int, list]:
+    """
+    run func over items once the worker's graph has caught up with the
+    rounds contracted so far. rounds are the contracted rounds from number
+    since on, each a list of (node id, shortcut triples). returns (pid,
+    rounds applied, results), or (pid, -1, None) if the worker lags behind
+    since, i.e. it was restarted from the initial graph.
+    """
+    global _worker_rounds
+    since, rounds, func, items = task
+    if _worker_rounds < since:
+        return os.getpid(), -1, None
+    for contracted in rounds[_worker_rounds - since :]:
+        for v, found in contracted:
+            for u, w, weight in found:
+                _worker_graph.add_edge(u, w, weight)
+            _worker_graph.remove_node(v)
+    _worker_rounds = since + len(rounds)
+    return os.getpid(), _worker_rounds, [func(item) for item in items]
 
-def simulate_contraction(G: Graph, node: Node) -> int:
-    edges = node.get_out_edges()
 
-    # list of nodes directly adjacent to v (node we wish to contract)
-    U = {e["endpoint"].label: (e["endpoint"], e["weight"]) for e in edges}
+def _distances_in_worker(task: tuple[int, list[int], float]) -> list[float]:
+    return _source_distances(_worker_graph, _worker_context, *task)
 
-    # we assume the graph is fully bi-directional here
-    original_edges = 2 * len(edges)
-    shortcut_edges = 0
 
-    # shortcuts = []  # for printing to stdout only
-    for u, cost_u_to_v in U.values():
-        cost_incl_v = {}
+def _process_pool(workers: int, H: ContractionGraph, limits: WitnessLimits | None):
+    """
+    pool whose workers hold H. with the fork start method (the default on
+    linux) H is inherited copy-on-write and shared read-only; elsewhere it is
+    pickled once per worker through the initializer.
+    """
+    methods = multiprocessing.get_all_start_methods()
+    mp = multiprocessing.get_context("fork" if "fork" in methods else None)
+    return mp.Pool(workers, _init_worker, (H, limits))
 
-        for w, cost_v_to_w in U.values():
-            cost_incl_v[(u.label, w.label)] = cost_u_to_v + cost_v_to_w
-        # the threshold is the maximum cost of any path u->v->w for all w in W,
-        # where W is the set of nodes adjacent to v with incoming edges from v
-        threshold = max(cost_incl_v.values())
 
-        # run localised dijkstra on subgraph distance bounded by the threshold
-        dijkstra(G, u, exclude=[node], threshold=threshold)
+def _chunksize(num_tasks: int, workers: int) -> int:
+    return max(1, num_tasks // (workers * 4))
 
-        for w, _ in U.values():
-            inclusive_cost = cost_incl_v[(u.label, w.label)]  # cost of path u->w via v
-            if w.estD > inclusive_cost:  # if cost u->w via v is min, make shortcut
-                # shortcuts.append(f"({u.label}->{w.label}, {inclusive_cost})")
-                shortcut_edges += 1
 
-    labels = "[" + ", ".join([u[0].label for u in U.values()]) + "]"
-    print(
-        f"\t\t{clr.BLD}{clr.H}SIM_CONTRACT* node: {clr.GR}{node.label:2}{clr.END}"
-        + f" on subg {labels:8}->"
-        + f" simulating {clr.WR}{shortcut_edges//2:2}{clr.END} shortcuts"
-    )
+def _map_in_pool(
+    func,
+    tasks: list,
+    workers: int,
+    H: ContractionGraph,
+    limits: WitnessLimits | None,
+) -> list:
+    """run one of the *_in_worker functions over tasks, preserving order"""
+    with _process_pool(workers, H, limits) as pool:
+        return pool.map(func, tasks, _chunksize(len(tasks), workers))
 
-    # compute the edge diff
-    return shortcut_edges - original_edges
 
+class _SyncedPool:
+    """
+    process pool for batched contraction whose workers follow the parent's
+    graph without ever waiting on each other. the parent logs every
+    contracted round, and each task carries the rounds from the oldest one a
+    worker has not acknowledged yet, so a worker that got no task for a while
+    catches up with its next one. a worker the pool restarts begins again at
+    the initial graph and is sent the whole log until it acknowledges it; if
+    it got a shorter one first, it turns the task down and the task is sent
+    again with the whole log.
+    """
 
-def get_contraction_order(G: Graph):
+    def __init__(self, workers: int, H: ContractionGraph, limits):
+        self.workers = workers
+        self.pool = _process_pool(workers, H, limits)
+        self.rounds: list[list[tuple[int, list]]] = []
+        self.acknowledged: dict[int, int] = {}  # worker pid -> rounds applied
+
+    def record(self, contracted: list[tuple[int, list]]) -> None:
+        self.rounds.append(contracted)
+
+    def map(self, func, items: list) -> list:
+        size = _chunksize(len(items), self.workers)
+        chunks = [items[i : i + size] for i in range(0, len(items), size)]
+        results = [None] * len(chunks)
+        todo = list(range(len(chunks)))
+        resync = False
+        while todo:
+            live = {process.pid for process in multiprocessing.active_children()}
+            for pid in self.acknowledged.keys() - live:
+                del self.acknowledged[pid]
+            if resync or len(self.acknowledged) < self.workers:
+                since = 0
+            else:
+                since = min(self.acknowledged.values())
+            rounds = self.rounds[since:]
+            tasks = [(since, rounds, func, chunks[i]) for i in todo]
+            lagging = []
+            answers = self.pool.map(_run_synced, tasks, 1)
+            for i, (pid, applied, out) in zip(todo, answers):
+                if applied < 0:
+                    lagging.append(i)
+                else:
+                    self.acknowledged[pid] = applied
+                    results[i] = out
+            todo = lagging
+            resync = True
+        return [result for chunk in results for result in chunk]
+
+    def terminate(self) -> None:
+        self.pool.terminate()
+
+
+def get_contraction_order(
+    H: ContractionGraph,
+    limits: WitnessLimits | None = None,
+    workers: int | None = None,
+    stats: Stats | None = None,
+):
     """
     Simulate contraction for each node in the graph.
     Lowest edge-difference maintains top position in
@@ -208,19 +526,38 @@ def get_contraction_order(G: Graph):
     for later contraction. During the actual pre-processing
     stage and node-contraction these edge differences will
     be lazily re-evaluated.
+
+    simulations only read H, so with workers > 1 they are spread across a
+    process pool. results come back in node order, which gives exactly the
+    same queue (including tiebreaks) as the serial path.
+
+    the queue is an IndexedHeap of node ids keyed by (edge difference,
+    insertion counter), so re-evaluated nodes are moved in place.
     """
-    contraction_queue = PriorityQueue()
+    contraction_queue = IndexedHeap()
     # counter for similar trick used in simulate_contraction
     counter = itertools.count()
-    for node in G.nodes.values():
-        edge_diff = simulate_contraction(G, node)
-        contraction_queue.put((edge_diff, next(counter), node))
+    ids = range(len(H.labels))
+    if workers and workers > 1:
+        edge_diffs = _map_in_pool(_simulate_in_worker, list(ids), workers, H, limits)
+        if stats is not None:
+            stats.add("simulations", len(ids))
+    else:
+        context = H.new_context()
+        edge_diffs = [simulate_contraction(H, v, context, limits, stats) for v in ids]
+    for v, edge_diff in zip(ids, edge_diffs):
+        contraction_queue.push(v, (edge_diff, next(counter)))
     return contraction_queue
 
 
-def contract_graph(G: Graph, hierarchy: PriorityQueue):
+def contract_graph(
+    H: ContractionGraph,
+    hierarchy: IndexedHeap,
+    limits: WitnessLimits | None = None,
+    stats: Stats | None = None,
+):
     """
-    MAKE SURE TO PASS IN A DEEPCOPY OF ORIGINAL G TO THIS METHOD
+    MAKE SURE TO PASS IN A FRESH ContractionGraph: EVERY NODE OF IT IS REMOVED
     Contract nodes in graph according to order provided
     by contraction simulation. Because the edge difference
     of nodes can change during the process, we will
@@ -235,110 +572,480 @@ def contract_graph(G: Graph, hierarchy: PriorityQueue):
 
     final_contraction_order = []
     shortcuts = []
+    # ids stay valid as H shrinks, so one workspace serves every witness search
+    context = H.new_context()
 
-    while not hierarchy.empty():
+    while hierarchy:
         lowest_diff = False
         # we only want the node with the minimum edge difference
         # if that property still holds, so we check iteratively.
         # this is the lazy evaluation.
         num_iters = 1
-        print("\n\t\tEXEC LAZY RE-EVALUALTION OF CONTRACTION ORDER:")
+        if stats is not None and stats.verbose:
+            print("\n\t\tEXEC LAZY RE-EVALUALTION OF CONTRACTION ORDER:")
         while not lowest_diff:
-            old_diff, counter, node = hierarchy.get()
-            print(f"\t\treceived Node<{node.label}>")
-            new_diff = simulate_contraction(G, node)
+            (_, counter), v = hierarchy.peek()
+            if stats is not None:
+                stats.add("lazy_reevaluations")
+                if stats.verbose:
+                    print(f"\t\treceived Node<{H.labels[v]}>")
+            new_diff = simulate_contraction(H, v, context, limits, stats)
 
             # check if the new diff is still the lowest compared to
             # what's currently in 1st queue position
-            if not hierarchy.empty() and new_diff > hierarchy.queue[0][0]:
-                hierarchy.put((new_diff, counter, node))
+            hierarchy.pop()
+            if hierarchy and new_diff > hierarchy.peek()[0][0]:
+                hierarchy.push(v, (new_diff, counter))
             else:
-                hierarchy.put((old_diff, counter, node))
                 lowest_diff = True
             num_iters += 1
-        print(f"\t\tRE-EVALUATED NODE EDGE DIFFERENCE <{num_iters}> TIMES")
+        if stats is not None and stats.verbose:
+            print(f"\t\tRE-EVALUATED NODE EDGE DIFFERENCE <{num_iters}> TIMES")
 
-        _, _, node = hierarchy.get()
-        final_contraction_order.append(node.label)
-        node_shortcuts = contract(G, node)
-        shortcuts.append(node_shortcuts)
+        final_contraction_order.append(H.labels[v])
+        shortcuts.append(contract(H, v, context, limits, stats))
 
     # return a list of tuples containing the shortcuts we added to
     # G' so we can easily add them to G.
     return shortcuts, final_contraction_order
 
 
-def build_g_prime(G: Graph):
-    G_prime = copy.deepcopy(G)
-    G_test = copy.deepcopy(G)
+def is_local_minimum(H: ContractionGraph, priority: dict[int, tuple], v: int) -> bool:
+    """
+    whether the (edge difference, tiebreak) priority of v is strictly lower
+    than that of every remaining in- or out-neighbour
+    """
+    key = priority[v]
+    return all(key < priority[n] for n in H.out[v]) and all(
+        key < priority[n] for n in H.inc[v]
+    )
+
+
+def select_independent_set(
+    H: ContractionGraph, priority: dict[int, tuple]
+) -> set[int]:
+    """
+    the local minima of priority. no two of them are adjacent, and the global
+    minimum is always one of them so every round makes progress.
+    contract_graph_batched calls this once and then keeps the set up to date
+    with update_independent_set.
+    """
+    return {v for v in priority if is_local_minimum(H, priority, v)}
+
+
+def update_independent_set(
+    H: ContractionGraph,
+    priority: dict[int, tuple],
+    minima: set[int],
+    changed: set[int],
+) -> None:
+    """
+    recheck the nodes of changed in minima after their priority or their
+    neighbours did change. only nodes whose own key, neighbours or
+    neighbours' keys changed can gain or lose the property, so a round costs
+    the size of its neighbourhood instead of a scan over all nodes.
+    """
+    for v in changed:
+        if v in priority and is_local_minimum(H, priority, v):
+            minima.add(v)
+        else:
+            minima.discard(v)
+
+
+def contract_graph_batched(
+    H: ContractionGraph,
+    hierarchy: IndexedHeap,
+    limits: WitnessLimits | None = None,
+    workers: int | None = None,
+    stats: Stats | None = None,
+):
+    """
+    MAKE SURE TO PASS IN A FRESH ContractionGraph: EVERY NODE OF IT IS REMOVED
+    batch alternative to contract_graph. every round contracts an independent
+    set of nodes with locally minimal edge difference:
+        1. lazy re-evaluation: nodes next to an earlier round are stale, and
+           the stale ones among the selected set are re-simulated before the
+           set is selected again, until it holds fresh keys only
+        2. find the shortcuts of every node in the set. witness searches
+           avoid the whole set, so the shortcuts stay valid when the set is
+           removed at once
+        3. merge the shortcuts into H, remove the set and mark its remaining
+           neighbours stale
+    with workers > 1 steps 1 and 2 run on one _SyncedPool for all rounds.
+    returns the same (shortcuts, final_contraction_order) pair as
+    contract_graph, so the result can go straight to add_shortcuts_to_overlay.
+
+    this is only a speed-up with several workers: witness searches that
+    avoid the whole set find fewer witnesses, so it adds some more shortcuts
+    and does more search work in total than contract_graph, which
+    build_g_prime therefore uses on a single process.
+
+    [Vetter 2009] Parallel Time-Dependent Contraction Hierarchies
+    """
+    final_contraction_order = []
+    shortcuts = []
+    context = H.new_context()
+    parallel = workers is not None and workers > 1
+    pool = _SyncedPool(workers, H, limits) if parallel else None
+
+    # (edge difference, insertion counter) keeps keys unique and the order
+    # deterministic, exactly as the tiebreak in the contraction queue does
+    priority = {}
+    while hierarchy:
+        key, v = hierarchy.pop()
+        priority[v] = key
+    stale: set[int] = set()
+    minima = select_independent_set(H, priority)
+
+    num_rounds = 0
+    try:
+        while priority:
+            outdated = sorted(minima & stale, key=priority.__getitem__)
+            while outdated:
+                if parallel:
+                    edge_diffs = pool.map(_simulate_in_worker, outdated)
+                    if stats is not None:
+                        stats.add("simulations", len(outdated))
+                else:
+                    edge_diffs = [
+                        simulate_contraction(H, v, context, limits, stats)
+                        for v in outdated
+                    ]
+                changed = set(outdated)
+                for v, edge_diff in zip(outdated, edge_diffs):
+                    priority[v] = (edge_diff, priority[v][1])
+                    changed.update(H.neighbours(v))
+                stale.difference_update(outdated)
+                if stats is not None:
+                    stats.add("lazy_reevaluations", len(outdated))
+                update_independent_set(H, priority, minima, changed)
+                outdated = sorted(minima & stale, key=priority.__getitem__)
+
+            batch = sorted(minima, key=priority.__getitem__)
+            excluded = frozenset(batch)
+            num_rounds += 1
+            if stats is not None and stats.verbose:
+                print(
+                    f"\t\tROUND <{num_rounds}>: contracting independent set of "
+                    + f"{clr.CY}{len(batch)}{clr.END} nodes"
+                )
 
-    print(f"\n\t{clr.WR}EXEC CONTRACTION SIMULATION:{clr.END}")
-    initial_contraction_order = get_contraction_order(G)
-    print(
+            if parallel:
+                batch_found = pool.map(
+                    _find_shortcuts_in_worker, [(v, excluded) for v in batch]
+                )
+            else:
+                batch_found = [
+                    find_shortcuts(H, v, context, limits, excluded, stats)
+                    for v in batch
+                ]
+
+            changed = set()
+            for v, found in zip(batch, batch_found):
+                changed.update(H.neighbours(v))
+                for u, w, weight in found:
+                    H.add_edge(u, w, weight)
+                H.remove_node(v)
+                del priority[v]
+                final_contraction_order.append(H.labels[v])
+                shortcuts.append(as_shortcuts(H, v, found))
+                if stats is not None:
+                    stats.add("shortcuts_added", len(found))
+            stale.update(changed)
+            minima.clear()
+            update_independent_set(H, priority, minima, changed)
+            if parallel:
+                pool.record(list(zip(batch, batch_found)))
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    if stats is not None:
+        stats.log(f"\t\tCONTRACTED GRAPH IN <{num_rounds}> ROUNDS")
+    return shortcuts, final_contraction_order
+
+
+def build_g_prime(
+    G: Graph,
+    limits: WitnessLimits | None = None,
+    workers: int | None = None,
+    batched: bool = False,
+    stats: Stats | None = None,
+    sample_rate: float = 1.0,
+):
+    """
+    contract G and return (G', contraction order). G is left untouched:
+    contraction runs on a ContractionGraph of it (weights keyed by node id),
+    which it empties, and G' is an Overlay that adds the shortcuts to G by
+    reference, so preprocessing holds one full graph plus the shortcuts.
+
+    the work is split into the phases "order", "contract", "validate" and
+    "overlay" of stats (a quiet Stats is used when none is given); progress
+    is printed only when stats.verbose is set.
+    batched contracts with contract_graph_batched, which only pays off on
+    several processes: with workers unset or 1 contract_graph is used anyway.
+    sample_rate is the fraction of shortcuts validate_shortcuts checks
+    (0 skips validation); if any of them is invalid InvalidShortcutsError
+    is raised (its report lists them) instead of returning a G' that would
+    answer with wrong distances.
+    """
+    if stats is None:
+        stats = Stats()
+    G_prime = Overlay(G)
+    H = ContractionGraph.from_graph(G)
+
+    stats.log(f"\n\t{clr.WR}EXEC CONTRACTION SIMULATION:{clr.END}")
+    with stats.phase("order"):
+        initial_contraction_order = get_contraction_order(H, limits, workers, stats)
+    stats.log(
         f"\t{clr.WR}SIMULATED CONTRACTION OF "
-        + f"{len(initial_contraction_order.queue)}"
+        + f"{len(initial_contraction_order)}"
         + f" NODES{clr.END}"
     )
 
-    print(f"\n\t{clr.WR}CONTRACTING GRAPH: {G.__class__}{clr.END}")
-    shortcuts, final_contraction_order = contract_graph(G, initial_contraction_order)
-    print(
+    stats.log(f"\n\t{clr.WR}CONTRACTING GRAPH: {G.__class__}{clr.END}")
+    with stats.phase("contract"):
+        if batched and workers is not None and workers > 1:
+            shortcuts, final_contraction_order = contract_graph_batched(
+                H, initial_contraction_order, limits, workers, stats
+            )
+        else:
+            shortcuts, final_contraction_order = contract_graph(
+                H, initial_contraction_order, limits, stats
+            )
+    del H  # every node is contracted, nothing is left of it
+    stats.log(
         f"\t{clr.WR}CONTRACTION COMPLETE FOUND "
         + f"<{sum(len(x) for x in shortcuts)}> SHORTCUTS{clr.END}"
     )
-    print(
-        "\tWITH CONTRACTION ORDER: "
-        + f"{clr.CY}[{' '.join([n for n in final_contraction_order])}]{clr.END}"
-    )
+    if stats.verbose:
+        print(
+            "\tWITH CONTRACTION ORDER: "
+            + f"{clr.CY}[{' '.join([n for n in final_contraction_order])}]{clr.END}"
+        )
 
     # we contract G then add shortcuts from overlay to G'
-    print(
+    stats.log(
         f"\n\t{clr.WR}GENERATING QUERY GRAPH"
         + f"{clr.CY}[G*]{clr.WR} FROM CONTRACTED OVERLAY GRAPH {clr.CY}[G]{clr.END}"
     )
 
-    print("\n\t<Performing shortcut unit tests against known working a*>")
-    success = test_shortcuts(G_test, shortcuts)
-    print("\n\t<Adding shortcuts from overlay graph [G] to [G*]>")
-    if success:
+    if sample_rate > 0:
+        stats.log("\n\t<Validating shortcuts against the uncontracted graph>")
+        with stats.phase("validate"):
+            report = validate_shortcuts(
+                G, shortcuts, sample_rate, workers=workers, stats=stats
+            )
+        if not report.ok:
+            raise InvalidShortcutsError(report)
+    stats.log("\n\t<Adding shortcuts from overlay graph [G] to [G*]>")
+    with stats.phase("overlay"):
         num_shortcuts = add_shortcuts_to_overlay(G_prime, shortcuts)
-        print(f"\n\t\tSuccess: added {num_shortcuts} shortcuts")
-    else:
-        print("FAILED UNIT TEST/S: ABORTING")
+    stats.log(f"\n\t\tSuccess: added {num_shortcuts} shortcuts")
 
     return G_prime, final_contraction_order
 
 
-def add_shortcuts_to_overlay(G: Graph, shortcuts: list):
+def add_shortcuts_to_overlay(G: Graph | Overlay, shortcuts: list):
     num_shortcuts = 0
     for sub_list in shortcuts:
         for shortcut in sub_list:
-            src, dest, name, weight, lmarks, obst = shortcut
-            G.add_dir_edge(G.nodes[src], G.nodes[dest], name, weight, lmarks, obst)
+            src, dest, weight, middle = shortcut
+            G.add_dir_edge(
+                G.nodes[src], G.nodes[dest], "shortcut", weight, middle=middle
+            )
             num_shortcuts += 1
     return num_shortcuts
 
 
-def test_shortcuts(G: Graph, shortcuts) -> bool:
+@dataclass
+class ValidationReport:
+    """
+    outcome of validate_shortcuts. a shortcut heavier than the true distance
+    is only superfluous (witness limits and batched contraction can add
+    those) as long as some path through its middle node is not heavier than
+    it. one lighter than the true distance, or lighter than every path
+    through its middle, stands for a path that does not exist.
+    """
+
+    total: int = 0
+    checked: int = 0
+    searches: int = 0
+    # (shortcut, shortest distance in the original graph) of every checked
+    # shortcut whose weight is not that distance
+    mismatches: list[tuple[Shortcut, float]] = field(default_factory=list)
+    # the heavier ones among them that no path through their middle backs
+    unbacked: list[tuple[Shortcut, float]] = field(default_factory=list)
+
+    @property
+    def invalid(self) -> list[tuple[Shortcut, float]]:
+        lighter = [(sc, d) for sc, d in self.mismatches if sc[2] < d]
+        return lighter + self.unbacked
+
+    @property
+    def ok(self) -> bool:
+        return not self.invalid
+
+
+class InvalidShortcutsError(Exception):
+    """build_g_prime found invalid shortcuts, see report.invalid"""
+
+    def __init__(self, report: ValidationReport) -> None:
+        super().__init__(
+            f"{len(report.invalid)} of {report.checked} checked shortcuts are invalid"
+        )
+        self.report = report
+
+
+def _source_distances(
+    H: ContractionGraph,
+    context: QueryContext,
+    src: int,
+    dests: list[int],
+    threshold: float,
+) -> list[float]:
+    """
+    shortest distances src -> dests (ids). ones over threshold may come back
+    as any value over threshold (or inf)
+    """
+    witness_search(H, src, set(dests), (), threshold, context)
+    return [context.forward.get(d) for d in dests]
+
+
+def _grouped_distances(
+    H: ContractionGraph,
+    groups: dict[int, list[tuple[int, float]]],
+    workers: int | None,
+) -> dict[tuple[int, int], float]:
+    """
+    {(source, dest): distance} for groups of source -> [(dest, weight)], one
+    one-to-many search per source, bounded by the heaviest weight of its group
+    """
+    tasks = [
+        (src, sorted({dest for dest, _ in group}), max(w for _, w in group))
+        for src, group in groups.items()
+    ]
+    if workers and workers > 1 and tasks:
+        distances = _map_in_pool(_distances_in_worker, tasks, workers, H, None)
+    else:
+        context = H.new_context()
+        distances = [_source_distances(H, context, *task) for task in tasks]
+    return {
+        (src, dest): d
+        for (src, dests, _), dists in zip(tasks, distances)
+        for dest, d in zip(dests, dists)
+    }
+
+
+def validate_shortcuts(
+    G: Graph,
+    shortcuts: list,
+    sample_rate: float = 1.0,
+    seed: int | None = 0,
+    workers: int | None = None,
+    stats: Stats | None = None,
+) -> ValidationReport:
+    """
+    check the shortcuts found by contract_graph against G, the graph before
+    contraction: the weight of u -> w must be the shortest u -> w distance.
+    shortcuts are grouped by u and every group is answered by one
+    one-to-many search bounded by its heaviest shortcut, instead of one
+    search per shortcut. the same searches find d(u, middle); shortcuts
+    heavier than d(u, w) also need d(middle, w), which a second, much
+    smaller round of searches grouped by middle finds. with sample_rate < 1
+    only that fraction of the shortcuts (picked with a Random(seed)) is
+    checked. the searches run on a ContractionGraph of G, in a process pool
+    that shares it with workers > 1.
+    """
+    rnd = random.Random(seed)
+    report = ValidationReport()
+    H = ContractionGraph.from_graph(G)
+    index = H.index
+    checked = []
+    groups: dict[int, list[tuple[int, float]]] = {}
+    for sub_list in shortcuts:
+        for shortcut in sub_list:
+            report.total += 1
+            if sample_rate >= 1 or rnd.random() < sample_rate:
+                src, dest, weight, middle = shortcut
+                checked.append(shortcut)
+                group = groups.setdefault(index[src], [])
+                group.append((index[dest], weight))
+                group.append((index[middle], weight))
+
+    distance = _grouped_distances(H, groups, workers)
+    report.searches = len(groups)
+    report.checked = len(checked)
+    for shortcut in checked:
+        d = distance[index[shortcut[0]], index[shortcut[1]]]
+        if not math.isclose(shortcut[2], d):
+            report.mismatches.append((shortcut, d))
+
+    heavier: dict[int, list[tuple[int, float]]] = {}
+    for (src, dest, weight, middle), d in report.mismatches:
+        if weight > d and distance[index[src], index[middle]] <= weight:
+            heavier.setdefault(index[middle], []).append((index[dest], weight))
+    if heavier:
+        distance.update(_grouped_distances(H, heavier, workers))
+        report.searches += len(heavier)
+    for shortcut, d in report.mismatches:
+        src, dest, weight, middle = shortcut
+        if weight < d:
+            continue
+        u, w, m = index[src], index[dest], index[middle]
+        via_middle = distance[u, m] + distance.get((m, w), math.inf)
+        if weight < via_middle and not math.isclose(weight, via_middle):
+            report.unbacked.append((shortcut, d))
+
+    if stats is not None:
+        stats.add("validation_searches", report.searches)
+        stats.add("shortcuts_validated", report.checked)
+        stats.add("shortcut_mismatches", len(report.mismatches))
+        if stats.verbose:
+            for (src, dest, weight, middle), d in report.mismatches:
+                print(
+                    f"\t\tshortcut [{src} {dest} {weight}] via {middle}: "
+                    + f"shortest distance is {clr.F}{d}{clr.END}"
+                )
+            print(
+                f"\n\t{clr.WR}CHECKED {clr.CY}{report.checked}/{report.total}"
+                + f"{clr.END} SHORTCUTS IN {report.searches} SEARCHES: "
+                + f"{len(report.mismatches)} MISMATCHES, "
+                + f"{len(report.invalid)} INVALID"
+            )
+    return report
+
+
+def test_shortcuts(G: Graph, shortcuts, stats: Stats | None = None) -> bool:
+    """
+    legacy check of every shortcut with its own aSTAR, see validate_shortcuts.
+    a shortcut passes if a path exists and the shortcut is not lighter than
+    it (heavier ones are superfluous, but harmless).
+    """
+    if stats is None:
+        stats = Stats()
     score = 0
     num_shortcuts = 0
     for sub_list in shortcuts:
         for shortcut in sub_list:
-            src, dest, _, weight, _, _ = shortcut
-            G.reset_nodes()
-            best_path = aSTAR(G, G.nodes[src], G.nodes[dest], "euclidean")
+            src, dest, weight, _ = shortcut
+            best_path = aSTAR(
+                G, G.nodes[src], G.nodes[dest], "euclidean", stats=stats
+            )
             if best_path is not None:
                 optimal = weight == best_path["total_weight"]
-                print(
-                    f"\t\tTesting shortcut [{src} {dest} {weight}] against eucl aSTAR*"
-                    + f"--> got {best_path['total_weight']} {clr.WR}{optimal}{clr.END}"
-                )
-                score += 1
+                if stats.verbose:
+                    print(
+                        f"\t\tTesting shortcut [{src} {dest} {weight}] against "
+                        + f"eucl aSTAR*--> got {best_path['total_weight']} "
+                        + f"{clr.WR}{optimal}{clr.END}"
+                    )
+                score += weight >= best_path["total_weight"]
             else:
                 print(f"Path ({src}->{dest}) did not terminate with aSTAR")
             num_shortcuts += 1
-    p = score / num_shortcuts * 100
-    print(
+    p = score / num_shortcuts * 100 if num_shortcuts else 100
+    stats.log(
         f"\n\t{clr.WR}PASSED {clr.CY}{score}/{num_shortcuts}{clr.END} TESTS: {p:.02f}%"
     )
     if p == 100:
@@ -346,32 +1053,61 @@ def test_shortcuts(G: Graph, shortcuts) -> bool:
     return False
 
 
-def query_graph(G: Graph, s: Node, t: Node, contraction_order: list):
-    upwards = copy.deepcopy(G)
-    downwards = copy.deepcopy(G)
+def query_graph(
+    G: Graph,
+    s: Node,
+    t: Node,
+    contraction_order: list,
+    contexts: tuple[QueryContext, QueryContext] | None = None,
+    stats: Stats | None = None,
+):
+    """
+    legacy query that runs two complete upward dijkstra's. each search keeps
+    its labels in its own QueryContext, so G is never copied. every step is
+    printed when stats.verbose is set.
+    prefer chQuery.ch_shortest_path for real queries.
+    an Overlay (as returned by build_g_prime) is materialised first.
+    """
+    if stats is None:
+        stats = Stats()
+    if isinstance(G, Overlay):
+        G = G.to_graph()
+        s, t = G.nodes[s.label], G.nodes[t.label]
+    if contexts is None:
+        contexts = tuple(
+            default_context(G, lambda: QueryContext.for_graph(G), slot)
+            for slot in (0, 1)
+        )
+    upwards, downwards = contexts
 
-    print(f"\n\t{clr.WR}EXEC MODIFIED GRAPH QUERY USING BIDIR DIJKSTRAS:{clr.END}")
-    print("\t\treceived contraction order...\n")
+    stats.log(
+        f"\n\t{clr.WR}EXEC MODIFIED GRAPH QUERY USING BIDIR DIJKSTRAS:{clr.END}"
+    )
+    stats.log("\t\treceived contraction order...\n")
 
-    print(
+    stats.log(
         "\t\t1. running complete dijkstra's search on upwards "
         + f"subgraph G*_U from source node {clr.CY}{s.label}{clr.END}"
     )
     reached_s = dijkstra(
-        upwards,
-        upwards.nodes[s.label],
+        G,
+        s,
         contraction_order=contraction_order,
         direction="UP",
+        context=upwards,
+        stats=stats,
     )
-    print(
+    stats.log(
         "\t\t2. running complete reversed dijkstra's search on upwards "
         + f"subgraph G*_U from target node {clr.CY}{t.label}{clr.END}\n"
     )
     reached_t = dijkstra(
-        downwards,
-        downwards.nodes[t.label],
+        G,
+        t,
         contraction_order=contraction_order,
         direction="UP",
+        context=downwards,
+        stats=stats,
     )
 
     if not reached_s or not reached_t:
@@ -379,69 +1115,125 @@ def query_graph(G: Graph, s: Node, t: Node, contraction_order: list):
 
     reached_labels_up = [n.label for n in reached_s]
     reached_labels_down = [n.label for n in reached_t]
-    print(
-        "\t\tSUCCESS: forward search reached nodes: "
-        + f"{clr.CY}[{' '.join([n for n in reached_labels_up])}]{clr.END}"
-    )
-    print(
-        "\t\tSUCCESS backwards search reached nodes: "
-        + f"{clr.CY}[{' '.join([n for n in reached_labels_down])}]{clr.END}"
-    )
+    if stats.verbose:
+        print(
+            "\t\tSUCCESS: forward search reached nodes: "
+            + f"{clr.CY}[{' '.join([n for n in reached_labels_up])}]{clr.END}"
+        )
+        print(
+            "\t\tSUCCESS backwards search reached nodes: "
+            + f"{clr.CY}[{' '.join([n for n in reached_labels_down])}]{clr.END}"
+        )
     intersection = [n for n in reached_labels_up if n in reached_labels_down]
 
-    print(
+    stats.log(
         "\n\t\tfound intersection: "
         + f"{clr.GR}[{' '.join([n for n in intersection])}{clr.END}]"
     )
     node_scores = []
     for node in intersection:
-        node_scores.append(upwards.nodes[node].estD + downwards.nodes[node].estD)
-    print(
+        node_scores.append(
+            upwards.forward.get(upwards.index[node])
+            + downwards.forward.get(downwards.index[node])
+        )
+    stats.log(
         "\t\twith score(s) (cumulative est distances from "
         + f"respective search starts): {clr.F}{[s for s in node_scores]}{clr.END}"
     )
     mutual_best = intersection[node_scores.index(min(node_scores))]
-    print("\t\tmutual best is: ", mutual_best)
+    stats.log("\t\tmutual best is: ", mutual_best)
 
-    print(f"\n\t{clr.WR}BUILDING SEARCH PATHS USING BACKTRACE...{clr.END}")
+    stats.log(f"\n\t{clr.WR}BUILDING SEARCH PATHS USING BACKTRACE...{clr.END}")
 
-    print("\t\tBacktracing path from mutual best to start node: ", s.label)
-    path_from_s = backtrack_dijkstra_path(upwards.nodes[mutual_best], reverse=True)
-    print(
+    stats.log("\t\tBacktracing path from mutual best to start node: ", s.label)
+    path_from_s = backtrack_dijkstra_path(upwards, mutual_best, reverse=True, G=G)
+    stats.log(
         f"\t\tFOUND PATH: {clr.GR}[{' '.join(path_from_s['nodes'])}]{clr.END} "
         + f"with weight: {path_from_s['total_weight']}"
     )
 
-    print("\t\tBacktracing path from mutual best to target node: ", t.label)
-    path_to_g = backtrack_dijkstra_path(downwards.nodes[mutual_best], reverse=False)
-    print(
+    stats.log("\t\tBacktracing path from mutual best to target node: ", t.label)
+    path_to_g = backtrack_dijkstra_path(downwards, mutual_best, reverse=False, G=G)
+    stats.log(
         f"\t\tFOUND PATH: {clr.GR}[{' '.join(path_to_g['nodes'])}]{clr.END} "
         + f"with weight: {path_to_g['total_weight']}"
     )
 
-    print(f"\n\t{clr.WR}CONCATENATING PATHS...{clr.END}")
+    stats.log(f"\n\t{clr.WR}CONCATENATING PATHS...{clr.END}")
     path = get_joined_dijkstras_paths(path_from_s, G.nodes[mutual_best], path_to_g)
     for k, v in path.items():
-        print(f"\t\t{k:12}: {v}")
+        stats.log(f"\t\t{k:12}: {v}")
 
-    # return path
+    return path
 
 
-def backtrack_dijkstra_path(curr: Node, reverse=False):
-    node_path = [curr.label]
+def unpack_overlay_edge(G: Graph, src: str, edge: NodeEdge) -> list:
+    """
+    expand an edge of the overlay graph G' into the (source label, edge)
+    pairs of the original edges it stands for, in path order. a shortcut
+    u -> w bypassing m is replaced by the edges u -> m and m -> w of G',
+    which may be shortcuts themselves.
+    """
+    unpacked = []
+    stack = [(src, edge)]
+    while stack:
+        u, e = stack.pop()
+        middle = e.get("middle")
+        if middle is None:
+            unpacked.append((u, e))
+            continue
+        first, second = _shortcut_children(G, u, middle, e)
+        stack.append((middle, second))
+        stack.append((u, first))
+    return unpacked
+
+
+def _shortcut_children(G: Graph, u: str, middle: str, edge: NodeEdge):
+    """the pair of edges u -> middle -> w of G' that shortcut edge replaced"""
+    w = edge["endpoint"]
+    m = G.nodes[middle]
+    candidates = [
+        (first["weight"] + second["weight"], first, second)
+        for first in G.nodes[u].get_edges_to(m)
+        for second in m.get_edges_to(w)
+    ]
+    # prefer the pair that adds up to the shortcut weight exactly, G' keeps
+    # every shortcut ever found, including ones superseded later
+    exact = [c for c in candidates if c[0] == edge["weight"]]
+    _, first, second = min(exact or candidates, key=lambda c: c[0])
+    return first, second
+
+
+def backtrack_dijkstra_path(
+    context: QueryContext, label: str, reverse=False, G: Graph | None = None
+):
+    """
+    path from the search root to label (reverse=True), or from label back
+    to the root. when the overlay graph G is given, shortcuts are unpacked
+    so edges, weights, landmarks and obstacles come from the original edges.
+    """
+    space = context.forward
+    curr = context.index[label]
+    node_path = [label]
     edge_path = []
     weights = []
     obstacles = []
     landmarks = []
-    while curr.parent:
-        edge = curr.preceding_edge
-        curr = curr.parent
+    while space.parent_of(curr) != -1:
+        edge = space.edges[curr]
+        curr = space.parent[curr]
         if edge:
-            node_path.append(curr.label)
-            edge_path.append(edge["name"])
-            weights.append(edge["weight"])
-            obstacles.extend(edge["obstacles"])
-            landmarks.extend(edge["landmarks"])
+            parent = context.labels[curr]
+            hops = [(parent, edge)]
+            if G is not None:
+                hops = unpack_overlay_edge(G, parent, edge)
+            # walk the hop(s) from child back towards the root
+            for src, e in reversed(hops):
+                node_path.append(src)
+                edge_path.append(e["name"])
+                weights.append(e["weight"])
+                obstacles.extend(e["obstacles"])
+                landmarks.extend(e["landmarks"])
 
     if reverse is True:
         return {
@@ -473,13 +1265,33 @@ def get_joined_dijkstras_paths(src_path, mid: Node, target_path):
     }
 
 
-def run_CH(G: Graph, src: Node, target: Node):
-    G_prime, order = build_g_prime(G)
-    print("\n")
-    try:
-        path = query_graph(
-            G_prime, G_prime.nodes[src.label], G_prime.nodes[target.label], order
+def run_CH(
+    G: Graph,
+    src: Node,
+    target: Node,
+    index_path: str | None = None,
+    stats: Stats | None = None,
+):
+    """
+    build G' of G, query src -> target and print every step. all output goes
+    through stats.log, pass Stats() to run quietly
+    """
+    if stats is None:
+        stats = Stats(verbose=True)
+    G_prime, order = build_g_prime(G, stats=stats)
+    stats.log("\n")
+    for phase in stats.phases:
+        stats.log(
+            f"\t\t{phase.name:9} {phase.seconds * 1000:9.2f}ms  {phase.counters}"
         )
-        print(path)
-    except Exception as e:
-        print(e)
+    index = CHIndex.from_overlay(G_prime, order)
+    if index_path is not None:
+        num_bytes = write_ch_index(index, index_path)
+        stats.log(f"\t\tSaved CH index to {index_path} ({num_bytes} bytes)")
+    path = ch_shortest_path(index, src.label, target.label)
+    if path is None:
+        stats.log(f"no path from {src.label} to {target.label}")
+        return None
+    for k, v in path.items():
+        stats.log(f"\t\t{k:12}: {v}")
+    return path
@@ -0,0 +1,358 @@
+# customizable contraction hierarchies: one contraction, many metrics
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, replace
+from typing import Callable
+from GraphNode import Graph, NodeEdge
+from chQuery import CHIndex
+from compactGraph import CompactGraph, build_csr, edge_sources, weight_typecode
+import heapq
+import math
+
+# maps an original edge to its cost under some profile, math.inf to forbid it
+CostFunction = Callable[[NodeEdge], float]
+
+
+def shortest_distance(edge: NodeEdge) -> float:
+    return edge["weight"]
+
+
+def avoid_obstacles(*obstacles: str, penalty: float = math.inf) -> CostFunction:
+    """
+    cost function for customize: the edge weight, multiplied by penalty for
+    edges with any of the given obstacles (by default they become impassable)
+    e.g. avoid_obstacles("stairs", "no footpath")
+    """
+    avoided = set(obstacles)
+
+    def cost(edge: NodeEdge) -> float:
+        if avoided.intersection(edge["obstacles"]):
+            return math.inf if penalty == math.inf else edge["weight"] * penalty
+        return edge["weight"]
+
+    return cost
+
+
+def _fill_in(v: int, out_adj: list[set], in_adj: list[set]) -> int:
+    """arcs eliminating v would add, minus the arcs it removes"""
+    added = sum(
+        1
+        for u in in_adj[v]
+        for w in out_adj[v]
+        if u != w and w not in out_adj[u]
+    )
+    return added - len(in_adj[v]) - len(out_adj[v])
+
+
+def metric_independent_order(cg: CompactGraph) -> list[int]:
+    """
+    greedy elimination order that only looks at which edges exist, never at
+    their weights: the node whose elimination adds the fewest arcs (the edge
+    difference without witness searches) goes first. priorities are lazily
+    re-evaluated for the neighbours of every eliminated node.
+    """
+    n = cg.num_nodes()
+    out_adj = [set() for _ in range(n)]
+    in_adj = [set() for _ in range(n)]
+    for u in range(n):
+        for e in cg.out_edges(u):
+            v = cg.targets[e]
+            if u != v:
+                out_adj[u].add(v)
+                in_adj[v].add(u)
+
+    priority = [_fill_in(v, out_adj, in_adj) for v in range(n)]
+    queue = [(priority[v], v) for v in range(n)]
+    heapq.heapify(queue)
+    eliminated = [False] * n
+    order = []
+    while queue:
+        key, v = heapq.heappop(queue)
+        if eliminated[v] or key != priority[v]:
+            continue  # stale entry
+        eliminated[v] = True
+        order.append(v)
+        for u in in_adj[v]:
+            out_adj[u].discard(v)
+        for w in out_adj[v]:
+            in_adj[w].discard(v)
+        for u in in_adj[v]:
+            for w in out_adj[v]:
+                if u != w:
+                    out_adj[u].add(w)
+                    in_adj[w].add(u)
+        for x in in_adj[v] | out_adj[v]:
+            priority[x] = _fill_in(x, out_adj, in_adj)
+            heapq.heappush(queue, (priority[x], x))
+    return order
+
+
+@dataclass
+class CCHTopology:
+    """
+    metric-independent half of a customizable CH [Dibbelt et al., 2016].
+
+    nodes are eliminated in a fixed order without witness searches, so every
+    u -> v -> w path through an eliminated v gets an arc u -> w regardless of
+    weights. arc a joins arc_sources[a] -> arc_targets[a]; its candidate costs
+    are the original edges base_edges[base_offsets[a]:base_offsets[a + 1]]
+    and the lower triangles (triangle_first[i], triangle_second[i]) for i in
+    triangle_offsets[a]:triangle_offsets[a + 1], i.e. arc pairs u -> m -> w
+    with m eliminated before both u and w.
+
+    overlay holds the original edges (ids base_ids) and one "shortcut" edge
+    per arc (ids arc_ids); the up/down CSRs are over arcs and are shared by
+    every CHIndex that customize returns.
+    """
+
+    overlay: CompactGraph
+    rank: array
+    arc_sources: array
+    arc_targets: array
+    base_offsets: array
+    base_edges: array
+    triangle_offsets: array
+    triangle_first: array
+    triangle_second: array
+    # arcs sorted by the rank of their lower endpoint: both arcs of a lower
+    # triangle always come before the arc they form
+    customization_order: array
+    base_ids: array
+    arc_ids: array
+    sources: array
+    up_offsets: array
+    up_targets: array
+    up_arcs: array
+    down_offsets: array
+    down_targets: array
+    down_arcs: array
+
+    @classmethod
+    def from_graph(cls, G: Graph, order: list[str] | None = None) -> CCHTopology:
+        """
+        eliminate the nodes of G in order (by label), by default the order of
+        metric_independent_order. G is only read.
+        """
+        cg = CompactGraph.from_graph(G)
+        n = cg.num_nodes()
+        if order is None:
+            order_ids = metric_independent_order(cg)
+        else:
+            order_ids = [cg.index[label] for label in order]
+        rank = array("q", [0]) * n
+        for r, u in enumerate(order_ids):
+            rank[u] = r
+
+        arcs: dict[tuple[int, int], int] = {}
+        base: list[list[int]] = []
+        triangles: list[list[tuple[int, int]]] = []
+        out_adj = [set() for _ in range(n)]
+        in_adj = [set() for _ in range(n)]
+
+        def arc(u: int, w: int) -> int:
+            a = arcs.get((u, w))
+            if a is None:
+                a = arcs[(u, w)] = len(base)
+                base.append([])
+                triangles.append([])
+                out_adj[u].add(w)
+                in_adj[w].add(u)
+            return a
+
+        for u in range(n):
+            for e in cg.out_edges(u):
+                if u != cg.targets[e]:
+                    base[arc(u, cg.targets[e])].append(e)
+
+        for v in order_ids:
+            higher_in = [u for u in in_adj[v] if rank[u] > rank[v]]
+            higher_out = [w for w in out_adj[v] if rank[w] > rank[v]]
+            for u in higher_in:
+                for w in higher_out:
+                    if u != w:
+                        triangles[arc(u, w)].append((arcs[(u, v)], arcs[(v, w)]))
+
+        num_arcs = len(base)
+        arc_sources = array("q", [0]) * num_arcs
+        arc_targets = array("q", [0]) * num_arcs
+        for (u, w), a in arcs.items():
+            arc_sources[a] = u
+            arc_targets[a] = w
+        base_offsets, base_edges = _flatten(base)
+        triangle_offsets, triangle_pairs = _flatten(triangles)
+        triangle_first = array("q", (t[0] for t in triangle_pairs))
+        triangle_second = array("q", (t[1] for t in triangle_pairs))
+        customization_order = array(
+            "q",
+            sorted(
+                range(num_arcs),
+                key=lambda a: min(rank[arc_sources[a]], rank[arc_targets[a]]),
+            ),
+        )
+
+        overlay, base_ids, arc_ids = _overlay_graph(cg, arc_sources, arc_targets)
+        up = []
+        down = []
+        for a in range(num_arcs):
+            u, w = arc_sources[a], arc_targets[a]
+            if rank[w] > rank[u]:
+                up.append((u, w, 0, a))
+            else:
+                down.append((w, u, 0, a))
+        up_offsets, up_targets, _, up_arcs = build_csr(n, up, "q")
+        down_offsets, down_targets, _, down_arcs = build_csr(n, down, "q")
+
+        return cls(
+            overlay,
+            rank,
+            arc_sources,
+            arc_targets,
+            base_offsets,
+            array("q", base_edges),
+            triangle_offsets,
+            triangle_first,
+            triangle_second,
+            customization_order,
+            base_ids,
+            arc_ids,
+            edge_sources(overlay),
+            up_offsets,
+            up_targets,
+            up_arcs,
+            down_offsets,
+            down_targets,
+            down_arcs,
+        )
+
+    def num_arcs(self) -> int:
+        return len(self.arc_sources)
+
+
+def _flatten(lists: list[list]) -> tuple[array, list]:
+    """offsets array plus concatenated items of a list of lists"""
+    offsets = array("q", [0]) * (len(lists) + 1)
+    items = []
+    for i, values in enumerate(lists):
+        items.extend(values)
+        offsets[i + 1] = len(items)
+    return offsets, items
+
+
+def _overlay_graph(cg: CompactGraph, arc_sources: array, arc_targets: array):
+    """
+    CompactGraph with the edges of cg plus one shortcut edge per arc. returns
+    it with the new ids of the original edges and of the arcs.
+    """
+    m = cg.num_edges()
+    sources = edge_sources(cg)
+    edges = [(sources[e], cg.targets[e], 0, e) for e in range(m)]
+    for a, (u, w) in enumerate(zip(arc_sources, arc_targets)):
+        edges.append((u, w, 0, m + a))
+    offsets, targets, _, edge_ids = build_csr(cg.num_nodes(), edges, "q")
+
+    shortcut_name = cg.names.intern("shortcut")
+    no_tags = cg.tags.intern(())
+    edge_names = array("q", [shortcut_name]) * len(edge_ids)
+    edge_landmarks = array("q", [no_tags]) * len(edge_ids)
+    edge_obstacles = array("q", [no_tags]) * len(edge_ids)
+    # original weights stay visible to cost functions, shortcuts are weighed
+    # by customize
+    weights = array(cg.weights.typecode, [0]) * len(edge_ids)
+    base_ids = array("q", [0]) * m
+    arc_ids = array("q", [0]) * len(arc_sources)
+    for pos, e in enumerate(edge_ids):
+        if e < m:
+            base_ids[e] = pos
+            weights[pos] = cg.weights[e]
+            edge_names[pos] = cg.edge_names[e]
+            edge_landmarks[pos] = cg.edge_landmarks[e]
+            edge_obstacles[pos] = cg.edge_obstacles[e]
+        else:
+            arc_ids[e - m] = pos
+
+    overlay = replace(
+        cg,
+        offsets=offsets,
+        targets=targets,
+        weights=weights,
+        edge_names=edge_names,
+        edge_landmarks=edge_landmarks,
+        edge_obstacles=edge_obstacles,
+        edge_middle=array("q", [-1]) * len(edge_ids),
+    )
+    return overlay, base_ids, arc_ids
+
+
+def customize(topology: CCHTopology, cost: CostFunction = shortest_distance) -> CHIndex:
+    """
+    metric-dependent half: weigh every original edge with cost, then settle
+    all arcs bottom-up (basic customization). each arc takes the cheapest of
+    its original edges and lower triangles, so afterwards every arc weight
+    is the shortest u -> w distance through lower-ranked nodes and the result
+    answers ch_query / many_to_many / phast exactly like a contracted G'.
+    runs in O(#triangles) with no searches at all.
+    """
+    overlay = topology.overlay
+    m = len(topology.base_ids)
+    base_cost = [cost(overlay.edge_dict(topology.base_ids[e])) for e in range(m)]
+    typecode = weight_typecode(base_cost)
+
+    num_arcs = topology.num_arcs()
+    arc_weight = array(typecode, [0]) * num_arcs
+    # overlay edge that realises each arc: an original edge or its shortcut
+    winner = array("q", [-1]) * num_arcs
+    weights = array(typecode, [0]) * overlay.num_edges()
+    edge_middle = array("q", [-1]) * overlay.num_edges()
+    first = array("q", [-1]) * overlay.num_edges()
+    second = array("q", [-1]) * overlay.num_edges()
+    for e in range(m):
+        weights[topology.base_ids[e]] = base_cost[e]
+
+    base_offsets, base_edges = topology.base_offsets, topology.base_edges
+    tri_offsets = topology.triangle_offsets
+    tri_first, tri_second = topology.triangle_first, topology.triangle_second
+    for a in topology.customization_order:
+        best = math.inf
+        best_edge = -1
+        for i in range(base_offsets[a], base_offsets[a + 1]):
+            e = base_edges[i]
+            if base_cost[e] < best:
+                best = base_cost[e]
+                best_edge = topology.base_ids[e]
+        best_triangle = -1
+        for i in range(tri_offsets[a], tri_offsets[a + 1]):
+            d = arc_weight[tri_first[i]] + arc_weight[tri_second[i]]
+            if d < best:
+                best = d
+                best_triangle = i
+        if best_triangle != -1:
+            best_edge = topology.arc_ids[a]
+            child = tri_first[best_triangle]
+            first[best_edge] = winner[child]
+            second[best_edge] = winner[tri_second[best_triangle]]
+            edge_middle[best_edge] = topology.arc_targets[child]
+        arc_weight[a] = best
+        winner[a] = best_edge
+        if best_edge != -1:
+            weights[best_edge] = best
+
+    graph = replace(overlay, weights=weights, edge_middle=edge_middle)
+    up_weights = array(typecode, (arc_weight[a] for a in topology.up_arcs))
+    up_edges = array("q", (winner[a] for a in topology.up_arcs))
+    down_weights = array(typecode, (arc_weight[a] for a in topology.down_arcs))
+    down_edges = array("q", (winner[a] for a in topology.down_arcs))
+    return CHIndex(
+        graph,
+        topology.rank,
+        topology.up_offsets,
+        topology.up_targets,
+        up_weights,
+        up_edges,
+        topology.down_offsets,
+        topology.down_targets,
+        down_weights,
+        down_edges,
+        topology.sources,
+        first,
+        second,
+    )
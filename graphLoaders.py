@@ -0,0 +1,361 @@
+# streaming loaders from node/edge files and OSM XML into CompactGraph
+from __future__ import annotations
+from array import array
+from compactGraph import CompactGraph, StringTable, csr_permutation
+from bisect import bisect_left
+from heuristics import haversine_distance
+import csv
+import itertools
+import xml.etree.ElementTree as ET
+
+# rows parsed per batch before they are appended to the arrays
+CHUNK_SIZE = 65536
+
+# lists inside a single csv field (landmarks, obstacles)
+LIST_SEPARATOR = ";"
+
+NODE_COLUMNS = {
+    "label": ("label", "id", "node"),
+    "x": ("x", "lat", "latitude"),
+    "y": ("y", "lon", "lng", "longitude"),
+}
+EDGE_COLUMNS = {
+    "src": ("src", "source", "from", "u"),
+    "dst": ("dst", "target", "to", "v"),
+    "weight": ("weight", "length", "cost"),
+    "name": ("name",),
+    "landmarks": ("landmarks",),
+    "obstacles": ("obstacles",),
+}
+
+
+class _EdgeArrays:
+    """column-wise edge buffer: one slot per array, no per-edge objects"""
+
+    def __init__(self) -> None:
+        self.sources = array("q")
+        self.targets = array("q")
+        self.weights = array("q")
+        self.names = array("q")
+        self.landmarks = array("q")
+        self.obstacles = array("q")
+
+    def extend(self, sources, targets, weights, names, landmarks, obstacles):
+        if self.weights.typecode == "q" and any(
+            not isinstance(w, int) for w in weights
+        ):
+            self.weights = array("d", self.weights)
+        self.sources.extend(sources)
+        self.targets.extend(targets)
+        self.weights.extend(weights)
+        self.names.extend(names)
+        self.landmarks.extend(landmarks)
+        self.obstacles.extend(obstacles)
+
+    def compact_graph(
+        self,
+        labels: list[str],
+        index: dict[str, int],
+        xs: array,
+        ys: array,
+        names: StringTable,
+        tags: StringTable,
+    ) -> CompactGraph:
+        offsets, order = csr_permutation(len(labels), self.sources)
+
+        def gather(values: array) -> array:
+            return array(values.typecode, map(values.__getitem__, order))
+
+        return CompactGraph(
+            labels,
+            index,
+            xs,
+            ys,
+            offsets,
+            gather(self.targets),
+            gather(self.weights),
+            gather(self.names),
+            gather(self.landmarks),
+            gather(self.obstacles),
+            array("q", [-1]) * len(order),
+            names,
+            tags,
+        )
+
+
+def _column_map(header: list[str], columns: dict) -> dict[str, int]:
+    lowered = [h.strip().lower() for h in header]
+    found = {}
+    for key, aliases in columns.items():
+        for alias in aliases:
+            if alias in lowered:
+                found[key] = lowered.index(alias)
+                break
+    return found
+
+
+def _require(found: dict, keys: tuple[str, ...], path: str) -> None:
+    missing = [k for k in keys if k not in found]
+    if missing:
+        raise ValueError(f"{path}: header is missing column(s) {', '.join(missing)}")
+
+
+def _number(value: str):
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+
+def _delimiter(path: str, delimiter: str | None) -> str:
+    if delimiter is not None:
+        return delimiter
+    return "\t" if path.endswith((".tsv", ".tab")) else ","
+
+
+def _chunks(rows, size: int):
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_csv(
+    nodes_path: str,
+    edges_path: str,
+    directed: bool = False,
+    delimiter: str | None = None,
+    chunk_size: int = CHUNK_SIZE,
+) -> CompactGraph:
+    """
+    stream a node file (label, x, y) and an edge file (src, dst, weight and
+    optionally name, landmarks, obstacles) into a CompactGraph. both need a
+    header row; column names are matched case-insensitively against the
+    aliases in NODE_COLUMNS / EDGE_COLUMNS. landmarks and obstacles are
+    LIST_SEPARATOR separated. files ending in .tsv/.tab are read as tab
+    separated unless delimiter is given.
+    edges are undirected (added both ways, as Graph.add_edge does) unless
+    directed is set.
+    """
+    labels: list[str] = []
+    index: dict[str, int] = {}
+    xs = array("d")
+    ys = array("d")
+    with open(nodes_path, newline="", encoding="utf-8") as f:
+        rows = csv.reader(f, delimiter=_delimiter(nodes_path, delimiter))
+        cols = _column_map(next(rows), NODE_COLUMNS)
+        _require(cols, ("label", "x", "y"), nodes_path)
+        c_label, c_x, c_y = cols["label"], cols["x"], cols["y"]
+        for chunk in _chunks(rows, chunk_size):
+            for row in chunk:
+                label = row[c_label]
+                if label in index:
+                    raise ValueError(f"{nodes_path}: duplicate node {label!r}")
+                index[label] = len(labels)
+                labels.append(label)
+            xs.extend(float(row[c_x]) for row in chunk)
+            ys.extend(float(row[c_y]) for row in chunk)
+
+    names = StringTable()
+    tags = StringTable()
+    no_tags = tags.intern(())
+    edges = _EdgeArrays()
+    with open(edges_path, newline="", encoding="utf-8") as f:
+        rows = csv.reader(f, delimiter=_delimiter(edges_path, delimiter))
+        cols = _column_map(next(rows), EDGE_COLUMNS)
+        _require(cols, ("src", "dst", "weight"), edges_path)
+        c_src, c_dst, c_weight = cols["src"], cols["dst"], cols["weight"]
+        c_name = cols.get("name")
+        c_landmarks = cols.get("landmarks")
+        c_obstacles = cols.get("obstacles")
+
+        def tag_ids(chunk, column):
+            if column is None:
+                return [no_tags] * len(chunk)
+            return [
+                tags.intern(tuple(t for t in row[column].split(LIST_SEPARATOR) if t))
+                for row in chunk
+            ]
+
+        for chunk in _chunks(rows, chunk_size):
+            try:
+                src = [index[row[c_src]] for row in chunk]
+                dst = [index[row[c_dst]] for row in chunk]
+            except KeyError as e:
+                raise ValueError(f"{edges_path}: edge to unknown node {e}") from None
+            weights = [_number(row[c_weight]) for row in chunk]
+            if c_name is None:
+                name_ids = [names.intern("")] * len(chunk)
+            else:
+                name_ids = [names.intern(row[c_name]) for row in chunk]
+            landmark_ids = tag_ids(chunk, c_landmarks)
+            obstacle_ids = tag_ids(chunk, c_obstacles)
+            edges.extend(src, dst, weights, name_ids, landmark_ids, obstacle_ids)
+            if not directed:
+                edges.extend(dst, src, weights, name_ids, landmark_ids, obstacle_ids)
+
+    return edges.compact_graph(labels, index, xs, ys, names, tags)
+
+
+# OSM way tags that make a way impassable or hard for a wheelchair user,
+# following https://wiki.openstreetmap.org/wiki/Wheelchair_routing
+ROUGH_SURFACES = {"gravel", "unpaved", "dirt", "grass", "sand", "mud", "cobblestone"}
+BAD_SMOOTHNESS = {"bad", "very_bad", "horrible", "very_horrible", "impassable"}
+
+# every obstacle string wheelchair_obstacles can produce, the first two are
+# also the ones used by the hand-made graphs
+WHEELCHAIR_OBSTACLES = (
+    "stairs",
+    "no footpath",
+    "not wheelchair accessible",
+    *(f"{surface} surface" for surface in sorted(ROUGH_SURFACES)),
+    "uneven surface",
+    "steep incline",
+    "raised kerb",
+)
+
+
+def wheelchair_obstacles(way_tags: dict[str, str]) -> tuple[str, ...]:
+    """obstacle strings (as used by the hand-made graphs) for a way's tags"""
+    obstacles = []
+    if way_tags.get("highway") == "steps":
+        obstacles.append("stairs")
+    if way_tags.get("sidewalk") in ("no", "none") or way_tags.get("foot") == "no":
+        obstacles.append("no footpath")
+    if way_tags.get("wheelchair") == "no":
+        obstacles.append("not wheelchair accessible")
+    if way_tags.get("surface") in ROUGH_SURFACES:
+        obstacles.append(f"{way_tags['surface']} surface")
+    if way_tags.get("smoothness") in BAD_SMOOTHNESS:
+        obstacles.append("uneven surface")
+    incline = way_tags.get("incline")
+    if incline is not None:
+        value = incline.rstrip("%°")
+        try:
+            steep = abs(float(value)) > 6
+        except ValueError:
+            steep = value == "steep"
+        if steep:
+            obstacles.append("steep incline")
+    if way_tags.get("kerb") == "raised":
+        obstacles.append("raised kerb")
+    return tuple(obstacles)
+
+
+def _poi_name(node_tags: dict[str, str]) -> str | None:
+    if "name" in node_tags and (
+        "amenity" in node_tags or "shop" in node_tags or "tourism" in node_tags
+    ):
+        return node_tags["name"]
+    return None
+
+
+def load_osm(path: str, highways: set[str] | None = None) -> CompactGraph:
+    """
+    stream a local OSM XML extract into a CompactGraph. every pair of
+    consecutive nodes of a highway way becomes an edge (both ways unless the
+    way is oneway) weighted by its haversine length in metres. obstacles come
+    from the wheelchair related way tags (wheelchair_obstacles) and landmarks
+    from named amenity/shop/tourism nodes on the way. highways optionally
+    restricts the highway=* values that are kept. nodes are labelled by their
+    OSM id and only nodes used by a kept way are part of the graph.
+    """
+    # OSM id of each node slot, way refs are found by bisecting these
+    ids = array("q")
+    lookup: tuple[array, array | None] | None = None
+    lats = array("d")
+    lons = array("d")
+    poi: dict[int, str] = {}
+
+    names = StringTable()
+    tags = StringTable()
+    # edges refer to the raw node slots until unused nodes are dropped
+    raw = _EdgeArrays()
+
+    events = ET.iterparse(path, events=("start", "end"))
+    _, root = next(events)
+    for event, elem in events:
+        if event != "end":
+            continue
+        if elem.tag == "node":
+            slot = len(lats)
+            ids.append(int(elem.get("id")))
+            lookup = None
+            lats.append(float(elem.get("lat")))
+            lons.append(float(elem.get("lon")))
+            node_tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+            name = _poi_name(node_tags) if node_tags else None
+            if name is not None:
+                poi[slot] = name
+            # drop everything parsed so far, only the arrays are kept
+            root.clear()
+        elif elem.tag == "way":
+            way_tags = {t.get("k"): t.get("v") for t in elem.iter("tag")}
+            highway = way_tags.get("highway")
+            if highway is not None and (highways is None or highway in highways):
+                if lookup is None:
+                    lookup = _id_lookup(ids)
+                refs = []
+                for nd in elem.iter("nd"):
+                    slot = _find_slot(lookup, int(nd.get("ref")))
+                    if slot is not None:
+                        refs.append(slot)
+                _add_way(raw, refs, way_tags, lats, lons, poi, names, tags)
+            root.clear()
+        elif elem.tag == "relation":
+            root.clear()
+
+    used = sorted(set(raw.sources) | set(raw.targets))
+    slot_to_id = array("q", [-1]) * len(lats)
+    for i, slot in enumerate(used):
+        slot_to_id[slot] = i
+    labels = [str(ids[slot]) for slot in used]
+    index = {label: i for i, label in enumerate(labels)}
+    raw.sources = array("q", map(slot_to_id.__getitem__, raw.sources))
+    raw.targets = array("q", map(slot_to_id.__getitem__, raw.targets))
+    xs = array("d", map(lats.__getitem__, used))
+    ys = array("d", map(lons.__getitem__, used))
+    return raw.compact_graph(labels, index, xs, ys, names, tags)
+
+
+def _id_lookup(ids: array) -> tuple[array, array | None]:
+    """
+    (sorted ids, slot of each sorted id) for _find_slot. extracts list nodes
+    by increasing id, then ids is used as is and no permutation is built.
+    """
+    if all(a < b for a, b in zip(ids, itertools.islice(ids, 1, None))):
+        return ids, None
+    slots = array("q", sorted(range(len(ids)), key=ids.__getitem__))
+    return array("q", map(ids.__getitem__, slots)), slots
+
+
+def _find_slot(lookup: tuple[array, array | None], osm_id: int) -> int | None:
+    keys, slots = lookup
+    i = bisect_left(keys, osm_id)
+    if i == len(keys) or keys[i] != osm_id:
+        return None
+    return i if slots is None else slots[i]
+
+
+def _add_way(raw, refs, way_tags, lats, lons, poi, names, tags) -> None:
+    name_id = names.intern(way_tags.get("name", way_tags["highway"]))
+    obstacle_id = tags.intern(wheelchair_obstacles(way_tags))
+    oneway = way_tags.get("oneway")
+    src, dst, weights, landmark_ids = [], [], [], []
+    for a, b in zip(refs, refs[1:]):
+        if a == b:
+            continue
+        if oneway == "-1":
+            a, b = b, a
+        landmarks = tuple(poi[n] for n in (a, b) if n in poi)
+        src.append(a)
+        dst.append(b)
+        weights.append(
+            round(haversine_distance((lats[a], lons[a]), (lats[b], lons[b])) * 1000)
+        )
+        landmark_ids.append(tags.intern(landmarks))
+    n = len(src)
+    raw.extend(src, dst, weights, [name_id] * n, landmark_ids, [obstacle_id] * n)
+    if oneway not in ("yes", "true", "1", "-1"):
+        raw.extend(dst, src, weights, [name_id] * n, landmark_ids, [obstacle_id] * n)
@@ -1,5 +1,6 @@
 from GraphNode import Graph, Node
 from contractionHierarchy import clr, run_CH
+from heuristics import admissible_scale
 from search import aSTAR
 import random
 
@@ -174,7 +175,11 @@ if __name__ == "__main__":
     print(f"\thaversine: {(abs(h_dist - measured_dist)):.2f}")
 
     print("\nnow running ASTAR using haversine distance heuristic")
-    path_info = aSTAR(G_astar, G_astar.nodes["A"], G_astar.nodes["AE"], "haversine")
+    # haversine is in km, edge weights are not: scale it to weight units
+    h_scale = admissible_scale(G_astar, "haversine")
+    path_info = aSTAR(
+        G_astar, G_astar.nodes["A"], G_astar.nodes["AE"], "haversine", h_scale=h_scale
+    )
     if path_info:
         for k, v in path_info.items():
             print(f"{k:13}:\t {v}")
@@ -187,18 +192,23 @@ if __name__ == "__main__":
 
     print("\n")
 
-    def run_astar_n_times(G, nodes, n, h):
-        """run a* a number of times and return the average runtime in ms"""
+    def run_astar_n_times(G, nodes, n, h, seed=0):
+        """
+        run a* on n seeded random pairs and print the average runtime in ms.
+        see benchmark.py for larger graphs and latency percentiles
+        """
         print(f"running: {h} {n} times")
+        rnd = random.Random(seed)
+        scale = admissible_scale(G, h)
         times = []
         for _ in range(n):
-            idx1 = random.randint(0, len(nodes) - 1)
-            idx2 = random.randint(0, len(nodes) - 1)
-            p = aSTAR(G, G.nodes[nodes[idx1]], G.nodes[nodes[idx2]], h)
+            idx1 = rnd.randrange(len(nodes))
+            idx2 = rnd.randrange(len(nodes))
+            p = aSTAR(G, G.nodes[nodes[idx1]], G.nodes[nodes[idx2]], h, h_scale=scale)
             if p:
                 times.append(p["time"])
             G.reset_nodes()
-        print(sum(times) / len(times))
+        print(f"{sum(times) / len(times):.4f}ms")
 
     run_astar_n_times(G_astar, nodes, 100, "euclidean")
     run_astar_n_times(G_astar, nodes, 100, "manhattan")
@@ -0,0 +1,116 @@
+# many-to-many distance tables on top of the contraction hierarchy
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass, field
+from chQuery import CHIndex, upward_search
+from compactGraph import edge_path_info
+from queryContext import QueryContext, default_context
+import math
+
+
+@dataclass
+class DistanceTable:
+    """
+    |sources| x |targets| result of many_to_many. dist and meet are flat,
+    row-major arrays: entry i * len(targets) + j belongs to the pair
+    (sources[i], targets[j]). meet holds the node where the two upward
+    searches of the pair met (-1 if unreachable).
+    """
+
+    index: CHIndex
+    sources: list[int]
+    targets: list[int]
+    dist: array
+    meet: array
+    # upward search trees (node id -> parent edge id), kept only when
+    # many_to_many is asked for parents so that pairs can be unpacked
+    forward_parents: list[dict[int, int]] = field(default_factory=list)
+    backward_parents: list[dict[int, int]] = field(default_factory=list)
+
+    def distance(self, i: int, j: int) -> float:
+        return self.dist[i * len(self.targets) + j]
+
+    def rows(self) -> list[list[float]]:
+        n = len(self.targets)
+        return [list(self.dist[i * n : (i + 1) * n]) for i in range(len(self.sources))]
+
+    def path(self, i: int, j: int):
+        """unpacked path dict (as from ch_shortest_path) of pair (i, j), or None"""
+        if not self.forward_parents:
+            raise ValueError("distance table was built without parents")
+        m = self.meet[i * len(self.targets) + j]
+        if m == -1:
+            return None
+
+        sources = self.index.sources
+        targets = self.index.graph.targets
+        edges = []
+        curr = m
+        forward = self.forward_parents[i]
+        while curr in forward:
+            e = forward[curr]
+            edges.append(e)
+            curr = sources[e]
+        edges.reverse()
+        curr = m
+        backward = self.backward_parents[j]
+        while curr in backward:
+            e = backward[curr]
+            edges.append(e)
+            curr = targets[e]
+        edges = self.index.unpack(edges)
+        return edge_path_info(self.index.graph, self.sources[i], edges)
+
+
+def _search_tree(context: QueryContext, settled: list, forward: bool) -> dict:
+    space = context.forward if forward else context.backward
+    return {u: space.edges[u] for u, _ in settled if space.parent_of(u) != -1}
+
+
+def many_to_many(
+    index: CHIndex,
+    sources: list[str],
+    targets: list[str],
+    parents: bool = False,
+    context: QueryContext | None = None,
+) -> DistanceTable:
+    """
+    bucket based many-to-many shortest paths [Knopp et al., 2007]:
+        1. one backward upward search per target t_j; every node v it settles
+           gets the entry (j, d(v, t_j)) in bucket[v]
+        2. one forward upward search per source s_i; scanning the bucket of
+           every settled node u gives d(s_i, u) + d(u, t_j) candidates
+    costs |S| + |T| upward searches instead of |S| * |T| queries.
+    """
+    if context is None:
+        context = default_context(index, index.new_context)
+    source_ids = [index.node_id(label) for label in sources]
+    target_ids = [index.node_id(label) for label in targets]
+    num_targets = len(target_ids)
+
+    buckets: dict[int, list[tuple[int, float]]] = {}
+    backward_parents = []
+    for j, t in enumerate(target_ids):
+        settled = upward_search(index, t, False, context)
+        for v, d in settled:
+            buckets.setdefault(v, []).append((j, d))
+        if parents:
+            backward_parents.append(_search_tree(context, settled, False))
+
+    dist = array("d", [math.inf]) * (len(source_ids) * num_targets)
+    meet = array("q", [-1]) * (len(source_ids) * num_targets)
+    forward_parents = []
+    for i, s in enumerate(source_ids):
+        row = i * num_targets
+        settled = upward_search(index, s, True, context)
+        for u, d in settled:
+            for j, d_target in buckets.get(u, ()):
+                if d + d_target < dist[row + j]:
+                    dist[row + j] = d + d_target
+                    meet[row + j] = u
+        if parents:
+            forward_parents.append(_search_tree(context, settled, True))
+
+    return DistanceTable(
+        index, source_ids, target_ids, dist, meet, forward_parents, backward_parents
+    )
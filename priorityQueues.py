@@ -0,0 +1,258 @@
+# lock-free, addressable priority queues for the searches
+from __future__ import annotations
+from dataclasses import dataclass
+import heapq
+
+
+@dataclass
+class QueueStats:
+    """heap operation counters, comparable between backends"""
+
+    inserts: int = 0
+    updates: int = 0  # key changes of items already queued
+    pops: int = 0
+    stale_pops: int = 0  # outdated entries skipped by the lazy backends
+    max_size: int = 0
+
+    def __add__(self, other: QueueStats) -> QueueStats:
+        return QueueStats(
+            self.inserts + other.inserts,
+            self.updates + other.updates,
+            self.pops + other.pops,
+            self.stale_pops + other.stale_pops,
+            max(self.max_size, other.max_size),
+        )
+
+
+class HeapQueue:
+    """
+    heapq with lazy deletion. push never touches entries already in the heap:
+    changing a key adds a new entry and the old one is skipped when popped.
+    cheapest per operation, but the heap holds every outdated entry too.
+
+    all queues share this interface. items must be hashable and keys
+    comparable; equal keys are broken by comparing the items.
+    """
+
+    def __init__(self) -> None:
+        self.heap: list = []
+        self.keys: dict = {}
+        self.stats = QueueStats()
+
+    def push(self, item, key) -> None:
+        """queue item with key, or change its key if it is already queued"""
+        if item in self.keys:
+            self.stats.updates += 1
+        else:
+            self.stats.inserts += 1
+        self.keys[item] = key
+        heapq.heappush(self.heap, (key, item))
+        self.stats.max_size = max(self.stats.max_size, len(self.heap))
+
+    def _skip_stale(self) -> None:
+        heap = self.heap
+        while heap:
+            key, item = heap[0]
+            if item in self.keys and self.keys[item] == key:
+                return
+            heapq.heappop(heap)
+            self.stats.stale_pops += 1
+
+    def peek(self):
+        """(key, item) with the smallest key, without removing it"""
+        self._skip_stale()
+        return self.heap[0]
+
+    def pop(self):
+        """remove and return (key, item) with the smallest key"""
+        self._skip_stale()
+        key, item = heapq.heappop(self.heap)
+        del self.keys[item]
+        self.stats.pops += 1
+        return key, item
+
+    def __contains__(self, item) -> bool:
+        return item in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+class IndexedHeap:
+    """
+    binary heap with a position index, so a key change moves the item's one
+    entry up or down in place (a real decrease-key). the heap never holds
+    more than one entry per item.
+    """
+
+    def __init__(self) -> None:
+        self.heap: list = []  # (key, item)
+        self.position: dict = {}
+        self.stats = QueueStats()
+
+    def push(self, item, key) -> None:
+        """queue item with key, or change its key if it is already queued"""
+        pos = self.position.get(item)
+        if pos is None:
+            self.stats.inserts += 1
+            self.heap.append((key, item))
+            self.position[item] = len(self.heap) - 1
+            self._sift_up(len(self.heap) - 1)
+            self.stats.max_size = max(self.stats.max_size, len(self.heap))
+            return
+        self.stats.updates += 1
+        old_key = self.heap[pos][0]
+        self.heap[pos] = (key, item)
+        if (key, item) < (old_key, item):
+            self._sift_up(pos)
+        else:
+            self._sift_down(pos)
+
+    def peek(self):
+        """(key, item) with the smallest key, without removing it"""
+        return self.heap[0]
+
+    def pop(self):
+        """remove and return (key, item) with the smallest key"""
+        heap = self.heap
+        top = heap[0]
+        last = heap.pop()
+        del self.position[top[1]]
+        if heap:
+            heap[0] = last
+            self.position[last[1]] = 0
+            self._sift_down(0)
+        self.stats.pops += 1
+        return top
+
+    def _sift_up(self, pos: int) -> None:
+        heap, position = self.heap, self.position
+        entry = heap[pos]
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if entry < heap[parent]:
+                heap[pos] = heap[parent]
+                position[heap[pos][1]] = pos
+                pos = parent
+            else:
+                break
+        heap[pos] = entry
+        position[entry[1]] = pos
+
+    def _sift_down(self, pos: int) -> None:
+        heap, position = self.heap, self.position
+        size = len(heap)
+        entry = heap[pos]
+        while True:
+            child = 2 * pos + 1
+            if child >= size:
+                break
+            if child + 1 < size and heap[child + 1] < heap[child]:
+                child += 1
+            if heap[child] < entry:
+                heap[pos] = heap[child]
+                position[heap[pos][1]] = pos
+                pos = child
+            else:
+                break
+        heap[pos] = entry
+        position[entry[1]] = pos
+
+    def __contains__(self, item) -> bool:
+        return item in self.position
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+
+class RadixHeap:
+    """
+    monotone radix heap [Ahuja et al., 1990] for non-negative integer keys,
+    as produced by dijkstra's on integer edge weights: no key may be pushed
+    below the last popped one. an entry lives in the bucket of the highest
+    bit in which its key differs from that last key; popping only ever
+    redistributes the first non-empty bucket, so every entry moves at most
+    O(log C) times instead of being sifted on every operation. key changes
+    are lazy, as in HeapQueue.
+    """
+
+    def __init__(self) -> None:
+        self.buckets: list[list] = [[] for _ in range(65)]
+        self.keys: dict = {}
+        self.last = 0
+        self.size = 0  # entries held, including outdated ones
+        self.stats = QueueStats()
+
+    def _bucket(self, key: int) -> int:
+        return (key ^ self.last).bit_length()
+
+    def push(self, item, key: int) -> None:
+        """queue item with key, or change its key if it is already queued"""
+        if key < self.last or not float(key).is_integer():
+            raise ValueError(
+                f"radix heap needs integer keys >= {self.last} (got {key!r})"
+            )
+        key = int(key)
+        if item in self.keys:
+            self.stats.updates += 1
+        else:
+            self.stats.inserts += 1
+        self.keys[item] = key
+        self.buckets[self._bucket(key)].append((key, item))
+        self.size += 1
+        self.stats.max_size = max(self.stats.max_size, self.size)
+
+    def _refill(self) -> None:
+        """move the live minimum into bucket 0, dropping outdated entries"""
+        buckets = self.buckets
+        while True:
+            live = [e for e in buckets[0] if self.keys.get(e[1]) == e[0]]
+            self.stats.stale_pops += len(buckets[0]) - len(live)
+            self.size -= len(buckets[0]) - len(live)
+            buckets[0] = live
+            if live:
+                return
+            i = next(i for i in range(1, len(buckets)) if buckets[i])
+            entries = buckets[i]
+            buckets[i] = []
+            live = [e for e in entries if self.keys.get(e[1]) == e[0]]
+            self.stats.stale_pops += len(entries) - len(live)
+            self.size -= len(entries) - len(live)
+            if live:
+                self.last = min(live)[0]
+                for entry in live:
+                    buckets[self._bucket(entry[0])].append(entry)
+
+    def peek(self):
+        """(key, item) with the smallest key, without removing it"""
+        # no redistribution here: last may only move when the minimum is
+        # popped, keys between the last popped one and this one stay legal
+        for bucket in self.buckets:
+            live = [e for e in bucket if self.keys.get(e[1]) == e[0]]
+            if live:
+                return min(live)
+        raise IndexError("peek from an empty queue")
+
+    def pop(self):
+        """remove and return (key, item) with the smallest key"""
+        self._refill()
+        bucket = self.buckets[0]
+        entry = min(bucket)
+        bucket.remove(entry)
+        del self.keys[entry[1]]
+        self.size -= 1
+        self.stats.pops += 1
+        return entry
+
+    def __contains__(self, item) -> bool:
+        return item in self.keys
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+
+QUEUES = {
+    "heapq": HeapQueue,
+    "indexed": IndexedHeap,
+    "radix": RadixHeap,
+}
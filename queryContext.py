@@ -0,0 +1,138 @@
+# reusable, epoch-stamped search state
+from __future__ import annotations
+from array import array
+from GraphNode import Graph
+from typing import Callable
+import math
+import threading
+import weakref
+
+
+class SearchSpace:
+    """
+    distance/parent labels for a single search direction, stored in flat
+    arrays indexed by node id. every write stamps the slot with the current
+    epoch, so a slot whose stamp differs from the epoch is treated as
+    untouched and a reset is just `epoch += 1` instead of an O(V) sweep.
+    """
+
+    __slots__ = ("dist", "parent", "edges", "stamp", "epoch")
+
+    def __init__(self, num_nodes: int) -> None:
+        self.dist = array("d", [math.inf]) * num_nodes
+        self.parent = array("q", [-1]) * num_nodes
+        # preceding edge objects for searches over Graph (NodeEdge dicts) or
+        # edge ids for searches over CompactGraph / CHIndex
+        self.edges: list = [None] * num_nodes
+        self.stamp = array("q", [0]) * num_nodes
+        self.epoch = 1
+
+    def reset(self) -> None:
+        self.epoch += 1
+
+    def reached(self, u: int) -> bool:
+        return self.stamp[u] == self.epoch
+
+    def get(self, u: int) -> float:
+        """tentative distance of u, inf if u was not reached in this epoch"""
+        if self.stamp[u] == self.epoch:
+            return self.dist[u]
+        return math.inf
+
+    def set(self, u: int, dist: float, parent: int = -1, edge=None) -> None:
+        self.dist[u] = dist
+        self.parent[u] = parent
+        self.edges[u] = edge
+        self.stamp[u] = self.epoch
+
+    def parent_of(self, u: int) -> int:
+        if self.stamp[u] == self.epoch:
+            return self.parent[u]
+        return -1
+
+
+class QueryContext:
+    """
+    per-caller workspace for aSTAR, dijkstra and the CH query. the graph
+    itself is only ever read, so one loaded graph can serve many concurrent
+    queries as long as every thread uses its own context.
+
+        - forward:   labels of the (forward) search
+        - backward:  labels of the backward search of bidirectional queries
+        - estimates: cached heuristic values h(n) for aSTAR
+        - coordinates: node positions by id, for vectorised heuristics
+
+    node ids are fixed when the context is built; nodes added to the graph
+    afterwards need a new context.
+    """
+
+    def __init__(self, labels: list[str], index: dict[str, int] | None = None):
+        self.labels = labels
+        if index is None:
+            index = {label: i for i, label in enumerate(labels)}
+        self.index = index
+        n = len(labels)
+        self.forward = SearchSpace(n)
+        self.backward = SearchSpace(n)
+        self.estimates = SearchSpace(n)
+        self._coordinates: tuple[array, array] | None = None
+
+    @classmethod
+    def for_graph(cls, G: Graph) -> QueryContext:
+        return cls(list(G.nodes.keys()))
+
+    def reset(self) -> None:
+        self.forward.reset()
+        self.backward.reset()
+        self.estimates.reset()
+
+    def coordinates(self, G: Graph) -> tuple[array, array]:
+        """x and y of every node by id, read from G on first use"""
+        if self._coordinates is None:
+            nodes = [G.nodes[label] for label in self.labels]
+            self._coordinates = (
+                array("d", (float(node.x) for node in nodes)),
+                array("d", (float(node.y) for node in nodes)),
+            )
+        return self._coordinates
+
+    def node_id(self, label: str) -> int:
+        return self.index[label]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+
+# contexts of calls that were not given one: one per thread, owner and slot,
+# so threads never share search state
+_thread_contexts = threading.local()
+
+
+def default_context(
+    owner, new: Callable[[], QueryContext], slot: int = 0
+) -> QueryContext:
+    """
+    the calling thread's context for owner (a Graph, CHIndex or
+    ContractionGraph), made with new() on first use and kept while owner
+    lives, so searches called without a context do not allocate O(V) arrays
+    every time. callers that need two contexts at once take different slots.
+    a Graph whose number of nodes changed gets a new context.
+    """
+    cache = getattr(_thread_contexts, "cache", None)
+    if cache is None:
+        cache = _thread_contexts.cache = {}
+    key = (id(owner), slot)
+    entry = cache.get(key)
+    if entry is not None:
+        ref, context = entry
+        nodes = getattr(owner, "nodes", None)
+        if ref() is owner and (nodes is None or len(nodes) == len(context)):
+            return context
+
+    def forget(ref: weakref.ref) -> None:
+        if cache.get(key, (None,))[0] is ref:
+            del cache[key]
+
+    context = new()
+    cache[key] = (weakref.ref(owner, forget), context)
+    return context
@@ -0,0 +1,323 @@
+# local asyncio HTTP/JSON routing service over the A* and CH query engines
+from __future__ import annotations
+from GraphNode import Graph
+from batchQuery import BatchRouter
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from customizableCH import (
+    CCHTopology,
+    CostFunction,
+    avoid_obstacles,
+    customize,
+    shortest_distance,
+)
+from graphLoaders import WHEELCHAIR_OBSTACLES, load_csv, load_osm
+from searchStats import Stats, percentiles
+from urllib.parse import parse_qs, urlsplit
+import argparse
+import asyncio
+import json
+import time
+
+# profile name -> edge cost, each customized once into its own CHIndex. the
+# wheelchair profile treats every obstacle graphLoaders can tag as impassable
+PROFILES: dict[str, CostFunction] = {
+    "shortest": shortest_distance,
+    "wheelchair": avoid_obstacles(*WHEELCHAIR_OBSTACLES),
+}
+ENGINES = ("ch", "astar")
+
+BATCH_WINDOW = 0.002  # seconds a batch waits for more requests
+MAX_BATCH = 64
+LATENCY_WINDOW = 10_000  # latest request latencies kept for /stats
+DISPATCH_THREADS = 4  # batches waiting on the worker pool at the same time
+
+STATUS_TEXT = {
+    200: "OK",
+    400: "Bad Request",
+    404: "Not Found",
+    405: "Not Allowed",
+    500: "Internal Server Error",
+}
+
+
+class RouteService:
+    """
+    answers route requests on G, which is loaded and preprocessed once:
+    every profile is a customization of one CCH topology (ch engine), and
+    the shortest profile can also be routed with aSTAR on G (astar engine).
+
+    searches run on a BatchRouter: workers processes that attach to every
+    profile's index in shared memory (and inherit G for aSTAR), so they
+    scale past the GIL. route() calls that arrive within batch_window of
+    each other (up to max_batch) are sent to the pool as one batch, one
+    pair per task so a batch spreads over all workers. batches are handed
+    to the pool from dispatch threads that only wait for results, so the
+    event loop never searches and one long batch does not hold up the
+    next. a request for an (s, t, profile, engine) that is already queued
+    or running waits for that search instead of starting another one.
+    """
+
+    def __init__(
+        self,
+        G: Graph,
+        profiles: dict[str, CostFunction] | None = None,
+        workers: int | None = None,
+        batch_window: float = BATCH_WINDOW,
+        max_batch: int = MAX_BATCH,
+        heuristic: str = "haversine",
+    ) -> None:
+        self.G = G
+        self.profiles = dict(PROFILES if profiles is None else profiles)
+        topology = CCHTopology.from_graph(G)
+        indices = {
+            name: customize(topology, cost) for name, cost in self.profiles.items()
+        }
+        self.router = BatchRouter(
+            indices, workers, chunk_size=1, graph=G, heuristic=heuristic
+        )
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.executor = ThreadPoolExecutor(DISPATCH_THREADS)
+        self.stats = Stats()
+        self.latencies_ms: deque[float] = deque(maxlen=LATENCY_WINDOW)
+        self._in_flight: dict[tuple, asyncio.Future] = {}
+        self._queue: asyncio.Queue | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    # --- searching, on dispatch threads ---
+
+    def _run_batch(self, keys: list[tuple]) -> list:
+        """results of keys in order, an exception for a group that failed"""
+        groups: dict[tuple[str, str], list[int]] = {}
+        for i, (_, _, profile, engine) in enumerate(keys):
+            groups.setdefault((profile, engine), []).append(i)
+        results: list = [None] * len(keys)
+        for (profile, engine), members in groups.items():
+            pairs = [keys[i][:2] for i in members]
+            try:
+                if engine == "astar":
+                    found = list(self.router.astar_paths(pairs))
+                else:
+                    found = list(self.router.paths(pairs, profile))
+            except Exception as e:
+                found = [e] * len(members)
+            for i, result in zip(members, found):
+                results[i] = result
+        return results
+
+    # --- batching and coalescing, on the event loop ---
+
+    def _check(self, src: str, dst: str, profile: str, engine: str) -> None:
+        if profile not in self.profiles:
+            raise ValueError(f"unknown profile {profile!r}")
+        if engine not in ENGINES:
+            raise ValueError(f"unknown engine {engine!r}")
+        if engine == "astar" and self.profiles[profile] is not shortest_distance:
+            raise ValueError("the astar engine only routes the shortest profile")
+        for label in (src, dst):
+            if label not in self.G.nodes:
+                raise KeyError(label)
+
+    async def route(
+        self, src: str, dst: str, profile: str = "shortest", engine: str = "ch"
+    ):
+        """
+        path dict (as from ch_shortest_path / aSTAR) from src to dst, or None
+        if dst cannot be reached. raises ValueError for an unknown profile or
+        engine and KeyError for an unknown node.
+        """
+        self._check(src, dst, profile, engine)
+        self.stats.add("requests")
+        key = (src, dst, profile, engine)
+        future = self._in_flight.get(key)
+        if future is None:
+            if self._queue is None:
+                self._queue = asyncio.Queue()
+                self._spawn(self._batcher())
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            self._queue.put_nowait(key)
+        else:
+            self.stats.add("coalesced")
+        # a cancelled caller must not cancel the search others wait for
+        return await asyncio.shield(future)
+
+    def _spawn(self, coro) -> None:
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self._spawn(self._dispatch(batch))
+
+    async def _dispatch(self, keys: list[tuple]) -> None:
+        self.stats.add("batches")
+        self.stats.add("searches", len(keys))
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, self._run_batch, keys)
+        except Exception as e:
+            results = [e] * len(keys)
+        for key, result in zip(keys, results):
+            future = self._in_flight.pop(key)
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    # --- http ---
+
+    def stats_dict(self) -> dict:
+        return {
+            "counters": dict(self.stats.counters),
+            "latency_ms": percentiles(list(self.latencies_ms)),
+        }
+
+    async def _respond(self, method: str, target: str) -> tuple[int, dict]:
+        if method != "GET":
+            return 405, {"error": "only GET is supported"}
+        url = urlsplit(target)
+        if url.path == "/stats":
+            return 200, self.stats_dict()
+        if url.path != "/route":
+            return 404, {"error": f"no such endpoint {url.path}"}
+
+        query = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        if "from" not in query or "to" not in query:
+            return 400, {"error": "from and to are required"}
+        src, dst = query["from"], query["to"]
+        profile = query.get("profile", "shortest")
+        engine = query.get("engine", "ch")
+        start = time.perf_counter()
+        try:
+            path_info = await self.route(src, dst, profile, engine)
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except KeyError as e:
+            return 404, {"error": f"unknown node {e}"}
+        except Exception as e:
+            return 500, {"error": f"{type(e).__name__}: {e}"}
+        latency_ms = (time.perf_counter() - start) * 1000
+        self.latencies_ms.append(latency_ms)
+
+        body = {"from": src, "to": dst, "profile": profile, "engine": engine}
+        if path_info is None:
+            return 404, {**body, "error": "no route"}
+        return 200, {**body, "latency_ms": latency_ms, **path_info}
+
+    async def handle(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """serve HTTP/1.1 requests on one connection until it is closed"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip().lower()
+
+                parts = request_line.decode("latin-1").split()
+                if len(parts) != 3:
+                    status, body = 400, {"error": "malformed request line"}
+                    keep_alive = False
+                else:
+                    method, target, version = parts
+                    status, body = await self._respond(method, target)
+                    if version == "HTTP/1.0":
+                        keep_alive = headers.get("connection") == "keep-alive"
+                    else:
+                        keep_alive = headers.get("connection") != "close"
+
+                payload = json.dumps(body).encode("utf-8")
+                head = (
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                )
+                writer.write(head.encode("latin-1") + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        async with server:
+            await server.serve_forever()
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+        self.router.close()
+
+
+def load_graph(args: argparse.Namespace) -> Graph:
+    if args.osm:
+        return load_osm(args.osm).to_graph()
+    if args.nodes or args.edges:
+        if not (args.nodes and args.edges):
+            raise SystemExit("--nodes and --edges go together")
+        return load_csv(args.nodes, args.edges, args.directed).to_graph()
+    from main import create_map_graph
+
+    return create_map_graph()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(
+        description="serve /route?from=&to=&profile=&engine= as JSON"
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--osm", help="OSM XML extract to route on")
+    parser.add_argument("--nodes", help="node csv/tsv (with --edges)")
+    parser.add_argument("--edges", help="edge csv/tsv (with --nodes)")
+    parser.add_argument("--directed", action="store_true", help="csv edges are one-way")
+    parser.add_argument("--workers", type=int, help="search processes (all cores)")
+    parser.add_argument("--batch-window-ms", type=float, default=BATCH_WINDOW * 1000)
+    parser.add_argument("--max-batch", type=int, default=MAX_BATCH)
+    args = parser.parse_args(argv)
+
+    G = load_graph(args)
+    service = RouteService(
+        G,
+        workers=args.workers,
+        batch_window=args.batch_window_ms / 1000,
+        max_batch=args.max_batch,
+    )
+    print(
+        f"routing {len(G.nodes)} nodes ({', '.join(service.profiles)})"
+        f" on http://{args.host}:{args.port}/route"
+    )
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,15 @@
 # define search algorithms here
+from __future__ import annotations
 import time
+from typing import TYPE_CHECKING
 from GraphNode import Graph, Node
-from queue import PriorityQueue
-import itertools
+from heuristics import distances_to
+from priorityQueues import HeapQueue
+from queryContext import QueryContext, default_context
+from searchStats import Stats
+
+if TYPE_CHECKING:
+    from altIndex import ALTIndex
 
 
 def build_min_path(curr: Node):
@@ -58,49 +65,159 @@ def join_path(nodes: list[str], edges: list[str]):
         yield node
 
 
-def aSTAR_helper(start: Node, end: Node):
-    open = PriorityQueue()
+def get_context_path_info(context: QueryContext, end: int):
+    """same as get_path_info, but following the parents stored in a context"""
+    space = context.forward
+    node_path = [context.labels[end]]
+    edge_path = []
+    weights = []
+    obstacles = []
+    landmarks = []
+    curr = end
+    while space.parent_of(curr) != -1:
+        edge = space.edges[curr]
+        curr = space.parent[curr]
+        node_path.append(context.labels[curr])
+        edge_path.append(edge["name"])
+        weights.append(edge["weight"])
+        obstacles.extend(edge["obstacles"])
+        landmarks.extend(edge["landmarks"])
 
-    # counter for prio queue consistency
-    # discovered this one while implementing CONTRACTION
-    # HIERARCHIES
-    counter = itertools.count()
-    start.g = 0  # g(n) is cost of path so far to reach n
-    start.f = start.h  # f(n) = g(n) + h(n)
-    open.put((start.f, next(counter), start))
+    return {
+        "nodes": node_path[::-1],
+        "edges": edge_path[::-1],
+        "path": get_joined_path(node_path, edge_path)[::-1],
+        "weights": weights[::-1],
+        "obstacles": obstacles[::-1],
+        "landmarks": landmarks[::-1],
+        "total_weight": sum(weights),
+        "time": 0,
+    }
 
-    while not open.empty():
-        _, _, curr = open.get()
-        if curr == end:
-            return curr
 
-        for edge in curr.get_out_edges():
-            g_temp = curr.g + edge["weight"]
+def aSTAR_helper(
+    start: Node,
+    end: Node,
+    heuristic: str,
+    context: QueryContext,
+    alt: ALTIndex | None = None,
+    h_scale: float = 1.0,
+    h_values: list[float] | None = None,
+    queue=None,
+):
+    """
+    search state lives in context rather than on the nodes: g(n) and the
+    parent pointers in context.forward, h(n) in context.estimates (computed
+    the first time a node is touched, unless h_values already holds h for
+    every node id). the open set is a priorityQueues backend (HeapQueue by
+    default) keyed by f(n). returns the id of end, or None.
+    """
+    index = context.index
+    if h_values is not None:
+
+        def estimate(node: Node) -> float:
+            return h_values[index[node.label]]
+
+    elif heuristic == "alt":
+        if alt is None:
+            raise ValueError("the alt heuristic needs an ALTIndex of the graph")
+        t = alt.node_id(end.label)
+
+        def estimate(node: Node) -> float:
+            return alt.bound(alt.node_id(node.label), t)
+
+    else:
+
+        def estimate(node: Node) -> float:
+            return node.calc_h(end, heuristic) * h_scale
+
+    space = context.forward
+    estimates = context.estimates
+    space.reset()
+    estimates.reset()
+
+    if queue is None:
+        queue = HeapQueue()
+    # node ids are queued instead of Node objects, which do not compare
+    nodes = {}
+    s = index[start.label]
+    h = estimate(start)
+    estimates.set(s, h)
+    space.set(s, 0)  # g(n) is cost of path so far to reach n
+    nodes[s] = start
+    queue.push(s, h)  # f(n) = g(n) + h(n)
+
+    while queue:
+        _, u = queue.pop()
+        curr = nodes[u]
+        g = space.dist[u]
+        if curr is end:
+            return u
+
+        for edge in curr.neighbours:
+            g_temp = g + edge["weight"]
             neighbour = edge["endpoint"]
-            if g_temp < neighbour.g:
-                neighbour.parent = curr
-                neighbour.preceding_edge = edge
-                neighbour.g = g_temp
-                neighbour.f = g_temp + neighbour.h
-                if neighbour.status == "closed":
-                    neighbour.status = "open"
-                    open.put((neighbour.f, next(counter), neighbour))
+            v = index[neighbour.label]
+            if g_temp < space.get(v):
+                space.set(v, g_temp, u, edge)
+                if estimates.reached(v):
+                    h = estimates.dist[v]
+                else:
+                    h = estimate(neighbour)
+                    estimates.set(v, h)
+                nodes[v] = neighbour
+                queue.push(v, g_temp + h)
 
     # goal was not reached
     return None
 
 
-def aSTAR(G: Graph, start: Node, end: Node, heuristic: str):
-    for node in G.nodes.values():
-        node.h = node.calc_h(end, heuristic)
+def aSTAR(
+    G: Graph,
+    start: Node,
+    end: Node,
+    heuristic: str,
+    context: QueryContext | None = None,
+    alt: ALTIndex | None = None,
+    h_scale: float = 1.0,
+    lazy: bool = True,
+    queue=None,
+    stats: Stats | None = None,
+):
+    """
+    A* from start to end. nodes of G are not modified, so concurrent callers
+    can share G by passing their own QueryContext (the calling thread's
+    default_context of G is reused otherwise).
+    heuristic is one of the Node.calc_h metrics, or "alt" for the landmark
+    bounds of alt (built once with ALTIndex.build(G)).
+
+    metric heuristics are multiplied by h_scale to bring them into edge
+    weight units (see heuristics.admissible_scale). by default h(n) is only
+    computed for nodes the search touches; lazy=False computes it for all
+    nodes in one vectorised call instead, which pays off for long searches.
+    queue optionally picks the priorityQueues backend of the open set (an
+    empty one), whose operation counts are added to stats.
+    """
+    if context is None:
+        context = default_context(G, lambda: QueryContext.for_graph(G))
 
     start_time = time.perf_counter_ns()
-    end_node = aSTAR_helper(start, end)
+    h_values = None
+    if not lazy and heuristic != "alt":
+        xs, ys = context.coordinates(G)
+        h_values = distances_to(xs, ys, (end.x, end.y), heuristic, h_scale)
+    if queue is None:
+        queue = HeapQueue()
+    end_id = aSTAR_helper(
+        start, end, heuristic, context, alt, h_scale, h_values, queue
+    )
     end_time = time.perf_counter_ns()
+    if stats is not None:
+        stats.add_queue(queue.stats)
 
-    if end_node is None:
+    if end_id is None:
         return None
 
-    path_info = get_path_info(end_node)
-    path_info["time"] = abs(start_time - end_time) / 10000
+    path_info = get_context_path_info(context, end_id)
+    path_info["time"] = (end_time - start_time) / 1_000_000  # ms
     return path_info
@@ -0,0 +1,125 @@
+# counters, phase timers and verbosity for searches and preprocessing
+from __future__ import annotations
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Callable
+import math
+import time
+
+if TYPE_CHECKING:
+    from priorityQueues import QueueStats
+
+
+def percentiles(values: list[float]) -> dict[str, float]:
+    """mean, max and nearest-rank p50/p90/p99 of values"""
+    if not values:
+        return {}
+    ordered = sorted(values)
+
+    def rank(p: float) -> float:
+        return ordered[min(len(ordered) - 1, math.ceil(p / 100 * len(ordered)) - 1)]
+
+    return {
+        "mean": sum(ordered) / len(ordered),
+        "p50": rank(50),
+        "p90": rank(90),
+        "p99": rank(99),
+        "max": ordered[-1],
+    }
+
+
+@dataclass
+class PhaseRecord:
+    """wall time of one phase and the counters it added"""
+
+    name: str
+    seconds: float
+    counters: dict[str, int]
+
+
+class Stats:
+    """
+    instrumentation shared by the searches and the contraction. functions
+    that take a `stats` argument add to its counters:
+        - settled, relaxed:     nodes settled / edges that improved a label
+        - pushes, pops:         priority queue operations
+        - witness_searches:     local searches while ordering or contracting
+        - simulations:          edge difference simulations
+        - lazy_reevaluations:   contract_graph re-simulations of the queue top
+        - shortcuts_added:      shortcuts inserted into the graph
+    and wrap their steps in named phases, timed with perf_counter.
+
+    hot loops count into locals and add them once per call, and only print
+    when verbose is set (the message is not even formatted otherwise).
+    on_phase is called with every finished PhaseRecord, e.g. to stream
+    timings to a log. profiler is anything with enable()/disable(), such as
+    a cProfile.Profile, and only runs inside phases.
+    work done in preprocessing worker processes is not counted.
+    """
+
+    def __init__(
+        self,
+        verbose: bool = False,
+        on_phase: Callable[[PhaseRecord], None] | None = None,
+        profiler=None,
+    ) -> None:
+        self.verbose = verbose
+        self.on_phase = on_phase
+        self.profiler = profiler
+        self.counters: Counter[str] = Counter()
+        self.phases: list[PhaseRecord] = []
+        self._depth = 0
+
+    def add(self, name: str, n: int = 1) -> None:
+        self.counters[name] += n
+
+    def add_queue(self, queue_stats: QueueStats, roots: int = 1) -> None:
+        """
+        counters of one search that ran on a priorityQueues backend: every
+        queued key but the roots' is a relaxed edge, every pop of a current
+        entry settles a node
+        """
+        pushes = queue_stats.inserts + queue_stats.updates
+        self.counters["settled"] += queue_stats.pops
+        self.counters["relaxed"] += pushes - roots
+        self.counters["pushes"] += pushes
+        self.counters["pops"] += queue_stats.pops + queue_stats.stale_pops
+
+    def log(self, *args) -> None:
+        """print, but only when verbose"""
+        if self.verbose:
+            print(*args)
+
+    @contextmanager
+    def phase(self, name: str):
+        """time the enclosed block and record the counters it changed"""
+        before = self.counters.copy()
+        profiling = self.profiler is not None and self._depth == 0
+        self._depth += 1
+        if profiling:
+            self.profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            seconds = time.perf_counter() - start
+            if profiling:
+                self.profiler.disable()
+            self._depth -= 1
+            delta = self.counters - before
+            record = PhaseRecord(name, seconds, dict(delta))
+            self.phases.append(record)
+            if self.on_phase is not None:
+                self.on_phase(record)
+
+    def seconds(self, name: str) -> float:
+        """total time spent in phases called name"""
+        return sum(p.seconds for p in self.phases if p.name == name)
+
+    def as_dict(self) -> dict:
+        """counters and phase records as plain, JSON serialisable data"""
+        return {
+            "counters": dict(self.counters),
+            "phases": [asdict(p) for p in self.phases],
+        }
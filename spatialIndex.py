@@ -0,0 +1,342 @@
+# uniform grid over node positions: nearest nodes and snapping to edges
+from __future__ import annotations
+from array import array
+from dataclasses import dataclass
+from GraphNode import Graph, NodeEdge
+from compactGraph import csr_permutation
+from heuristics import EARTH_RADIUS_KM
+import math
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, queries fall back to plain loops
+    np = None
+
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+# average number of nodes per grid cell
+NODES_PER_CELL = 2
+
+
+@dataclass
+class Snap:
+    """closest point to a query on the edge source -> target"""
+
+    source: str
+    target: str
+    edge: NodeEdge
+    fraction: float  # position of the point along the edge, 0 at source
+    x: float
+    y: float
+    distance: float
+
+
+class _Grid:
+    """
+    items bucketed into square cells of side cell_size, as a CSR over cells:
+    the items touching cell c are items[offsets[c]:offsets[c + 1]]
+    """
+
+    def __init__(self, min_x, min_y, cell_size, nx, ny, boxes) -> None:
+        self.min_x, self.min_y = min_x, min_y
+        self.cell_size = cell_size
+        self.nx, self.ny = nx, ny
+        cells = array("q")
+        entries = array("q")
+        for item, (x0, y0, x1, y1) in enumerate(boxes):
+            cx0, cy0 = self.cell(x0, y0)
+            cx1, cy1 = self.cell(x1, y1)
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    cells.append(cx * ny + cy)
+                    entries.append(item)
+        self.offsets, order = csr_permutation(nx * ny, cells)
+        self.items = array("q", map(entries.__getitem__, order))
+
+    def cell(self, x: float, y: float) -> tuple[int, int]:
+        return (
+            math.floor((x - self.min_x) / self.cell_size),
+            math.floor((y - self.min_y) / self.cell_size),
+        )
+
+    def ring(self, cx: int, cy: int, r: int) -> list[int]:
+        """items of the cells at chebyshev distance r from (cx, cy)"""
+        found = []
+        x0, x1 = max(cx - r, 0), min(cx + r, self.nx - 1)
+        y0, y1 = max(cy - r, 0), min(cy + r, self.ny - 1)
+        for i in range(x0, x1 + 1):
+            if abs(i - cx) == r:
+                ys = range(y0, y1 + 1)
+            else:
+                ys = [j for j in (cy - r, cy + r) if y0 <= j <= y1]
+            for j in ys:
+                c = i * self.ny + j
+                found.extend(self.items[self.offsets[c] : self.offsets[c + 1]])
+        return found
+
+    def ring_range(self, cx: int, cy: int) -> range:
+        """rings around (cx, cy) that overlap the grid, nearest first"""
+        dx = max(-cx, cx - (self.nx - 1), 0)
+        dy = max(-cy, cy - (self.ny - 1), 0)
+        far_x = max(abs(cx), abs(cx - (self.nx - 1)))
+        far_y = max(abs(cy), abs(cy - (self.ny - 1)))
+        return range(max(dx, dy), max(far_x, far_y) + 1)
+
+
+def _point_distances(qx, qy, xs, ys):
+    """|queries| x |points| matrix of planar distances"""
+    if np is not None:
+        return np.hypot(
+            np.subtract.outer(np.asarray(qx), np.asarray(xs)),
+            np.subtract.outer(np.asarray(qy), np.asarray(ys)),
+        )
+    return [
+        [math.hypot(x - px, y - py) for px, py in zip(xs, ys)] for x, y in zip(qx, qy)
+    ]
+
+
+def _segment_fractions(qx, qy, ax, ay, bx, by):
+    """
+    |queries| x |segments| matrices of the position t (clamped to [0, 1]) of
+    the closest point on each segment a -> b, and of its distance
+    """
+    if np is not None:
+        qx, qy = np.asarray(qx)[:, None], np.asarray(qy)[:, None]
+        ax, ay, bx, by = (np.asarray(v)[None, :] for v in (ax, ay, bx, by))
+        dx, dy = bx - ax, by - ay
+        length2 = dx * dx + dy * dy
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = ((qx - ax) * dx + (qy - ay) * dy) / length2
+        t = np.clip(np.nan_to_num(t, nan=0.0), 0.0, 1.0)
+        return t, np.hypot(qx - (ax + t * dx), qy - (ay + t * dy))
+
+    fractions, distances = [], []
+    for x, y in zip(qx, qy):
+        row_t, row_d = [], []
+        for x0, y0, x1, y1 in zip(ax, ay, bx, by):
+            dx, dy = x1 - x0, y1 - y0
+            length2 = dx * dx + dy * dy
+            t = ((x - x0) * dx + (y - y0) * dy) / length2 if length2 else 0.0
+            t = min(1.0, max(0.0, t))
+            row_t.append(t)
+            row_d.append(math.hypot(x - (x0 + t * dx), y - (y0 + t * dy)))
+        fractions.append(row_t)
+        distances.append(row_d)
+    return fractions, distances
+
+
+def _kth_smallest(row, k: int) -> float:
+    if len(row) < k:
+        return math.inf
+    if np is not None:
+        return float(np.partition(row, k - 1)[k - 1])
+    return sorted(row)[k - 1]
+
+
+class SpatialIndex:
+    """
+    nodes and edges of G in a uniform grid, for k-nearest, radius and
+    snap-to-edge queries by coordinates.
+
+    with metric="haversine" (x, y) are latitude/longitude degrees, as in the
+    hand-made and loaded graphs, and are projected once to kilometres
+    (equirectangular around the mean latitude, well within 0.1% of the
+    haversine distance across a city); distances are returned in km. with
+    metric="euclidean" coordinates are used as they are.
+
+    the *_many calls take a batch of points, group them by grid cell and
+    measure each group against the candidates of the rings around its cell
+    in one numpy call (plain loops without numpy), searching outwards until
+    no unseen item can be closer. each connected node pair is one segment
+    for snapping, represented by the first edge between them.
+    """
+
+    def __init__(
+        self, G: Graph, metric: str = "haversine", cell_size: float | None = None
+    ) -> None:
+        if metric not in ("haversine", "euclidean"):
+            raise ValueError(f"unknown metric {metric!r}")
+        if not G.nodes:
+            raise ValueError("cannot index an empty graph")
+        self.metric = metric
+        self.labels = list(G.nodes)
+        index = {label: i for i, label in enumerate(self.labels)}
+        positions = [G.nodes[label].get_pos() for label in self.labels]
+        if metric == "haversine":
+            mean_lat = sum(x for x, _ in positions) / len(positions)
+            self.scale_x = KM_PER_DEGREE
+            self.scale_y = KM_PER_DEGREE * math.cos(math.radians(mean_lat))
+        else:
+            self.scale_x = self.scale_y = 1.0
+        self.xs = array("d", (x * self.scale_x for x, _ in positions))
+        self.ys = array("d", (y * self.scale_y for _, y in positions))
+
+        pairs = set()
+        self.segments: list[tuple[int, int, NodeEdge]] = []
+        for u, label in enumerate(self.labels):
+            for edge in G.nodes[label].neighbours:
+                v = index[edge["endpoint"].label]
+                if u != v and (min(u, v), max(u, v)) not in pairs:
+                    pairs.add((min(u, v), max(u, v)))
+                    self.segments.append((u, v, edge))
+        self.seg_ax = array("d", (self.xs[u] for u, _, _ in self.segments))
+        self.seg_ay = array("d", (self.ys[u] for u, _, _ in self.segments))
+        self.seg_bx = array("d", (self.xs[v] for _, v, _ in self.segments))
+        self.seg_by = array("d", (self.ys[v] for _, v, _ in self.segments))
+
+        min_x, max_x = min(self.xs), max(self.xs)
+        min_y, max_y = min(self.ys), max(self.ys)
+        if cell_size is None:
+            area = max((max_x - min_x) * (max_y - min_y), 0.0)
+            cell_size = math.sqrt(area * NODES_PER_CELL / len(self.labels))
+            # collinear or coincident nodes: fall back to the longer extent
+            cell_size = cell_size or max(max_x - min_x, max_y - min_y) or 1.0
+        nx = math.floor((max_x - min_x) / cell_size) + 1
+        ny = math.floor((max_y - min_y) / cell_size) + 1
+        grid_args = (min_x, min_y, cell_size, nx, ny)
+        self.node_grid = _Grid(
+            *grid_args, ((x, y, x, y) for x, y in zip(self.xs, self.ys))
+        )
+        self.edge_grid = _Grid(
+            *grid_args,
+            (
+                (min(ax, bx), min(ay, by), max(ax, bx), max(ay, by))
+                for ax, ay, bx, by in zip(
+                    self.seg_ax, self.seg_ay, self.seg_bx, self.seg_by
+                )
+            ),
+        )
+
+    @classmethod
+    def from_graph(
+        cls, G: Graph, metric: str = "haversine", cell_size: float | None = None
+    ) -> SpatialIndex:
+        return cls(G, metric, cell_size)
+
+    def _project(self, points) -> tuple[list[float], list[float]]:
+        qx = [float(x) * self.scale_x for x, _ in points]
+        qy = [float(y) * self.scale_y for _, y in points]
+        return qx, qy
+
+    def _groups(self, grid: _Grid, qx, qy) -> dict[tuple[int, int], list[int]]:
+        groups: dict[tuple[int, int], list[int]] = {}
+        for i, (x, y) in enumerate(zip(qx, qy)):
+            groups.setdefault(grid.cell(x, y), []).append(i)
+        return groups
+
+    def _search(self, grid: _Grid, points, k: int | None, radius, measure):
+        """
+        per point, the candidate item ids and their distances (one row per
+        point of the group) after enough rings to hold its k nearest items,
+        or every item within radius when k is None
+        """
+        qx, qy = self._project(points)
+        results = [None] * len(points)
+        for (cx, cy), members in self._groups(grid, qx, qy).items():
+            gx = [qx[i] for i in members]
+            gy = [qy[i] for i in members]
+            seen: set[int] = set()
+            candidates: list[int] = []
+            rows = [[] for _ in members]
+            for r in grid.ring_range(cx, cy):
+                # a query lies inside its cell, so items not in rings <= r
+                # are further than r cells away from it
+                if k is None and (r - 1) * grid.cell_size >= radius:
+                    break
+                new = [c for c in grid.ring(cx, cy, r) if c not in seen]
+                if new:
+                    seen.update(new)
+                    candidates.extend(new)
+                    block = measure(gx, gy, new)
+                    for row, distances in zip(rows, block):
+                        row.extend(distances)
+                if k is not None and all(
+                    _kth_smallest(row, k) <= r * grid.cell_size for row in rows
+                ):
+                    break
+            for i, row in zip(members, rows):
+                results[i] = (candidates, row)
+        return results
+
+    def _measure_nodes(self, gx, gy, ids):
+        xs = [self.xs[i] for i in ids]
+        ys = [self.ys[i] for i in ids]
+        return _point_distances(gx, gy, xs, ys)
+
+    def _measure_segments(self, gx, gy, ids):
+        _, distances = _segment_fractions(
+            gx,
+            gy,
+            [self.seg_ax[i] for i in ids],
+            [self.seg_ay[i] for i in ids],
+            [self.seg_bx[i] for i in ids],
+            [self.seg_by[i] for i in ids],
+        )
+        return distances
+
+    def nearest_many(self, points, k: int = 1) -> list[list[tuple[str, float]]]:
+        """k nearest nodes (label, distance) of every (x, y) point, nearest first"""
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        found = []
+        for candidates, row in self._search(
+            self.node_grid, points, k, None, self._measure_nodes
+        ):
+            best = sorted(zip(row, candidates))[:k]
+            found.append([(self.labels[u], float(d)) for d, u in best])
+        return found
+
+    def within_many(self, points, radius: float) -> list[list[tuple[str, float]]]:
+        """nodes (label, distance) within radius of every point, nearest first"""
+        found = []
+        for candidates, row in self._search(
+            self.node_grid, points, None, radius, self._measure_nodes
+        ):
+            hits = sorted((d, u) for d, u in zip(row, candidates) if d <= radius)
+            found.append([(self.labels[u], float(d)) for d, u in hits])
+        return found
+
+    def snap_many(self, points) -> list[Snap | None]:
+        """closest point on any edge of G for every point (None without edges)"""
+        if not self.segments:
+            return [None] * len(points)
+        snaps = []
+        for (x, y), (candidates, row) in zip(
+            points,
+            self._search(self.edge_grid, points, 1, None, self._measure_segments),
+        ):
+            d, s = min(zip(row, candidates))
+            u, v, edge = self.segments[s]
+            (qx,), (qy,) = self._project([(x, y)])
+            t = _segment_fractions(
+                [qx],
+                [qy],
+                [self.seg_ax[s]],
+                [self.seg_ay[s]],
+                [self.seg_bx[s]],
+                [self.seg_by[s]],
+            )[0][0][0]
+            t = float(t)
+            x0, y0 = self.xs[u] / self.scale_x, self.ys[u] / self.scale_y
+            x1, y1 = self.xs[v] / self.scale_x, self.ys[v] / self.scale_y
+            snaps.append(
+                Snap(
+                    self.labels[u],
+                    self.labels[v],
+                    edge,
+                    t,
+                    x0 + t * (x1 - x0),
+                    y0 + t * (y1 - y0),
+                    float(d),
+                )
+            )
+        return snaps
+
+    def nearest(self, x: float, y: float, k: int = 1) -> list[tuple[str, float]]:
+        return self.nearest_many([(x, y)], k)[0]
+
+    def within(self, x: float, y: float, radius: float) -> list[tuple[str, float]]:
+        return self.within_many([(x, y)], radius)[0]
+
+    def snap(self, x: float, y: float) -> Snap | None:
+        return self.snap_many([(x, y)])[0]
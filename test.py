@@ -1,11 +1,50 @@
 from GraphNode import Graph, Node
 
 from search import aSTAR
+from compactGraph import CompactGraph
+from compactGraph import aSTAR as compact_aSTAR
+import asyncio
+import contextlib
+import csv
+import gc
+import io
+import math
+import os
+import random
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # from contractionHierarchy import get_contraction_order
 # from contractionHierarchy import build_g_prime
 # from contractionHierarchy import query_graph
 from contractionHierarchy import run_CH
+from contractionHierarchy import build_g_prime, dijkstra
+from contractionHierarchy import ContractionGraph, Shortcut, contract_graph
+from contractionHierarchy import get_contraction_order, validate_shortcuts
+from contractionHierarchy import WitnessLimits
+from altIndex import ALTIndex
+from benchmark import GENERATORS, run_case
+from batchQuery import BatchRouter
+from chAlternatives import SHARING, STRETCH, alternative_routes
+from chQuery import CHIndex, ch_query, ch_shortest_path
+from chQuery import ShortcutUnpacker, get_ch_path_edges
+from chStorage import attach_ch_index, load_ch_index
+from chStorage import share_ch_index, write_ch_index
+from chUpdate import update_edge_weights
+from customizableCH import CCHTopology, avoid_obstacles, customize
+from customizableCH import shortest_distance
+from graphLoaders import load_csv, load_osm
+from heuristics import admissible_scale, distance, distances_to
+from heuristics import haversine_distance
+from main import create_map_graph
+from manyToMany import many_to_many
+from phast import phast, phast_batch, sweep_order
+from priorityQueues import QUEUES, HeapQueue, IndexedHeap, RadixHeap
+from queryContext import QueryContext, default_context
+from routeService import PROFILES, RouteService
+from searchStats import Stats
+from spatialIndex import SpatialIndex
 
 nodes = {}
 
@@ -115,3 +154,551 @@ for edge in edges_arr:
 #     print(" --> ".join(path_info["path"]))
 
 run_CH(G, G.nodes["B"], G.nodes["X"])
+
+# validate_shortcuts: a shortcut lighter than the shortest distance, and one
+# heavier than it but lighter than every path through its middle, are invalid
+H = ContractionGraph.from_graph(G)
+shortcuts, _ = contract_graph(H, get_contraction_order(H))
+assert validate_shortcuts(G, shortcuts).ok
+src, dest, weight, middle = next(sc for group in shortcuts for sc in group)
+context = QueryContext.for_graph(G)
+dijkstra(G, G.nodes[src], context=context)
+far = max(G.nodes, key=lambda label: context.forward.get(context.index[label]))
+broken = [
+    [Shortcut(src, dest, weight - 1, middle)],
+    [Shortcut(src, dest, weight + 1, far)],
+]
+report = validate_shortcuts(G, broken)
+assert [sc for sc, _ in report.invalid] == [sc for group in broken for sc in group]
+assert validate_shortcuts(G, [[Shortcut(src, dest, weight + 1, middle)]]).ok
+
+# dijkstra with a threshold settles exactly the nodes within it, at their
+# unbounded distances
+full = {label: context.forward.get(context.index[label]) for label in G.nodes}
+limit = sorted(full.values())[len(full) // 2]
+dijkstra(G, G.nodes[src], threshold=limit, context=context)
+for label, d in full.items():
+    if d <= limit:
+        assert context.forward.get(context.index[label]) == d
+
+# the CompactGraph adapters: A* over the CSR arrays finds paths as long as
+# aSTAR over the Node dicts, and contraction reads the same graph from both
+cg = CompactGraph.from_graph(G)
+assert ContractionGraph.from_compact(cg) == ContractionGraph.from_graph(G)
+for s in G.nodes.values():
+    for t in G.nodes.values():
+        a = aSTAR(G, s, t, "manhattan", h_scale=0)
+        b = compact_aSTAR(cg, s, t, "manhattan", h_scale=0)
+        assert a["total_weight"] == b["total_weight"]
+        assert b["nodes"][0] == s.label and b["nodes"][-1] == t.label
+
+# update_edge_weights against dijkstra on a random one-way graph: every round
+# re-weighs a few edges of both R and G', then all distances must agree
+rnd = random.Random(7)
+rand_nodes = {str(i): Node(str(i), rnd.random(), rnd.random()) for i in range(60)}
+R = Graph(rand_nodes)
+for _ in range(150):
+    src, dest = rnd.sample(sorted(rand_nodes), 2)
+    weight = rnd.randint(1, 50)
+    R.add_dir_edge(rand_nodes[src], rand_nodes[dest], f"{src}-{dest}", weight)
+
+R_prime, order = build_g_prime(R)
+R_prime = R_prime.to_graph()
+context = QueryContext.for_graph(R)
+edges = [(n.label, e["endpoint"].label) for n in R.nodes.values() for e in n.neighbours]
+for update_round in range(6):
+    changes = [(src, dest, rnd.randint(1, 200)) for src, dest in rnd.sample(edges, 5)]
+    for src, dest, weight in changes:
+        for edge in R.nodes[src].outgoing[dest]:
+            edge["weight"] = weight
+    report = update_edge_weights(R_prime, order, changes)
+    index = CHIndex.from_overlay(R_prime, order)
+    wrong = 0
+    for s in R.nodes.values():
+        dijkstra(R, s, context=context)
+        for t in R.nodes:
+            d, _ = ch_query(index, index.node_id(s.label), index.node_id(t))
+            wrong += d != context.forward.get(context.index[t])
+    print(f"update round {update_round}: {report}, wrong distances: {wrong}")
+    assert wrong == 0
+    # every node is contracted again at most once per update
+    assert report.recontracted <= len(order)
+
+# an edge getting lighter only reaches the nodes ranked at or above its
+# lower endpoint
+rank = {label: r for r, label in enumerate(order)}
+src, dest = max(edges, key=lambda edge: min(rank[edge[0]], rank[edge[1]]))
+report = update_edge_weights(R_prime, order, [(src, dest, 0)])
+print(f"update of {src} -> {dest}: {report}")
+assert report.recontracted <= len(order) - min(rank[src], rank[dest])
+
+# every query engine against dijkstra on the hand-made map: dist[s][t] is the
+# reference distance of each pair
+M = create_map_graph()
+M_prime, M_order = build_g_prime(M)
+M_index = CHIndex.from_overlay(M_prime, M_order)
+context = QueryContext.for_graph(M)
+dist = {}
+for s in M.nodes.values():
+    dijkstra(M, s, context=context)
+    dist[s.label] = {t: context.forward.get(context.index[t]) for t in M.nodes}
+pairs = [(s, t) for s in M.nodes for t in M.nodes]
+
+# CH queries, with and without stall-on-demand, and their unpacked paths
+for s, t in pairs:
+    for stall in (True, False):
+        d, _ = ch_query(M_index, M_index.node_id(s), M_index.node_id(t), stall)
+        assert d == dist[s][t]
+    path_info = ch_shortest_path(M_index, s, t)
+    assert path_info["total_weight"] == dist[s][t]
+    assert path_info["nodes"][0] == s and path_info["nodes"][-1] == t
+
+# the on-disk index answers like the one it was written from, and so does
+# its copy in shared memory
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "map.ch")
+    write_ch_index(M_index, path)
+    loaded = load_ch_index(path)
+    shm = share_ch_index(M_index)
+    attached, view = attach_ch_index(shm.name)
+    for index in (loaded, attached):
+        assert list(index.rank) == list(M_index.rank)
+        for s, t in pairs:
+            d, _ = ch_query(index, index.node_id(s), index.node_id(t))
+            assert d == dist[s][t]
+            assert ch_shortest_path(index, s, t)["nodes"][-1] == t
+    # the unpacker cached on attached refers back to it
+    del index, attached
+    gc.collect()
+    view.close()
+    shm.close()
+    shm.unlink()
+
+# many-to-many tables, and their unpacked paths, match dijkstra per pair
+labels = list(M.nodes)
+table = many_to_many(M_index, labels[::2], labels, parents=True)
+for i, s in enumerate(labels[::2]):
+    for j, t in enumerate(labels):
+        assert table.distance(i, j) == dist[s][t]
+        assert table.path(i, j)["total_weight"] == dist[s][t]
+
+# PHAST sweeps, one source at a time and batched, reach every node at its
+# dijkstra distance
+order = sweep_order(M_index)
+for s, column in zip(labels, phast_batch(M_index, labels, order)):
+    assert list(phast(M_index, s, order)) == list(column)
+    for t in labels:
+        assert column[M_index.node_id(t)] == dist[s][t]
+
+# CCH customizations of one topology: the shortest profile matches dijkstra
+# on the map, a profile matches dijkstra on the map re-weighed by its cost
+topology = CCHTopology.from_graph(M)
+profiles = [
+    shortest_distance,
+    avoid_obstacles("stairs", "no footpath"),
+    avoid_obstacles("no footpath", penalty=3),
+]
+for cost in profiles:
+    index = customize(topology, cost)
+    W = create_map_graph()
+    for node in W.nodes.values():
+        for edge in node.neighbours:
+            edge["weight"] = cost(edge)
+    for s in W.nodes.values():
+        dijkstra(W, s, context=context)
+        for t in labels:
+            d, _ = ch_query(index, index.node_id(s.label), index.node_id(t))
+            assert d == context.forward.get(context.index[t])
+
+# ALT: landmark bounds never exceed the distance, so A* with them finds
+# paths as short as dijkstra's
+for strategy in ("farthest", "avoid"):
+    alt = ALTIndex.build(M, k=4, strategy=strategy)
+    for s, t in pairs:
+        assert alt.bound(alt.node_id(s), alt.node_id(t)) <= dist[s][t]
+        path_info = aSTAR(M, M.nodes[s], M.nodes[t], "alt", alt=alt)
+        assert path_info["total_weight"] == dist[s][t]
+
+# spatial index queries against the haversine distance to every node, on the
+# default grid and on one fine enough to search several rings
+rnd = random.Random(11)
+xs = [node.get_pos()[0] for node in M.nodes.values()]
+ys = [node.get_pos()[1] for node in M.nodes.values()]
+points = [
+    (rnd.uniform(min(xs), max(xs)), rnd.uniform(min(ys), max(ys))) for _ in range(50)
+]
+for spatial in (SpatialIndex.from_graph(M), SpatialIndex.from_graph(M, cell_size=0.05)):
+    for x, y in points:
+        true = {
+            label: haversine_distance((x, y), node.get_pos())
+            for label, node in M.nodes.items()
+        }
+        closest = sorted(true.values())
+        found = spatial.nearest(x, y, k=3)
+        for (_, d), expected in zip(found, closest):
+            assert math.isclose(d, expected, rel_tol=1e-3)
+        radius = closest[4]
+        hits = {label for label, _ in spatial.within(x, y, radius)}
+        assert {label for label, d in true.items() if d < radius * 0.999} <= hits
+        assert all(true[label] <= radius * 1.001 for label in hits)
+        snap = spatial.snap(x, y)
+        assert 0 <= snap.fraction <= 1
+        assert math.isclose(
+            snap.distance, haversine_distance((x, y), (snap.x, snap.y)), rel_tol=1e-3
+        )
+        assert snap.distance <= closest[0] * 1.001
+
+# the batch router, from a shared-memory index and from an index file, keeps
+# input order and answers an unknown label like an unreachable target
+with tempfile.TemporaryDirectory() as tmp:
+    path = os.path.join(tmp, "map.ch")
+    write_ch_index(M_index, path)
+    indices = {"shared": M_index, "file": path}
+    with BatchRouter(indices, workers=2, chunk_size=7, graph=M) as router:
+        asked = pairs + [("A", "nowhere")]
+        expected = [dist[s][t] for s, t in pairs] + [math.inf]
+        for name in indices:
+            assert list(router.distances(asked, name)) == expected
+            found = list(router.paths(asked, name))
+            assert [p["total_weight"] for p in found[:-1]] == expected[:-1]
+            assert found[-1] is None
+        found = list(router.astar_paths(pairs))
+        assert [p["total_weight"] for p in found] == expected[:-1]
+
+# the routing service: every profile and engine against dijkstra on the map
+# re-weighed by the profile, with repeated requests coalesced
+expected = {"shortest": dist}
+W = create_map_graph()
+for node in W.nodes.values():
+    for edge in node.neighbours:
+        edge["weight"] = PROFILES["wheelchair"](edge)
+expected["wheelchair"] = {}
+for s in W.nodes.values():
+    dijkstra(W, s, context=context)
+    expected["wheelchair"][s.label] = {
+        t: context.forward.get(context.index[t]) for t in labels
+    }
+requests = [(s, t, "shortest", "astar") for s, t in pairs]
+requests += [(s, t, profile, "ch") for s, t in pairs for profile in expected]
+
+
+async def ask_service(service):
+    found = await asyncio.gather(*(service.route(*r) for r in requests + requests))
+    for (s, t, profile, _), path_info in zip(requests + requests, found):
+        d = expected[profile][s][t]
+        if d == math.inf:
+            assert path_info is None
+        else:
+            assert path_info["total_weight"] == d
+    for bad, error in (
+        (("A", "nowhere"), KeyError),
+        (("A", "B", "sideways"), ValueError),
+        (("A", "B", "wheelchair", "astar"), ValueError),
+    ):
+        try:
+            await service.route(*bad)
+        except error:
+            continue
+        raise AssertionError(f"route{bad} did not raise {error.__name__}")
+
+
+service = RouteService(M, workers=2)
+try:
+    asyncio.run(ask_service(service))
+    assert service.stats.counters["coalesced"] > 0
+    assert service.stats.counters["searches"] <= len(requests)
+finally:
+    service.close()
+
+# alternative routes: the first is a shortest path, the others are simple
+# s -> t paths within the stretch that share little with the earlier ones
+found = 0
+for s, t in pairs:
+    routes = alternative_routes(M_index, s, t, k=2)
+    assert routes[0]["total_weight"] == dist[s][t]
+    assert len(routes) <= 3
+    seen = set()
+    for route in routes:
+        nodes = route["nodes"]
+        assert nodes[0] == s and nodes[-1] == t and route["via"] in nodes
+        assert route["total_weight"] <= (1 + STRETCH) * dist[s][t]
+        if dist[s][t]:
+            assert math.isclose(route["stretch"], route["total_weight"] / dist[s][t])
+        legs = list(zip(nodes, nodes[1:], route["weights"]))
+        if seen:
+            assert len(set(nodes)) == len(nodes)
+            shared = sum(w for u, v, w in legs if (u, v) in seen)
+            assert shared <= SHARING * dist[s][t]
+        seen.update((u, v) for u, v, _ in legs)
+    found += len(routes) - 1
+print(f"alternative routes: {found} over {len(pairs)} pairs")
+assert found > 0
+
+# the incoming and outgoing edge indexes hold exactly the edges of the
+# neighbour lists, also after removing a node and an edge
+def edge_indexes_match(G):
+    scan = {}
+    for node in G.nodes.values():
+        for edge in node.neighbours:
+            key = (node.label, edge["endpoint"].label)
+            scan.setdefault(key, []).append(id(edge))
+    out_index = {
+        (node.label, dest): [id(e) for e in edges]
+        for node in G.nodes.values()
+        for dest, edges in node.outgoing.items()
+        if edges
+    }
+    in_index = {
+        (src, node.label): [id(e) for e in edges]
+        for node in G.nodes.values()
+        for src, edges in node.incoming.items()
+        if edges
+    }
+    return out_index == scan and in_index == scan
+
+
+W = create_map_graph()
+assert edge_indexes_match(W)
+W.remove_node(W.nodes["N"])
+W.remove_edge(W.nodes["A"], W.nodes["B"])
+assert edge_indexes_match(W)
+assert all("N" not in node.incoming for node in W.nodes.values())
+assert not W.nodes["A"].get_edges_to(W.nodes["B"])
+assert "A" not in W.nodes["B"].incoming or not W.nodes["B"].incoming["A"]
+
+# concurrent searches on one graph and one index: threads without a context
+# each get their own default one, and every answer matches dijkstra
+def search_pair(pair):
+    s, t = pair
+    a = aSTAR(M, M.nodes[s], M.nodes[t], "manhattan", h_scale=0)["total_weight"]
+    d, _ = ch_query(M_index, M_index.node_id(s), M_index.node_id(t))
+    own = QueryContext.for_graph(M)
+    dijkstra(M, M.nodes[s], context=own)
+    shared = default_context(M, lambda: QueryContext.for_graph(M))
+    thread_contexts.add((threading.get_ident(), id(shared)))
+    return a, d, own.forward.get(own.index[t])
+
+
+thread_contexts = set()
+with ThreadPoolExecutor(4) as executor:
+    for (s, t), found in zip(pairs, executor.map(search_pair, pairs)):
+        assert found == (dist[s][t],) * 3
+# one default context per thread, none shared between threads
+assert len({thread for thread, _ in thread_contexts}) == len(thread_contexts)
+assert len({context for _, context in thread_contexts}) == len(thread_contexts)
+
+# node ordering on a process pool gives the serial queue, tiebreaks included,
+# and the hierarchy built with it answers like dijkstra
+def answers_like_dijkstra(G_prime, order):
+    index = CHIndex.from_overlay(G_prime, order)
+    return all(
+        ch_query(index, index.node_id(s), index.node_id(t))[0] == dist[s][t]
+        for s, t in pairs
+    )
+
+
+H = ContractionGraph.from_graph(M)
+limits = WitnessLimits(max_hops=3, max_settled=20)
+for witness_limits in (None, limits):
+    serial = get_contraction_order(H, witness_limits)
+    assert get_contraction_order(H, witness_limits, workers=2).heap == serial.heap
+assert answers_like_dijkstra(*build_g_prime(M, workers=2))
+
+# batched contraction of independent node sets, with and without witness
+# limits, builds hierarchies that answer like dijkstra
+for witness_limits in (None, limits):
+    G_prime, order = build_g_prime(M, witness_limits, workers=2, batched=True)
+    assert answers_like_dijkstra(G_prime, order)
+
+# unpacking shortcuts, with any cache size, turns the overlay path of every
+# query into a chain of original edges from s to t of the same length
+unpackers = [ShortcutUnpacker(M_index, size) for size in (0, 2, 4096)]
+index_context = M_index.new_context()
+for s, t in pairs:
+    s_id, t_id = M_index.node_id(s), M_index.node_id(t)
+    d, meet = ch_query(M_index, s_id, t_id, context=index_context)
+    packed = get_ch_path_edges(M_index, index_context, meet)
+    edges = unpackers[0].unpack(packed)
+    assert all(unpacker.unpack(packed) == edges for unpacker in unpackers[1:])
+    assert all(M_index.shortcut_first[e] == -1 for e in edges)
+    chain = [s_id] + [M_index.graph.targets[e] for e in edges]
+    assert [M_index.sources[e] for e in edges] == chain[:-1]
+    assert chain[-1] == t_id
+    weights = M_index.graph.weights
+    assert sum(weights[e] for e in packed) == sum(weights[e] for e in edges) == d
+
+# heuristics: haversine is the great circle distance, distances_to agrees
+# with the scalar metrics, and A* scaled by admissible_scale stays exact
+# whether h is computed lazily or for all nodes at once
+assert abs(haversine_distance((-37.8136, 144.9631), (-33.8688, 151.2093)) - 713.4) < 1
+positions = [node.get_pos() for node in M.nodes.values()]
+xs, ys = zip(*positions)
+goal = M.nodes["AE"].get_pos()
+for h_type in ("euclidean", "manhattan", "haversine"):
+    for a, p in zip(distances_to(xs, ys, goal, h_type, 2.0), positions):
+        assert math.isclose(a, 2.0 * distance(p, goal, h_type), abs_tol=1e-12)
+    h_scale = admissible_scale(M, h_type)
+    for s, t in pairs:
+        for lazy in (True, False):
+            path_info = aSTAR(
+                M, M.nodes[s], M.nodes[t], h_type, h_scale=h_scale, lazy=lazy
+            )
+            assert path_info["total_weight"] == dist[s][t]
+
+# every priority queue backend pops keys in order through decrease-keys, and
+# dijkstra and A* on each reach every node at the same distance
+rnd = random.Random(3)
+for Queue in (HeapQueue, IndexedHeap, RadixHeap):
+    queue, keys, last = Queue(), {}, 0
+    for step in range(2000):
+        if keys and step % 3 == 0:
+            key, item = queue.pop()
+            assert key == keys.pop(item) == min([key, *keys.values()]) >= last
+            last = key
+        else:
+            item = rnd.randrange(100)
+            key = rnd.randint(last, min(keys.get(item, last + 500), last + 500))
+            queue.push(item, key)
+            keys[item] = key
+    assert len(queue) == len(keys)
+    for s in labels:
+        dijkstra(M, M.nodes[s], context=context, queue=Queue())
+        assert all(context.forward.get(context.index[t]) == dist[s][t] for t in labels)
+        for t in labels:
+            path_info = aSTAR(
+                M, M.nodes[s], M.nodes[t], "manhattan", h_scale=0, queue=Queue()
+            )
+            assert path_info["total_weight"] == dist[s][t]
+
+# loaders: the map written as csv files loads back to the same distances,
+# and a small OSM extract (nodes not in id order) becomes the expected edges
+with tempfile.TemporaryDirectory() as tmp:
+    nodes_path = os.path.join(tmp, "nodes.csv")
+    edges_path = os.path.join(tmp, "edges.tsv")
+    with open(nodes_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["id", "lat", "lon"])
+        writer.writerows([label, *node.get_pos()] for label, node in M.nodes.items())
+    with open(edges_path, "w", newline="") as f:
+        writer = csv.writer(f, delimiter="\t")
+        header = ["source", "target", "length", "name", "landmarks", "obstacles"]
+        writer.writerow(header)
+        for node in M.nodes.values():
+            for edge in node.neighbours:
+                writer.writerow(
+                    [
+                        node.label,
+                        edge["endpoint"].label,
+                        edge["weight"],
+                        edge["name"],
+                        ";".join(edge["landmarks"]),
+                        ";".join(edge["obstacles"]),
+                    ]
+                )
+    L = load_csv(nodes_path, edges_path, directed=True, chunk_size=5).to_graph()
+    for s in L.nodes.values():
+        dijkstra(L, s, context=context)
+        for t in L.nodes:
+            assert context.forward.get(context.index[t]) == dist[s.label][t]
+
+    def key(edge):
+        return edge["endpoint"].label, edge["weight"]
+
+    for label, node in M.nodes.items():
+        loaded = sorted(L.nodes[label].neighbours, key=key)
+        for a, b in zip(sorted(node.neighbours, key=key), loaded):
+            assert (a["name"], a["landmarks"], a["obstacles"]) == (
+                b["name"], list(b["landmarks"]), list(b["obstacles"])
+            )
+
+    osm_path = os.path.join(tmp, "map.osm")
+    with open(osm_path, "w") as f:
+        f.write(
+            """<?xml version="1.0"?>
+<osm version="0.6">
+  <node id="30" lat="-38.1400" lon="145.1500"/>
+  <node id="10" lat="-38.1410" lon="145.1500">
+    <tag k="amenity" v="cafe"/><tag k="name" v="Corner Cafe"/>
+  </node>
+  <node id="20" lat="-38.1410" lon="145.1510"/>
+  <node id="40" lat="-38.1420" lon="145.1510"/>
+  <way id="1">
+    <nd ref="30"/><nd ref="10"/><nd ref="20"/><nd ref="99"/>
+    <tag k="highway" v="residential"/><tag k="name" v="Long St"/>
+  </way>
+  <way id="2">
+    <nd ref="20"/><nd ref="40"/>
+    <tag k="highway" v="steps"/><tag k="oneway" v="yes"/>
+  </way>
+  <way id="3"><nd ref="30"/><nd ref="40"/><tag k="building" v="yes"/></way>
+</osm>
+"""
+        )
+    O = load_osm(osm_path).to_graph()
+    assert sorted(O.nodes) == ["10", "20", "30", "40"]
+    found = {
+        (node.label, edge["endpoint"].label): edge
+        for node in O.nodes.values()
+        for edge in node.neighbours
+    }
+    assert sorted(found) == [
+        ("10", "20"), ("10", "30"), ("20", "10"), ("20", "40"), ("30", "10")
+    ]
+    for (u, v), edge in found.items():
+        length = haversine_distance(O.nodes[u].get_pos(), O.nodes[v].get_pos())
+        assert edge["weight"] == round(length * 1000)
+    assert found[("20", "40")]["name"] == "steps"
+    assert list(found[("20", "40")]["obstacles"]) == ["stairs"]
+    assert list(found[("30", "10")]["landmarks"]) == ["Corner Cafe"]
+    assert found[("10", "20")]["name"] == "Long St"
+
+# the benchmark suite: A* and CH agree with dijkstra on both generated graph
+# kinds, and a case is the same graph and queries for the same seed
+for kind in GENERATORS:
+    case = run_case(kind, 200, queries=100, trace_memory=False, queues=True)
+    assert case["algorithms"]["astar"]["mismatches"] == 0
+    assert case["algorithms"]["ch"]["mismatches"] == 0
+    assert "heapq" in case["queues"] and set(case["queues"]) <= set(QUEUES)
+    again = run_case(kind, 200, queries=100, with_ch=False, trace_memory=False)
+    assert (again["nodes"], again["edges"], again["unreachable"]) == (
+        case["nodes"],
+        case["edges"],
+        case["unreachable"],
+    )
+
+# stats: a quiet build prints nothing and records its phases and shortcuts,
+# and a full dijkstra's settles every node of the map exactly once
+records = []
+stats = Stats(on_phase=records.append)
+with contextlib.redirect_stdout(io.StringIO()) as out:
+    G_prime, order = build_g_prime(M, stats=stats)
+assert out.getvalue() == ""
+assert [r.name for r in records] == ["order", "contract", "validate", "overlay"]
+assert stats.counters["shortcuts_added"] == G_prime.num_shortcuts() > 0
+assert answers_like_dijkstra(G_prime, order)
+stats = Stats()
+dijkstra(M, M.nodes["A"], context=context, stats=stats)
+assert stats.counters["settled"] == len(M.nodes)
+
+# build_g_prime leaves G as it was, and G' as a standalone graph has G's
+# edges plus the shortcuts and the same distances
+def edge_snapshot(G):
+    return [
+        (node.label, id(edge), edge["endpoint"].label, edge["weight"])
+        for node in G.nodes.values()
+        for edge in node.neighbours
+    ]
+
+
+W = create_map_graph()
+before = edge_snapshot(W)
+G_prime, order = build_g_prime(W)
+assert edge_snapshot(W) == before
+assert G_prime.base is W
+standalone = G_prime.to_graph()
+num_edges = sum(len(node.neighbours) for node in standalone.nodes.values())
+assert num_edges == len(before) + G_prime.num_shortcuts()
+for s in labels:
+    dijkstra(standalone, standalone.nodes[s], context=context)
+    for t in labels:
+        assert context.forward.get(context.index[t]) == dist[s][t]